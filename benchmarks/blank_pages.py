@@ -0,0 +1,88 @@
+"""
+Compara los detectores de paginas vacias de services/mergencompress.py.
+
+Genera un documento que alterna paginas vacias, con texto, con muchos
+vectores (donde get_drawings es caro) y escaneadas (una imagen grande), mide
+el tiempo por pagina de is_blank_page (estructural) y de is_blank_page_fast
+(render de baja resolucion) por tipo de pagina y cuenta en cuantas paginas
+no coinciden.
+
+    python -m benchmarks.blank_pages --pages 120 --drawings 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import fitz  # PyMuPDF
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.mergencompress import (BLANK_MAX_INK, BLANK_MIN_INK, ink_coverage, is_blank_page,  # noqa: E402
+                                    is_blank_page_fast)
+
+
+KINDS = ["vacia", "texto", "vectores", "escaneo"]
+
+
+def build_document(pages: int, drawings: int, seed: int = 1) -> fitz.Document:
+    rng = random.Random(seed)
+    # "Escaneo": papel con ruido y un bloque de texto oscuro, a ~150 DPI
+    noise = np.random.default_rng(seed).integers(225, 256, (1700, 1240), dtype=np.uint8)
+    noise[500:1100, 150:1100] //= 3
+    scan = fitz.Pixmap(fitz.csGRAY, 1240, 1700, noise.tobytes(), False)
+    doc = fitz.open()
+    for n in range(pages):
+        page = doc.new_page()
+        kind = n % len(KINDS)
+        if kind == 3:
+            page.insert_image(page.rect, pixmap=scan)
+        elif kind == 1:
+            page.insert_textbox(fitz.Rect(72, 200, 520, 600), "Lorem ipsum dolor sit amet. " * 30, fontsize=9)
+        elif kind == 2:
+            shape = page.new_shape()
+            for _ in range(drawings):
+                x, y = rng.uniform(50, 540), rng.uniform(200, 640)
+                shape.draw_line((x, y), (x + rng.uniform(-20, 20), y + rng.uniform(-20, 20)))
+            shape.finish(color=(0, 0, 0), width=0.3)
+            shape.commit()
+        # kind == 0: vacia, salvo un encabezado fuera de la banda central
+        page.insert_text((72, 50), f"Pagina {n + 1}", fontsize=9)
+    return doc
+
+
+def timed(detector, doc: fitz.Document) -> tuple:
+    # Milisegundos por pagina de cada tipo y el resultado de cada pagina
+    elapsed = [0.0] * len(KINDS)
+    result = []
+    for n, page in enumerate(doc):
+        start = time.perf_counter()
+        result.append(detector(page))
+        elapsed[n % len(KINDS)] += time.perf_counter() - start
+    per_kind = len(doc) / len(KINDS)
+    return [total / per_kind * 1000 for total in elapsed], result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=120)
+    parser.add_argument("--drawings", type=int, default=2000, help="trazos por pagina vectorial")
+    args = parser.parse_args()
+
+    doc = build_document(args.pages, args.drawings)
+    structural_ms, structural = timed(is_blank_page, doc)
+    fast_ms, fast = timed(is_blank_page_fast, doc)
+    coverages = [ink_coverage(page) for page in doc]
+    ambiguous = sum(1 for c in coverages if c is None or BLANK_MAX_INK <= c < BLANK_MIN_INK)
+    differ = sum(a != b for a, b in zip(structural, fast))
+    print(f"{args.pages} paginas, {sum(fast)} vacias (rapido), {sum(structural)} vacias (estructural)")
+    print(f"{'ms/pag':<14}" + "".join(f"{kind:>10}" for kind in KINDS) + f"{'total':>10}")
+    for name, ms in (("estructural", structural_ms), ("rapido", fast_ms)):
+        print(f"{name:<14}" + "".join(f"{value:>10.2f}" for value in ms) + f"{sum(ms) / len(ms):>10.2f}")
+    print(f"{differ} paginas difieren, {ambiguous} ambiguas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Compara los backends de merge de services/merge_pdf.py.
+
+Genera documentos sinteticos (texto + una imagen por pagina), los une con cada
+backend en un proceso nuevo y reporta paginas por segundo y el RSS pico por
+encima del estado previo al merge.
+
+    python -m benchmarks.merge_backends --docs 10 --pages 60 --repeat 3
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import threading
+import time
+from io import BytesIO
+from typing import List
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.merge_pdf import MERGE_BACKENDS, merge_pdf_sources  # noqa: E402
+
+
+def build_document(pages: int, seed: int) -> bytes:
+    doc = fitz.open()
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 300, 200), False)
+    for n in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Documento {seed} - pagina {n + 1}", fontsize=14)
+        page.insert_textbox(fitz.Rect(72, 100, 520, 400), "Lorem ipsum dolor sit amet. " * 40, fontsize=9)
+        pix.clear_with((seed * 37 + n * 11) % 256)
+        page.insert_image(fitz.Rect(72, 420, 372, 620), pixmap=pix)
+    data = doc.tobytes(garbage=1, deflate=True)
+    doc.close()
+    return data
+
+
+def _current_rss_mb() -> float:
+    # /proc da el RSS actual; en otros sistemas se usa el pico acumulado
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+class _RSSSampler(threading.Thread):
+    """Muestrea el RSS mientras corre el merge para capturar el pico real."""
+
+    def __init__(self, interval: float = 0.002):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _current_rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, _current_rss_mb())
+            time.sleep(self.interval)
+
+    def stop(self) -> float:
+        self._stop_event.set()
+        self.join()
+        return max(self.peak, _current_rss_mb())
+
+
+def _run_backend(backend: str, docs: List[bytes], repeat: int, queue) -> None:
+    timings = []
+    peaks = []
+    size = 0
+    for _ in range(repeat):
+        output = BytesIO()
+        baseline = _current_rss_mb()
+        sampler = _RSSSampler()
+        sampler.start()
+        start = time.perf_counter()
+        merge_pdf_sources(docs, output, backend)
+        timings.append(time.perf_counter() - start)
+        peaks.append(sampler.stop() - baseline)
+        size = output.tell()
+    queue.put((min(timings), max(peaks), size))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10)
+    parser.add_argument("--pages", type=int, default=60, help="paginas por documento")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backends", nargs="*", default=list(MERGE_BACKENDS))
+    args = parser.parse_args()
+
+    docs = [build_document(args.pages, seed) for seed in range(args.docs)]
+    total_pages = args.docs * args.pages
+    print(f"{args.docs} documentos, {total_pages} paginas, {sum(map(len, docs)) / 1024 / 1024:.1f} MB de entrada")
+    print(f"{'backend':<10}{'mejor (s)':>12}{'paginas/s':>12}{'RSS pico +MB':>16}{'salida (MB)':>14}")
+
+    ctx = multiprocessing.get_context("spawn")
+    for backend in args.backends:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_backend, args=(backend, docs, args.repeat, queue))
+        proc.start()
+        best, peak, size = queue.get()
+        proc.join()
+        print(f"{backend:<10}{best:>12.3f}{total_pages / best:>12.0f}{peak:>16.1f}{size / 1024 / 1024:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
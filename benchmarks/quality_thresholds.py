@@ -0,0 +1,138 @@
+"""
+Calibra los umbrales de calidad con la metrica actual de services/pdf_quality.py.
+
+La metrica anterior era el SSIM de skimage (ventana uniforme de 7 px) de la
+primera pagina renderizada a 150 DPI; la actual es el SSIM
+gaussiano de la peor pagina muestreada a PDFTOOLS_QUALITY_DPI. Este script
+comprime un corpus sintetico (texto, escaneos, fotos) con los motores local y
+rasterize a varios niveles, puntua cada candidato con ambas metricas y, para
+cada umbral historico, reporta cuantas decisiones (pasa / no pasa) coinciden
+con el mismo umbral en la metrica nueva y que umbral nuevo las reproduce mejor.
+
+    python -m benchmarks.quality_thresholds --thresholds 0.95 0.98
+"""
+import argparse
+import os
+import sys
+from typing import Dict, List, Tuple
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.merge_backends import build_document  # noqa: E402
+from services import pdf_quality  # noqa: E402
+from services.local_compress import local_compress_pdf  # noqa: E402
+from services.mergencompress import rasterize_pdf_bytes  # noqa: E402
+
+try:
+    from skimage.metrics import structural_similarity
+except ImportError:
+    structural_similarity = None
+
+LEGACY_DPI = 150
+LOCAL_LEVELS = [(200, 90), (150, 80), (100, 65), (100, 40), (72, 30)]
+RASTER_SCALES = [1.4, 1.0, 0.7, 0.5]
+RASTER_JPEG_QUALITIES = [90, 75, 50]
+
+
+def _scan_page(page: fitz.Page, seed: int, photo: bool) -> None:
+    # Texto renderizado a 200 DPI sobre papel con ruido, guardado como JPEG q90
+    source = fitz.open()
+    text_page = source.new_page()
+    text_page.insert_textbox(fitz.Rect(60, 60, 540, 780), f"Clausula {seed}. El contratante se obliga. " * 40,
+                             fontsize=9)
+    pix = text_page.get_pixmap(dpi=200, colorspace=fitz.csGRAY)
+    gray = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    gray = np.clip(gray * 0.85 + 30 + rng.normal(0, 5, gray.shape), 0, 255).astype(np.uint8)
+    if photo:
+        noise = rng.integers(0, 255, (500, 800), dtype=np.uint8)
+        gray[1200:1700, 300:1100] = cv2.normalize(cv2.GaussianBlur(noise, (0, 0), 6), None, 0, 255, cv2.NORM_MINMAX)
+    _, jpeg = cv2.imencode(".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    page.insert_image(page.rect, stream=jpeg.tobytes())
+
+
+def _photo_page(page: fitz.Page, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    layers = [cv2.GaussianBlur(rng.integers(0, 255, (900, 1200), dtype=np.uint8), (0, 0), sigma)
+              for sigma in (3, 12, 40)]
+    image = cv2.normalize(sum(layer.astype(np.float32) for layer in layers), None, 0, 255, cv2.NORM_MINMAX)
+    color = cv2.applyColorMap(image.astype(np.uint8), cv2.COLORMAP_VIRIDIS)
+    _, jpeg = cv2.imencode(".jpg", color, [cv2.IMWRITE_JPEG_QUALITY, 92])
+    page.insert_image(fitz.Rect(40, 120, 555, 500), stream=jpeg.tobytes())
+    page.insert_textbox(fitz.Rect(40, 520, 555, 780), "Informe de inspeccion. " * 30, fontsize=10)
+
+
+def build_corpus() -> Dict[str, bytes]:
+    corpus = {"texto": build_document(3, seed=2)}
+    for name, build in (("escaneo", lambda doc, n: _scan_page(doc.new_page(), n, photo=n == 1)),
+                        ("fotos", lambda doc, n: _photo_page(doc.new_page(), n))):
+        doc = fitz.open()
+        for n in range(3):
+            build(doc, n)
+        corpus[name] = doc.tobytes(garbage=3, deflate=True)
+        doc.close()
+    return corpus
+
+
+def candidates(pdf: bytes) -> List[Tuple[str, bytes]]:
+    out = [(f"local {dpi}/{quality}", local_compress_pdf(pdf, dpi, quality)) for dpi, quality in LOCAL_LEVELS]
+    from services import raster_codecs
+    for quality in RASTER_JPEG_QUALITIES:
+        raster_codecs.RASTER_JPEG_QUALITY = quality
+        for scale in RASTER_SCALES:
+            out.append((f"raster {scale}/q{quality}",
+                        rasterize_pdf_bytes(pdf, scale, skip_blank=False, codec="jpeg", selective=False)))
+    return out
+
+
+def legacy_quality(pdf: bytes, candidate: bytes) -> float:
+    # La metrica anterior: primera pagina, 150 DPI, ventana uniforme de 7 px
+    with fitz.open(stream=pdf, filetype="pdf") as doc:
+        ref = pdf_quality.render_gray_pages(doc, [0], LEGACY_DPI)[0]
+    with fitz.open(stream=candidate, filetype="pdf") as doc:
+        cand = pdf_quality.render_gray_pages(doc, [0], LEGACY_DPI)[0]
+    if cand.shape != ref.shape:
+        cand = cv2.resize(cand, (ref.shape[1], ref.shape[0]), interpolation=cv2.INTER_AREA)
+    return float(structural_similarity(ref, cand, data_range=255))
+
+
+def agreement(old: np.ndarray, new: np.ndarray, old_threshold: float, new_threshold: float) -> float:
+    return float(np.mean((old >= old_threshold) == (new >= new_threshold)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.95, 0.98])
+    parser.add_argument("--verbose", action="store_true", help="muestra cada candidato")
+    args = parser.parse_args()
+    if structural_similarity is None:
+        sys.exit("Hace falta scikit-image para reproducir la metrica anterior")
+
+    old_scores, new_scores = [], []
+    for doc_name, pdf in build_corpus().items():
+        reference = pdf_quality.ReferenceRender(pdf)
+        for name, candidate in candidates(pdf):
+            old = legacy_quality(pdf, candidate)
+            new = reference.score(candidate)["min"]
+            old_scores.append(old)
+            new_scores.append(new)
+            if args.verbose:
+                print(f"{doc_name:<9}{name:<18}{len(candidate) / len(pdf):>7.2f}{old:>8.3f}{new:>8.3f}")
+    old_scores, new_scores = np.array(old_scores), np.array(new_scores)
+    grid = np.round(np.arange(0.800, 1.000, 0.001), 3)
+    print(f"{len(old_scores)} candidatos, metrica nueva a {pdf_quality.QUALITY_DPI} DPI ({pdf_quality.QUALITY_METRIC})")
+    print(f"{'umbral':<8}{'pasan ant.':>11}{'pasan nueva':>12}{'coinciden':>11}{'umbral nuevo':>14}{'coinciden':>11}")
+    for threshold in args.thresholds:
+        same = agreement(old_scores, new_scores, threshold, threshold)
+        matches = [agreement(old_scores, new_scores, threshold, t) for t in grid]
+        best = grid[int(np.argmax(matches))]
+        print(f"{threshold:<8}{int((old_scores >= threshold).sum()):>11}{int((new_scores >= threshold).sum()):>12}"
+              f"{same:>11.0%}{best:>14.3f}{max(matches):>11.0%}")
+
+
+if __name__ == "__main__":
+    main()
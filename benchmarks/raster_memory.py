@@ -0,0 +1,114 @@
+"""
+Mide la memoria maxima del rasterizado por ventanas de merge-compress
+(services/mergencompress.rasterize_pdf_file) segun el tamaño de ventana.
+
+Genera en disco un documento de paginas escaneadas (una imagen JPEG grande
+por pagina) y lo rasteriza con cada --windows (0 = sin ventanas), cada una
+en un proceso nuevo para que el pico de RSS no se mezcle entre corridas.
+Con ventanas el pico debe depender de la ventana y no de --pages.
+
+Con --backends tambien se mide el camino completo del endpoint
+(validate_merge_and_compress_pdf_files: merge de --inputs archivos + rasterizado)
+con cada backend de merge; "default" es el que elige merge-compress.
+
+    python -m benchmarks.raster_memory --pages 300 --windows 0 8 32 64
+    python -m benchmarks.raster_memory --pages 300 --windows 64 --inputs 10 --backends default pypdf2 pikepdf
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.merge_backends import _RSSSampler, _current_rss_mb  # noqa: E402
+
+
+def build_scans(path: str, pages: int, seed: int = 1) -> None:
+    rng = np.random.default_rng(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        # Papel con ruido y bloques oscuros de "texto", ~120 DPI en A4
+        scan = rng.integers(200, 256, (1400, 1000, 3), dtype=np.uint8)
+        for top in range(150, 1250, 60):
+            scan[top:top + 25, 100:900] //= 4
+        ok, jpeg = cv2.imencode(".jpg", scan, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=jpeg.tobytes())
+    doc.save(path)
+    doc.close()
+
+
+def split_inputs(pdf_path: str, parts: int) -> list:
+    """Parte el documento en parts archivos de paginas consecutivas (las entradas del merge)."""
+    paths = []
+    with fitz.open(pdf_path) as doc:
+        bounds = [doc.page_count * i // parts for i in range(parts + 1)]
+        for n, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+            with fitz.open() as part:
+                part.insert_pdf(doc, from_page=start, to_page=stop - 1)
+                paths.append(f"{pdf_path}.input{n:03d}.pdf")
+                part.save(paths[-1])
+    return paths
+
+
+def _run_window(pdf_path: str, window: int, queue, inputs=None, backend=None) -> None:
+    from services import mergencompress, result_cache
+
+    # Sin cache: una corrida no debe salir de la cache de la anterior
+    result_cache.CACHE_ENABLED = False
+
+    mergencompress.RASTER_WINDOW = window
+    output_path = pdf_path + f".{window}.out.pdf"
+    baseline = _current_rss_mb()
+    sampler = _RSSSampler()
+    sampler.start()
+    start = time.perf_counter()
+    if inputs:
+        mergencompress.validate_merge_and_compress_pdf_files(inputs, os.path.dirname(pdf_path), output_path,
+                                                             None if backend == "default" else backend)
+    else:
+        mergencompress.rasterize_pdf_file(pdf_path, output_path)
+    elapsed = time.perf_counter() - start
+    peak = sampler.stop()
+    size = os.path.getsize(output_path)
+    os.remove(output_path)
+    queue.put((elapsed, peak - baseline, size))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--windows", type=int, nargs="+", default=[0, 8, 32, 64])
+    parser.add_argument("--inputs", type=int, default=10, help="archivos de entrada del merge (con --backends)")
+    parser.add_argument("--backends", nargs="*", default=[],
+                        help="backends de merge a medir en el camino completo (default, pypdf2, pikepdf, fitz)")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as work_dir:
+        pdf_path = os.path.join(work_dir, "scans.pdf")
+        build_scans(pdf_path, args.pages)
+        inputs = split_inputs(pdf_path, args.inputs) if args.backends else None
+        print(f"{args.pages} paginas, {os.path.getsize(pdf_path) / 1024 / 1024:.0f} MB")
+        print(f"{'ventana':<10}{'camino':<18}{'s':>8}{'pico MB':>10}{'salida MB':>11}")
+        for window in args.windows:
+            runs = [("rasterizado", None)] + [(f"merge {backend}", backend) for backend in args.backends]
+            for name, backend in runs:
+                queue = ctx.Queue()
+                process = ctx.Process(target=_run_window, args=(pdf_path, window, queue,
+                                                                inputs if backend else None, backend))
+                process.start()
+                elapsed, peak, size = queue.get()
+                process.join()
+                print(f"{window:<10}{name:<18}{elapsed:>8.1f}{peak:>10.0f}{size / 1024 / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Mide el rasterizado de merge-compress (services/mergencompress.py) con 1..N
+procesos.
+
+Genera un documento sintetico, lo rasteriza con cada cantidad de procesos y
+reporta paginas por segundo y la aceleracion respecto de un proceso. Tambien
+verifica que el resultado paralelo tenga las mismas paginas, en el mismo
+orden, que el secuencial. Con --codec compara ademas tamaño y tiempo de cada
+codec de services/raster_codecs.py.
+
+    python -m benchmarks.rasterize --pages 200 --workers 1 2 4 --repeat 2
+    python -m benchmarks.rasterize --pages 50 --workers 1 --codec flate jpeg jpx g4 auto
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Optional
+
+import fitz  # PyMuPDF
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.merge_backends import build_document  # noqa: E402
+from services import mergencompress  # noqa: E402
+
+
+def page_fingerprints(pdf: bytes) -> List[bytes]:
+    # Render chico de cada pagina: alcanza para detectar paginas cambiadas de orden
+    with fitz.open(stream=pdf, filetype="pdf") as doc:
+        return [page.get_pixmap(matrix=fitz.Matrix(0.1, 0.1)).samples for page in doc]
+
+
+def run(pdf: bytes, workers: int, repeat: int, codec: Optional[str] = None) -> tuple:
+    mergencompress.RASTER_WORKERS = workers
+    mergencompress.RASTER_PARALLEL_MIN_PAGES = 2
+    mergencompress._raster_pool = None
+    # Calentamiento: crea los procesos del pool
+    result = mergencompress.rasterize_pdf_bytes(pdf, codec=codec, selective=False)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = mergencompress.rasterize_pdf_bytes(pdf, codec=codec, selective=False)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--codec", nargs="+", default=[], help="codecs a comparar (con el primer --workers)")
+    args = parser.parse_args()
+
+    pdf = build_document(args.pages, seed=1)
+    print(f"{args.pages} paginas, {len(pdf) / 1024:.0f} KB, {os.cpu_count()} CPUs")
+    print(f"{'procesos':<10}{'s':>8}{'pag/s':>10}{'acel.':>8}{'orden':>8}")
+    baseline = None
+    reference = None
+    for workers in args.workers:
+        elapsed, result = run(pdf, workers, args.repeat)
+        fingerprints = page_fingerprints(result)
+        if reference is None:
+            baseline, reference = elapsed, fingerprints
+        same = "ok" if fingerprints == reference else "DIFIERE"
+        print(f"{workers:<10}{elapsed:>8.2f}{args.pages / elapsed:>10.1f}{baseline / elapsed:>8.2f}{same:>8}")
+
+    if args.codec:
+        print(f"\n{'codec':<10}{'s':>8}{'pag/s':>10}{'KB':>10}")
+        for codec in args.codec:
+            elapsed, result = run(pdf, args.workers[0], args.repeat, codec)
+            print(f"{codec:<10}{elapsed:>8.2f}{args.pages / elapsed:>10.1f}{len(result) / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Compara el SSIM de services/pdf_quality.py con skimage.
+
+Renderiza paginas sinteticas, las degrada (JPEG a varias calidades y desenfoque)
+y mide, por comparacion, el tiempo de cada implementacion y la diferencia con
+skimage.metrics.structural_similarity (ventana gaussiana, sigma 1.5, que es la
+que replica pdf_quality). Tambien reporta MS-SSIM y la version por mosaicos.
+
+    python -m benchmarks.ssim --pages 5 --dpi 150 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Callable, List, Tuple
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.merge_backends import build_document  # noqa: E402
+from services import pdf_quality  # noqa: E402
+
+try:
+    from skimage.metrics import structural_similarity
+except ImportError:  # skimage es opcional: sin el solo se miden tiempos
+    structural_similarity = None
+
+JPEG_QUALITIES = [90, 60, 30, 10]
+BLUR_SIGMAS = [0.8, 2.0]
+
+
+def degraded_pairs(pages: int, dpi: int) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+    with fitz.open(stream=build_document(pages, seed=1), filetype="pdf") as doc:
+        renders = pdf_quality.render_gray_pages(doc, range(doc.page_count), dpi)
+    pairs = []
+    for idx, ref in renders.items():
+        for quality in JPEG_QUALITIES:
+            _, encoded = cv2.imencode(".jpg", ref, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            pairs.append((f"p{idx + 1} jpeg{quality}", ref, cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE)))
+        for sigma in BLUR_SIGMAS:
+            pairs.append((f"p{idx + 1} blur{sigma}", ref, cv2.GaussianBlur(ref, (0, 0), sigma)))
+    return pairs
+
+
+def skimage_gaussian(ref: np.ndarray, cand: np.ndarray) -> float:
+    return structural_similarity(ref, cand, data_range=255, gaussian_weights=True, sigma=1.5,
+                                 use_sample_covariance=False)
+
+
+def timed(fn: Callable[[np.ndarray, np.ndarray], float], pairs, repeat: int) -> Tuple[float, List[float]]:
+    best = float("inf")
+    values: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        values = [fn(ref, cand) for _, ref, cand in pairs]
+        best = min(best, time.perf_counter() - start)
+    return best / len(pairs), values
+
+
+def _rank_agreement(a: List[float], b: List[float]) -> float:
+    # Correlacion de Spearman: lo que importa para elegir candidatos es el orden
+    ra = np.argsort(np.argsort(a))
+    rb = np.argsort(np.argsort(b))
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pairs = degraded_pairs(args.pages, args.dpi)
+    height, width = pairs[0][1].shape
+    print(f"{len(pairs)} comparaciones de {width}x{height} px ({args.dpi} DPI)")
+
+    implementations = [
+        ("cv2 ssim", lambda ref, cand: pdf_quality.ssim(ref, cand, tiles=False)),
+        ("cv2 ms-ssim", lambda ref, cand: pdf_quality.ssim(ref, cand, "ms-ssim", tiles=False)),
+        (f"cv2 tiles ({len(pdf_quality.tile_origins(pairs[0][1].shape))})",
+         lambda ref, cand: pdf_quality.ssim(ref, cand, tiles=True)),
+    ]
+    if structural_similarity is not None:
+        implementations.insert(0, ("skimage", skimage_gaussian))
+    else:
+        print("skimage no esta instalado: se omite la comparacion de valores")
+
+    results = {name: timed(fn, pairs, args.repeat) for name, fn in implementations}
+    reference = results.get("skimage")
+    print(f"{'implementacion':<18}{'ms/comp':>10}{'x skimage':>11}{'max |dif|':>11}{'rango rho':>11}")
+    for name, (per_pair, values) in results.items():
+        speedup = f"{reference[0] / per_pair:>11.1f}" if reference else f"{'-':>11}"
+        if reference:
+            diff = max(abs(a - b) for a, b in zip(values, reference[1]))
+            agreement = f"{diff:>11.4f}{_rank_agreement(values, reference[1]):>11.3f}"
+        else:
+            agreement = f"{'-':>11}{'-':>11}"
+        print(f"{name:<18}{per_pair * 1000:>10.2f}{speedup}{agreement}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import os
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from services.ocrtext import ocr_pdf_and_return_base64
+from services.pdf_executor import pdf_executor
 
 app = FastAPI(
     title="OCR Tools API",
@@ -34,7 +35,7 @@ async def ocr_pdf_endpoint(request: OCRRequest):
         
         try:
             # Llamar al servicio OCR
-            result_base64 = ocr_pdf_and_return_base64(temp_pdf_path)
+            result_base64 = await pdf_executor.run("ocr", ocr_pdf_and_return_base64, temp_pdf_path)
             return {"success": True, "filebase64": result_base64}
             
         finally:
@@ -44,5 +45,7 @@ async def ocr_pdf_endpoint(request: OCRRequest):
                 
     except base64.binascii.Error:
         raise HTTPException(status_code=400, detail="Invalid base64 format")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
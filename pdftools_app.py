@@ -1,17 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 from typing import List
 import base64
+import json
 import os
+import shutil
 from typing import Optional
 import tempfile
 
-from services.ocrtext import ocr_pdf_and_return_base64
-from services.merge_pdf import validate_and_merge_pdfs
+from services.ocrtext import ocr_pdf_and_return_base64, ocr_pdf_file
+from services.merge_pdf import validate_and_merge_pdfs, validate_and_merge_pdf_files
 #from services.compress_pdf import compress_pdf_base64
-from services.mergencompress import validate_merge_and_compress_pdfs
-from services.ocrtext import compress_pdf_base64
+from services.mergencompress import validate_merge_and_compress_pdfs, validate_merge_and_compress_pdf_files
+from services.mergencompress import remove_blank_pages_base64, remove_blank_pages_file
+from services.ocrtext import compress_pdf_base64_report, compress_pdf_file_report
+from services.compress_orchestrator import deadline_from_budget
+from services.pdf_analyzer import analyze_pdf, analyze_pdf_base64
+from services.pdf_executor import pdf_executor
 app = FastAPI(
     title="PDF Tools API",
     docs_url="/docs",
@@ -23,17 +30,22 @@ app = FastAPI(
 
 class CompressRequest(BaseModel):
     filebase64: str  # Base64 obligatorio
+    engine: Optional[str] = None  # "stirling"/"remote", "ilove", "local", "rasterize" o "auto" (None = PDFTOOLS_COMPRESS_ENGINE)
+    deadline_seconds: Optional[float] = None  # presupuesto de tiempo de la compresion (None = PDFTOOLS_COMPRESS_DEADLINE)
+    max_bytes: Optional[int] = None  # tamaño maximo del resultado (modo de tamaño objetivo)
+
+class AnalyzeRequest(BaseModel):
+    filebase64: str
 
 class PDFList(BaseModel):
     filesbase64: List[str]
+    backend: Optional[str] = None  # motor de merge: "pypdf2", "pikepdf" o "fitz"
 
 @app.post("/mergepdf")
 async def merge_pdfs(payload: PDFList):  # <--- receives JSON object
     try:
-        output_path = validate_and_merge_pdfs(payload.filesbase64, "/tmp")
-        # Read and encode to base64
-        with open(output_path, "rb") as f:
-            merged_pdf_base64 = base64.b64encode(f.read()).decode('utf-8')
+        merged_pdf = await pdf_executor.run("merge", validate_and_merge_pdfs, payload.filesbase64, payload.backend)
+        merged_pdf_base64 = base64.b64encode(merged_pdf).decode('utf-8')
 
         return {
             "success": True,
@@ -47,17 +59,26 @@ async def merge_pdfs(payload: PDFList):  # <--- receives JSON object
 
 @app.post("/compresspdf")
 async def compress_pdf_endpoint(request: CompressRequest):
+    # El presupuesto corre desde que llega el request, incluida la espera en el pool
+    deadline = deadline_from_budget(request.deadline_seconds)
     try:
         # Use the automatic best compression (ignores quality parameter)
-        compressed_base64 = compress_pdf_base64(request.filebase64)
-        return {"success": True, "filebase64": compressed_base64}
+        compressed_base64, report = await pdf_executor.run(
+            "compress", compress_pdf_base64_report, request.filebase64, request.engine, deadline, request.max_bytes)
+        response = {"success": True, "filebase64": compressed_base64,
+                    "deadline_reached": report["deadline_reached"], "abandoned": report["abandoned"]}
+        if request.max_bytes is not None:
+            response.update(target_met=report["met"], size=report["size"])
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/merge-compress")
-def merge_and_compress(data: PDFList):
+async def merge_and_compress(data: PDFList):
     download_path = "/tmp"
-    output_path = validate_merge_and_compress_pdfs(data.filesbase64, download_path)
+    output_path = await pdf_executor.run("merge_compress", validate_merge_and_compress_pdfs, data.filesbase64, download_path, data.backend)
 
     try:
         with open(output_path, "rb") as f:
@@ -85,7 +106,7 @@ async def ocr_pdf_endpoint(request: CompressRequest):
 
         try:
             # Llamar al servicio OCR
-            result_base64 = ocr_pdf_and_return_base64(temp_pdf_path)
+            result_base64 = await pdf_executor.run("ocr", ocr_pdf_and_return_base64, temp_pdf_path)
             return {"success": True, "filebase64": result_base64}
 
         finally:
@@ -95,5 +116,181 @@ async def ocr_pdf_endpoint(request: CompressRequest):
 
     except base64.binascii.Error:
         raise HTTPException(status_code=400, detail="Invalid base64 format")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
+
+
+@app.post("/analyze")
+async def analyze_pdf_endpoint(request: AnalyzeRequest):
+    try:
+        analysis = await pdf_executor.run("analyze", analyze_pdf_base64, request.filebase64)
+        return {"success": True, "analysis": analysis}
+    except base64.binascii.Error:
+        raise HTTPException(status_code=400, detail="Invalid base64 format")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/remove-blank-pages")
+async def remove_blank_pages_endpoint(request: AnalyzeRequest):
+    try:
+        result_base64, removed = await pdf_executor.run("remove_blank", remove_blank_pages_base64, request.filebase64)
+        return {"success": True, "filebase64": result_base64, "removed_pages": removed}
+    except base64.binascii.Error:
+        raise HTTPException(status_code=400, detail="Invalid base64 format")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- Endpoints binarios (multipart/form-data -> application/pdf) ---
+# Los archivos subidos los recibe Starlette en un SpooledTemporaryFile (pasa a
+# disco sobre 1 MB) y aqui se copian por bloques a un directorio de trabajo
+# propio de cada request, que se elimina cuando termina la respuesta.
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+async def _save_upload(upload: UploadFile, work_dir: str, name: str) -> str:
+    path = os.path.join(work_dir, name)
+    with open(path, "wb") as out:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            out.write(chunk)
+    await upload.close()
+    return path
+
+
+def _pdf_file_response(path: str, filename: str, work_dir: str) -> FileResponse:
+    return FileResponse(
+        path,
+        media_type="application/pdf",
+        filename=filename,
+        background=BackgroundTask(shutil.rmtree, work_dir, ignore_errors=True),
+    )
+
+
+@app.post("/mergepdf/file")
+async def merge_pdfs_file(files: List[UploadFile] = File(...), backend: Optional[str] = Form(None)):
+    work_dir = tempfile.mkdtemp(prefix="pdftools_")
+    try:
+        pdf_paths = [
+            await _save_upload(upload, work_dir, f"file_{idx + 1}.pdf")
+            for idx, upload in enumerate(files)
+        ]
+        output_path = await pdf_executor.run("merge", validate_and_merge_pdf_files, pdf_paths, os.path.join(work_dir, "merged.pdf"), backend)
+        return _pdf_file_response(output_path, "merged.pdf", work_dir)
+    except HTTPException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/compresspdf/file")
+async def compress_pdf_file_endpoint(file: UploadFile = File(...), engine: Optional[str] = Form(None),
+                                     deadline_seconds: Optional[float] = Form(None),
+                                     max_bytes: Optional[int] = Form(None)):
+    deadline = deadline_from_budget(deadline_seconds)
+    work_dir = tempfile.mkdtemp(prefix="pdftools_")
+    try:
+        input_path = await _save_upload(file, work_dir, "input.pdf")
+        output_path, report = await pdf_executor.run(
+            "compress", compress_pdf_file_report, input_path, os.path.join(work_dir, "compressed.pdf"), engine,
+            deadline, max_bytes)
+        response = _pdf_file_response(output_path, "compressed.pdf", work_dir)
+        # El reporte de la busqueda va en headers: el cuerpo es el PDF
+        response.headers["X-Compress-Deadline-Reached"] = str(report["deadline_reached"]).lower()
+        response.headers["X-Compress-Abandoned"] = json.dumps(report["abandoned"])
+        if max_bytes is not None:
+            response.headers["X-Compress-Target-Met"] = str(report["met"]).lower()
+        return response
+    except HTTPException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/merge-compress/file")
+async def merge_and_compress_file(files: List[UploadFile] = File(...), backend: Optional[str] = Form(None)):
+    work_dir = tempfile.mkdtemp(prefix="pdftools_")
+    try:
+        pdf_paths = [
+            await _save_upload(upload, work_dir, f"file_{idx + 1}.pdf")
+            for idx, upload in enumerate(files)
+        ]
+        output_path = await pdf_executor.run(
+            "merge_compress", validate_merge_and_compress_pdf_files,
+            pdf_paths, work_dir, os.path.join(work_dir, "merged_compressed.pdf"), backend,
+        )
+        return _pdf_file_response(output_path, "merged_compressed.pdf", work_dir)
+    except HTTPException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
     except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"No se pudo retornar el archivo: {str(e)}")
+
+
+@app.post("/ocrpdf/file")
+async def ocr_pdf_file_endpoint(file: UploadFile = File(...)):
+    """
+    Igual que /ocrpdf pero recibe el PDF como multipart y lo retorna como application/pdf.
+    """
+    work_dir = tempfile.mkdtemp(prefix="pdftools_")
+    try:
+        input_path = await _save_upload(file, work_dir, "input.pdf")
+        output_path = await pdf_executor.run("ocr", ocr_pdf_file, input_path, os.path.join(work_dir, "ocr.pdf"))
+        return _pdf_file_response(output_path, "ocr.pdf", work_dir)
+    except HTTPException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
         raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
+
+
+@app.post("/remove-blank-pages/file")
+async def remove_blank_pages_file_endpoint(file: UploadFile = File(...)):
+    work_dir = tempfile.mkdtemp(prefix="pdftools_")
+    try:
+        input_path = await _save_upload(file, work_dir, "input.pdf")
+        output_path, removed = await pdf_executor.run(
+            "remove_blank", remove_blank_pages_file, input_path, os.path.join(work_dir, "no_blank.pdf"))
+        response = _pdf_file_response(output_path, "no_blank.pdf", work_dir)
+        response.headers["X-Removed-Pages"] = json.dumps(removed)
+        return response
+    except HTTPException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    except Exception as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/analyze/file")
+async def analyze_pdf_file_endpoint(file: UploadFile = File(...)):
+    work_dir = tempfile.mkdtemp(prefix="pdftools_")
+    try:
+        input_path = await _save_upload(file, work_dir, "input.pdf")
+        analysis = await pdf_executor.run("analyze", analyze_pdf, input_path)
+        return {"success": True, "analysis": analysis}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# --- Trabajos asincronos: POST /jobs/<tool> -> job_id, luego GET /jobs/{job_id}[/result|/file] ---
+from services.pdf_jobs_rest import router as jobs_router
+
+app.include_router(jobs_router, prefix="/jobs")
@@ -0,0 +1,173 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+from services.pdf_quality import sample_page_indices
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+COST_MODEL_PATH = os.getenv("PDFTOOLS_COST_MODEL_PATH", "tmp/compress_cost.json")
+# Observaciones por (motor, clase) antes de que el modelo pueda descartar un motor
+COST_MIN_SAMPLES = int(os.getenv("PDFTOOLS_COST_MIN_SAMPLES", "3"))
+# Un motor con mas observaciones se sigue probando si gana al menos esta fraccion
+COST_MIN_WIN_RATE = float(os.getenv("PDFTOOLS_COST_MIN_WIN_RATE", "0.15"))
+# Cada tantos documentos de una clase se prueban todos los motores
+COST_EXPLORE_EVERY = int(os.getenv("PDFTOOLS_COST_EXPLORE_EVERY", "20"))
+# Peso de la observacion nueva en los promedios moviles
+COST_EWMA_ALPHA = 0.2
+
+CLASSIFY_SAMPLE_PAGES = 8
+SIZE_BUCKETS = [(1024 * 1024, "s"), (10 * 1024 * 1024, "m")]
+
+
+def classify_pdf(pdf_bytes: bytes, analysis: Optional[dict] = None) -> str:
+    """
+    Clase del documento para el modelo de costo, sin renderizar: tipo de
+    contenido de las paginas ("text", "scanned", "mixed") y tamaño ("s" < 1 MB,
+    "m" < 10 MB, "l"). Ej.: "scanned:m". Con el analisis previo
+    (services.pdf_analyzer) se usan todas las paginas; sin el, una muestra.
+    """
+    size = next((label for limit, label in SIZE_BUCKETS if len(pdf_bytes) < limit), "l")
+    if analysis is not None:
+        pages = len(analysis["pages"])
+        with_images = sum(1 for page in analysis["pages"] if page["image_count"])
+        scanned = sum(1 for page in analysis["pages"] if page["image_count"] and not page["has_text"])
+    else:
+        try:
+            with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+                with_images = scanned = 0
+                indices = sample_page_indices(doc.page_count, CLASSIFY_SAMPLE_PAGES)
+                pages = len(indices)
+                for idx in indices:
+                    page = doc.load_page(idx)
+                    if not page.get_images():
+                        continue
+                    with_images += 1
+                    if not page.get_text("text").strip():
+                        scanned += 1
+        except Exception:
+            return f"unknown:{size}"
+    if not with_images:
+        kind = "text"
+    elif scanned * 2 >= pages:
+        kind = "scanned"
+    else:
+        kind = "mixed"
+    return f"{kind}:{size}"
+
+
+def _new_stats() -> dict:
+    return {"n": 0, "wins": 0, "latency": 0.0, "size_ratio": 1.0, "quality": 1.0, "calls": 0, "calls_saved": 0}
+
+
+def _ewma(old: float, new: float, n: int) -> float:
+    # Las primeras observaciones se promedian; despues pesa mas lo reciente
+    alpha = max(COST_EWMA_ALPHA, 1.0 / n)
+    return old + alpha * (new - old)
+
+
+class CostModel:
+    """
+    Latencia, reduccion de tamaño, calidad y victorias observadas de cada motor
+    por clase de documento. Con eso select() prueba solo los motores que
+    suelen ganar en la clase, ordenados por tasa de victorias y latencia.
+
+    Se guarda en un JSON compartido por los workers (escritura atomica con
+    os.replace). Dos workers que escriben a la vez pueden pisar una
+    observacion; para un promedio movil eso es aceptable.
+    """
+
+    def __init__(self, path: str = COST_MODEL_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._stats: Dict[str, Dict[str, dict]] = {}
+        self._docs: Dict[str, int] = {}
+
+    # --- persistencia ---
+    def _reload(self) -> None:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._stats = data.get("stats", {})
+            self._docs = data.get("docs", {})
+            self._mtime = mtime
+        except (OSError, ValueError):
+            logger.warning("No se pudo leer el modelo de costo %s", self.path)
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path) or "."
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"stats": self._stats, "docs": self._docs}, f)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except OSError:
+            logger.exception("No se pudo guardar el modelo de costo %s", self.path)
+
+    # --- API ---
+    def select(self, engines: List[str], doc_class: str) -> List[str]:
+        """
+        Motores a probar para un documento de doc_class, en orden de
+        preferencia. Los motores con pocas observaciones se prueban siempre
+        (al final), igual que todos cada COST_EXPLORE_EVERY documentos.
+        """
+        with self._lock:
+            self._reload()
+            stats = self._stats.get(doc_class, {})
+            docs = self._docs.get(doc_class, 0)
+        known = [e for e in engines if stats.get(e, {}).get("n", 0) >= COST_MIN_SAMPLES]
+        unknown = [e for e in engines if e not in known]
+
+        def win_rate(engine: str) -> float:
+            return stats[engine]["wins"] / stats[engine]["n"]
+
+        known.sort(key=lambda e: (-win_rate(e), stats[e]["latency"]))
+        if COST_EXPLORE_EVERY > 0 and docs % COST_EXPLORE_EVERY == COST_EXPLORE_EVERY - 1:
+            return known + unknown
+        likely = [e for e in known if win_rate(e) >= COST_MIN_WIN_RATE] or known[:1]
+        return likely + unknown
+
+    def record(self, doc_class: str, observations: Dict[str, dict], winner: Optional[str]) -> None:
+        """
+        Registra el resultado de un documento. observations: por motor,
+        {"latency": segundos, "size_ratio": ..., "quality": ..., "calls": ...,
+        "calls_saved": ...}; size_ratio y quality son None si el motor no
+        produjo un candidato valido. calls y calls_saved se acumulan.
+        """
+        with self._lock:
+            self._reload()
+            stats = self._stats.setdefault(doc_class, {})
+            for engine, obs in observations.items():
+                entry = stats.setdefault(engine, _new_stats())
+                entry["n"] += 1
+                entry["wins"] += int(engine == winner)
+                entry["latency"] = _ewma(entry["latency"], obs["latency"], entry["n"])
+                entry["size_ratio"] = _ewma(entry["size_ratio"], 1.0 if obs["size_ratio"] is None else obs["size_ratio"], entry["n"])
+                entry["quality"] = _ewma(entry["quality"], 0.0 if obs["quality"] is None else obs["quality"], entry["n"])
+                entry["calls"] = entry.get("calls", 0) + obs.get("calls", 0)
+                entry["calls_saved"] = entry.get("calls_saved", 0) + obs.get("calls_saved", 0)
+            self._docs[doc_class] = self._docs.get(doc_class, 0) + 1
+            self._save()
+
+    def snapshot(self) -> Dict[str, Dict[str, dict]]:
+        with self._lock:
+            self._reload()
+            return json.loads(json.dumps(self._stats))
+
+
+cost_model = CostModel()
@@ -0,0 +1,142 @@
+import os
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+from services import stirling_client
+from services.compress_fanout import check_deadline, run_blocking
+from services.ilove_client import compress_with_iloveapi, ilove_configured
+from services.local_compress import local_compress_pdf
+from services.mergencompress import RASTER_SCALE, rasterize_pdf_bytes
+
+Candidate = Dict[str, Any]
+
+# Configuraciones de compresión de Stirling a probar
+COMPRESS_CONFIGS = [
+    {'optimize_level': 1, 'target_ratio': 0.825},
+    {'optimize_level': 3, 'target_ratio': 0.85},
+    {'optimize_level': 5, 'target_ratio': 0.825},
+]
+
+# Configuraciones del motor local, de la mas conservadora a la mas agresiva
+LOCAL_COMPRESS_CONFIGS = [
+    {'target_dpi': 150, 'jpeg_quality': 80},
+    {'target_dpi': 100, 'jpeg_quality': 65},
+]
+# En modo auto, el motor local solo se ofrece para PDFs hasta este tamaño
+LOCAL_COMPRESS_MAX_BYTES = int(float(os.getenv("PDFTOOLS_LOCAL_COMPRESS_MAX_MB", "20")) * 1024 * 1024)
+
+ILOVE_LEVELS = ["recommended"]
+RASTER_SCALES = [RASTER_SCALE]
+
+
+def _compress_fields(cfg: dict, original_size: int) -> dict:
+    target_size = int(original_size * cfg['target_ratio'])
+    # Hacia abajo: redondeado, "2.7 MB" pediria 3MB y se pasaria del presupuesto
+    if target_size >= 1024*1024:
+        expected_output_size = f"{target_size // (1024*1024)}MB"
+    else:
+        expected_output_size = f"{max(1, target_size // 1024)}KB"
+    return {
+        'optimizeLevel': str(cfg["optimize_level"]),
+        'expectedOutputSize': expected_output_size,
+        'linearize': 'true',
+        'normalize': 'true',
+        'grayscale': 'false',
+    }
+
+
+class CompressionEngine:
+    """
+    Interfaz de un motor de compresion. Cada motor ofrece una lista de
+    candidatos (configuraciones) y sabe producir el PDF comprimido de uno.
+
+    Los motores locales implementan compress() (CPU, se ejecuta en un hilo);
+    los remotos sobreescriben fetch() para no ocupar un hilo durante la red.
+    deadline (hora absoluta, time.time()) es el de la busqueda: un motor que
+    corre en un hilo no se puede cancelar, asi que lo revisa entre pasos y
+    corta con DeadlineExceeded.
+    """
+    name = ""
+
+    def candidates(self) -> List[Candidate]:
+        raise NotImplementedError
+
+    def configured(self) -> bool:
+        """Si el motor tiene lo que necesita para correr (credenciales, servicios)."""
+        return True
+
+    def suitable(self, pdf_size: int) -> bool:
+        """Si el motor se ofrece en modo auto para un PDF de este tamaño."""
+        return self.configured()
+
+    def compress(self, pdf_bytes: bytes, candidate: Candidate, deadline: Optional[float] = None) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def fetch(self, pdf_bytes: bytes, candidate: Candidate, deadline: Optional[float] = None) -> Optional[bytes]:
+        # Un candidato que espero su turno mas alla del deadline ni empieza
+        check_deadline(deadline)
+        return await run_blocking(self.compress, pdf_bytes, candidate, deadline)
+
+
+class StirlingEngine(CompressionEngine):
+    name = "stirling"
+
+    def candidates(self) -> List[Candidate]:
+        return [{'engine': self.name, **cfg} for cfg in COMPRESS_CONFIGS]
+
+    async def fetch(self, pdf_bytes: bytes, candidate: Candidate, deadline: Optional[float] = None) -> Optional[bytes]:
+        # La peticion async se cancela junto con la tarea al llegar el deadline
+        # Una respuesta 4xx/5xx levanta HTTPException: el candidato cuenta como fallido
+        out = BytesIO()
+        await stirling_client.apost_pdf(
+            stirling_client.COMPRESS_ENDPOINT, pdf_bytes, _compress_fields(candidate, len(pdf_bytes)), out
+        )
+        file_content = out.getvalue()
+        if not stirling_client.is_complete_pdf(file_content):
+            return None
+        return file_content
+
+
+class ILoveEngine(CompressionEngine):
+    name = "ilove"
+
+    def candidates(self) -> List[Candidate]:
+        return [{'engine': self.name, 'compression_level': level} for level in ILOVE_LEVELS]
+
+    def configured(self) -> bool:
+        return ilove_configured()
+
+    def compress(self, pdf_bytes: bytes, candidate: Candidate, deadline: Optional[float] = None) -> Optional[bytes]:
+        return compress_with_iloveapi(pdf_bytes, candidate['compression_level'], deadline)
+
+
+class LocalEngine(CompressionEngine):
+    name = "local"
+
+    def candidates(self) -> List[Candidate]:
+        return [{'engine': self.name, **cfg} for cfg in LOCAL_COMPRESS_CONFIGS]
+
+    def suitable(self, pdf_size: int) -> bool:
+        return pdf_size <= LOCAL_COMPRESS_MAX_BYTES
+
+    def compress(self, pdf_bytes: bytes, candidate: Candidate, deadline: Optional[float] = None) -> Optional[bytes]:
+        return local_compress_pdf(pdf_bytes, candidate['target_dpi'], candidate['jpeg_quality'], deadline)
+
+
+class RasterizeEngine(CompressionEngine):
+    name = "rasterize"
+
+    def candidates(self) -> List[Candidate]:
+        return [{'engine': self.name, 'scale': scale} for scale in RASTER_SCALES]
+
+    def suitable(self, pdf_size: int) -> bool:
+        return pdf_size <= LOCAL_COMPRESS_MAX_BYTES
+
+    def compress(self, pdf_bytes: bytes, candidate: Candidate, deadline: Optional[float] = None) -> Optional[bytes]:
+        # Se conservan las paginas vacias: el resultado debe compararse pagina a pagina
+        return rasterize_pdf_bytes(pdf_bytes, candidate['scale'], skip_blank=False, deadline=deadline)
+
+
+ENGINES: Dict[str, CompressionEngine] = {
+    engine.name: engine for engine in (StirlingEngine(), ILoveEngine(), LocalEngine(), RasterizeEngine())
+}
@@ -0,0 +1,253 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from services import stirling_client
+
+# Candidatos de compresion que se piden al servicio remoto al mismo tiempo
+COMPRESS_FANOUT = int(os.getenv("PDFTOOLS_COMPRESS_FANOUT", "3"))
+# Objetivo por defecto: al llegar un resultado con calidad >= GOAL_QUALITY y
+# tamaño <= GOAL_RATIO del original se cancelan los candidatos restantes
+COMPRESS_GOAL_QUALITY = float(os.getenv("PDFTOOLS_COMPRESS_GOAL_QUALITY", "0.98"))
+COMPRESS_GOAL_RATIO = float(os.getenv("PDFTOOLS_COMPRESS_GOAL_RATIO", "0.7"))
+# "adaptive": busqueda binaria sobre los niveles ordenados de cada motor;
+# "sweep": todos los candidatos en paralelo
+COMPRESS_SEARCH = os.getenv("PDFTOOLS_COMPRESS_SEARCH", "adaptive")
+
+Candidate = Dict[str, Any]
+Result = Dict[str, Any]
+T = TypeVar("T")
+
+# Veredicto de un candidato en la busqueda adaptativa (ver search_levels)
+PASSED = "passed"            # calidad suficiente: se prueba un nivel mas agresivo
+TOO_BIG = "too_big"          # no achica el PDF: tambien se prueba uno mas agresivo
+LOW_QUALITY = "low_quality"  # calidad insuficiente: se prueba uno mas conservador
+FAILED = "failed"            # sin resultado (error, PDF invalido): se descarta ese nivel
+
+# Hilos de la busqueda en curso para el trabajo CPU de los candidatos
+# (compresion local, render + SSIM); ver run_search
+_search_threads: ContextVar[Optional[ThreadPoolExecutor]] = ContextVar("compress_search_threads", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Un candidato llego al deadline de la busqueda antes de terminar."""
+
+
+def remaining_time(deadline: Optional[float]) -> Optional[float]:
+    """Segundos hasta deadline (hora absoluta, time.time(): vale entre procesos); None sin deadline."""
+    return None if deadline is None else max(0.0, deadline - time.time())
+
+
+def check_deadline(deadline: Optional[float]) -> None:
+    """DeadlineExceeded si ya paso deadline. Los motores la llaman entre pasos (imagenes, paginas)."""
+    if deadline is not None and time.time() >= deadline:
+        raise DeadlineExceeded("Deadline de compresion alcanzado")
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any) -> Any:
+    """Corre fn(*args) en los hilos de la busqueda en curso sin bloquear el loop."""
+    return await asyncio.get_running_loop().run_in_executor(_search_threads.get(), fn, *args)
+
+
+def run_search(main: Callable[[], Awaitable[T]], max_parallel: int = COMPRESS_FANOUT) -> T:
+    """
+    Corre main() en un event loop propio con un pool de hilos propio para
+    run_blocking. Al terminar el pool se cierra sin esperar: un candidato
+    abandonado por el deadline termina en su hilo (los motores cortan en el
+    siguiente check_deadline) sin ocupar los hilos de otra busqueda. No se
+    usa el executor por defecto del loop porque asyncio.run lo espera al cerrar.
+    """
+    threads = ThreadPoolExecutor(max_workers=max(1, max_parallel), thread_name_prefix="compress")
+
+    async def run() -> T:
+        _search_threads.set(threads)
+        try:
+            return await main()
+        finally:
+            await stirling_client.aclose_async_client()
+
+    try:
+        return asyncio.run(run())
+    finally:
+        threads.shutdown(wait=False, cancel_futures=True)
+
+
+async def _fan_out(
+    candidates: List[Candidate],
+    fetch: Callable[[Candidate], Awaitable[Optional[bytes]]],
+    evaluate: Callable[[Candidate, bytes], Optional[Result]],
+    goal: Callable[[Result], bool],
+    max_parallel: int,
+    deadline: Optional[float] = None,
+) -> Tuple[List[Result], List[Candidate]]:
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+    async def attempt(candidate: Candidate) -> Optional[Result]:
+        async with semaphore:
+            data = await fetch(candidate)
+        if data is None:
+            return None
+        # El puntaje (render + SSIM) es CPU: fuera del loop para no frenar las descargas
+        return await run_blocking(evaluate, candidate, data)
+
+    tasks = {asyncio.create_task(attempt(c)): c for c in candidates}
+    results: List[Result] = []
+    try:
+        for next_done in asyncio.as_completed(tasks, timeout=remaining_time(deadline)):
+            try:
+                result = await next_done
+            except (asyncio.TimeoutError, DeadlineExceeded):
+                logging.info("Deadline de compresion alcanzado; se cancelan los candidatos restantes.")
+                break
+            except Exception as e:
+                logging.warning(f"Candidato de compresion fallido: {type(e).__name__}: {e!r}")
+                continue
+            if result is None:
+                continue
+            results.append(result)
+            if goal(result):
+                logging.info("Objetivo de compresion alcanzado; se cancelan los candidatos restantes.")
+                break
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    abandoned = [tasks[task] for task in pending]
+    return results, abandoned
+
+
+async def _search_chains(
+    chains: List[List[Candidate]],
+    fetch: Callable[[Candidate], Awaitable[Optional[bytes]]],
+    evaluate: Callable[[Candidate, bytes], Optional[Result]],
+    verdict: Callable[[Candidate, Optional[bytes], Optional[Result]], str],
+    goal: Callable[[Result], bool],
+    max_parallel: int,
+    starts: Optional[List[Optional[int]]] = None,
+    deadline: Optional[float] = None,
+) -> Tuple[List[Result], List[Candidate], List[int]]:
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+    results: List[Result] = []
+    calls = [0] * len(chains)
+    # Candidato en curso de cada cadena (None entre pedidos)
+    in_flight: List[Optional[Candidate]] = [None] * len(chains)
+    tasks: List[asyncio.Task] = []
+
+    async def attempt(index: int, candidate: Candidate) -> str:
+        in_flight[index] = candidate
+        calls[index] += 1
+        async with semaphore:
+            data = await fetch(candidate)
+        result = None if data is None else await run_blocking(evaluate, candidate, data)
+        in_flight[index] = None
+        if result is not None:
+            results.append(result)
+        outcome = verdict(candidate, data, result)
+        if outcome == PASSED and goal(result):
+            logging.info("Objetivo de compresion alcanzado; se cancelan los candidatos restantes.")
+            for task in tasks:
+                if task is not asyncio.current_task():
+                    task.cancel()
+            return "goal"
+        return outcome
+
+    async def search(index: int) -> None:
+        chain = chains[index]
+        # Niveles (indices de chain) que aun pueden probarse; lo y hi son posiciones aqui
+        levels = list(range(len(chain)))
+        lo, hi = 0, len(levels) - 1
+        start = starts[index] if starts else None
+        while lo <= hi:
+            # El primer nivel puede venir sugerido (p. ej. por el historial)
+            mid = start if start is not None and calls[index] == 0 else (lo + hi) // 2
+            try:
+                outcome = await attempt(index, chain[levels[mid]])
+            except DeadlineExceeded:
+                # Queda en in_flight: se reporta como abandonado
+                return
+            except Exception as e:
+                logging.warning(f"Candidato de compresion fallido: {type(e).__name__}: {e!r}")
+                in_flight[index] = None
+                outcome = FAILED
+            if outcome == "goal":
+                return
+            if outcome == FAILED:
+                # Un error no dice nada de los demas niveles: se descarta solo este
+                del levels[mid]
+                hi -= 1
+            elif outcome == LOW_QUALITY:
+                # Los niveles mas agresivos solo pueden empeorar la calidad
+                hi = mid - 1
+            else:
+                # Calidad suficiente, o no achica (nivel sin perdida): se prueba uno mas agresivo
+                lo = mid + 1
+
+    tasks.extend(asyncio.create_task(search(i)) for i in range(len(chains)))
+    try:
+        _, pending = await asyncio.wait(tasks, timeout=remaining_time(deadline))
+        if pending:
+            logging.info("Deadline de compresion alcanzado; se cancelan los candidatos restantes.")
+    finally:
+        for task in tasks:
+            task.cancel()
+    abandoned = [candidate for candidate in in_flight if candidate is not None]
+    return results, abandoned, calls
+
+
+def search_levels(
+    chains: List[List[Candidate]],
+    fetch: Callable[[Candidate], Awaitable[Optional[bytes]]],
+    evaluate: Callable[[Candidate, bytes], Optional[Result]],
+    verdict: Callable[[Candidate, Optional[bytes], Optional[Result]], str],
+    goal: Callable[[Result], bool],
+    max_parallel: int = COMPRESS_FANOUT,
+    starts: Optional[List[Optional[int]]] = None,
+    deadline: Optional[float] = None,
+) -> Tuple[List[Result], List[Candidate], List[int]]:
+    """
+    Busqueda adaptativa sobre cadenas de candidatos ordenadas de menos a mas
+    agresivo (calidad y tamaño decrecen a lo largo de la cadena).
+
+    Cada cadena se recorre por busqueda binaria segun verdict(candidate, pdf,
+    result) (pdf None si el pedido fallo): con PASSED o TOO_BIG se prueba uno
+    mas agresivo, con LOW_QUALITY uno mas conservador y con FAILED se
+    descarta ese nivel y se sigue con los demas; la cadena termina cuando el
+    intervalo se agota. Un resultado PASSED que cumple goal detiene todas las
+    cadenas. Las cadenas avanzan en paralelo (a lo sumo max_parallel pedidos
+    a la vez). starts[i], si se da, es el indice del
+    primer candidato que se prueba en la cadena i (en lugar del medio).
+    Al llegar deadline (hora absoluta, time.time()) se cancela lo que siga en
+    curso y se retorna lo evaluado hasta entonces.
+
+    Retorna (resultados evaluados, candidatos en curso al cancelar, llamadas
+    hechas por cadena); len(chain) - llamadas es lo que se ahorro.
+    """
+    return run_search(lambda: _search_chains(chains, fetch, evaluate, verdict, goal, max_parallel, starts, deadline),
+                      max_parallel)
+
+
+def fan_out(
+    candidates: List[Candidate],
+    fetch: Callable[[Candidate], Awaitable[Optional[bytes]]],
+    evaluate: Callable[[Candidate, bytes], Optional[Result]],
+    goal: Callable[[Result], bool],
+    max_parallel: int = COMPRESS_FANOUT,
+    deadline: Optional[float] = None,
+) -> Tuple[List[Result], List[Candidate]]:
+    """
+    Prueba los candidatos de compresion en paralelo (a lo sumo max_parallel).
+
+    fetch(candidate) obtiene el PDF comprimido (None si no sirve) y
+    evaluate(candidate, pdf) lo puntua a medida que llega (None para descartarlo).
+    Cuando un resultado cumple goal se cancelan los candidatos que siguen en
+    curso o en espera, y lo mismo al llegar deadline (hora absoluta,
+    time.time()). Retorna (resultados evaluados, candidatos abandonados).
+
+    Es sincrona: crea su propio event loop, pensada para correr en un worker.
+    """
+    return run_search(lambda: _fan_out(candidates, fetch, evaluate, goal, max_parallel, deadline), max_parallel)
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.compress_engines import Candidate
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+HISTORY_ENABLED = os.getenv("PDFTOOLS_HISTORY", "1") not in ("0", "false", "no")
+HISTORY_DB = os.getenv("PDFTOOLS_HISTORY_DB", "tmp/compress_history.sqlite3")
+# Documentos recientes entre los que se buscan vecinos
+HISTORY_WINDOW = int(os.getenv("PDFTOOLS_HISTORY_WINDOW", "2000"))
+PREDICT_K = int(os.getenv("PDFTOOLS_PREDICT_K", "5"))
+# Distancia maxima (espacio de features normalizado) para considerar a un vecino
+PREDICT_MAX_DISTANCE = float(os.getenv("PDFTOOLS_PREDICT_MAX_DISTANCE", "0.5"))
+# Con esta fraccion de los votos se prueba solo el candidato predicho
+PREDICT_CONFIDENCE = float(os.getenv("PDFTOOLS_PREDICT_CONFIDENCE", "0.8"))
+# Cada tantos documentos se ignora la prediccion, para seguir aprendiendo de todos los niveles
+PREDICT_EXPLORE_EVERY = int(os.getenv("PDFTOOLS_PREDICT_EXPLORE_EVERY", "20"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    size INTEGER NOT NULL,
+    pages INTEGER NOT NULL,
+    image_ratio REAL NOT NULL,
+    dpi REAL NOT NULL,
+    scanned_ratio REAL NOT NULL,
+    doc_class TEXT
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    document_id INTEGER NOT NULL REFERENCES documents(id),
+    engine TEXT NOT NULL,
+    config TEXT NOT NULL,
+    result_size INTEGER,
+    ssim REAL,
+    score REAL,
+    latency REAL,
+    won INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outcomes_engine ON outcomes (engine, document_id);
+"""
+
+
+def document_features(analysis: Dict[str, Any]) -> Dict[str, float]:
+    """Features de un documento a partir del analisis previo (services.pdf_analyzer)."""
+    size = analysis["size"]
+    pages = analysis["page_count"]
+    return {
+        "size": size,
+        "pages": pages,
+        "image_ratio": analysis["bytes_by_type"].get("image", 0) / size if size else 0.0,
+        "dpi": analysis["max_image_dpi"],
+        "scanned_ratio": analysis["scanned_pages"] / pages if pages else 0.0,
+    }
+
+
+def _vector(size: float, pages: float, image_ratio: float, dpi: float, scanned_ratio: float) -> np.ndarray:
+    # Escalas comparables: un orden de magnitud de tamaño pesa como pasar de texto a imagen
+    return np.array([
+        np.log10(max(size, 1)),
+        np.log10(max(pages, 1)) / 2,
+        image_ratio,
+        min(dpi, 600) / 300,
+        scanned_ratio,
+    ])
+
+
+def config_key(candidate: Candidate) -> str:
+    """Identidad estable de una configuracion (sin el nombre del motor)."""
+    return json.dumps({k: v for k, v in candidate.items() if k != "engine"}, sort_keys=True)
+
+
+class CompressionHistory:
+    """
+    Resultados de compresion en SQLite (compartido por los workers): features
+    del documento y, por candidato probado, motor, configuracion, tamaño
+    resultante, SSIM, puntaje y latencia. predict() sugiere la configuracion
+    de un motor que gano en los documentos mas parecidos (k vecinos).
+    """
+
+    def __init__(self, path: str = HISTORY_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        with self._lock:
+            if not self._initialized:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        with self._lock:
+            if not self._initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                self._initialized = True
+        return conn
+
+    def record(self, features: Dict[str, float], doc_class: str, outcomes: List[Dict[str, Any]]) -> None:
+        """
+        Guarda un documento y sus candidatos. Cada outcome: {"candidate",
+        "result_size", "ssim", "score", "latency", "won"}; los que no se
+        pudieron medir llevan None.
+        """
+        if not outcomes:
+            return
+        try:
+            with closing(self._connect()) as conn, conn:
+                cursor = conn.execute(
+                    "INSERT INTO documents (created, size, pages, image_ratio, dpi, scanned_ratio, doc_class) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (time.time(), features["size"], features["pages"], features["image_ratio"],
+                     features["dpi"], features["scanned_ratio"], doc_class),
+                )
+                conn.executemany(
+                    "INSERT INTO outcomes (document_id, engine, config, result_size, ssim, score, latency, won) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(cursor.lastrowid, o["candidate"]["engine"], config_key(o["candidate"]), o["result_size"],
+                      o["ssim"], o["score"], o["latency"], int(o["won"])) for o in outcomes],
+                )
+        except (OSError, sqlite3.Error):
+            logger.exception("No se pudo guardar el historial de compresion en %s", self.path)
+
+    def _neighbours(self, conn: sqlite3.Connection, features: Dict[str, float], engine: str) -> List[Tuple[int, float]]:
+        rows = conn.execute(
+            "SELECT id, size, pages, image_ratio, dpi, scanned_ratio FROM documents "
+            "WHERE id IN (SELECT document_id FROM outcomes WHERE engine = ?) ORDER BY id DESC LIMIT ?",
+            (engine, HISTORY_WINDOW),
+        ).fetchall()
+        if not rows:
+            return []
+        target = _vector(**features)
+        ids = [row[0] for row in rows]
+        distances = np.linalg.norm(np.array([_vector(*row[1:]) for row in rows]) - target, axis=1)
+        nearest = np.argsort(distances)[:PREDICT_K]
+        return [(ids[i], float(distances[i])) for i in nearest if distances[i] <= PREDICT_MAX_DISTANCE]
+
+    def predict(self, features: Dict[str, float], engine: str,
+                candidates: List[Candidate]) -> Tuple[Optional[int], float]:
+        """
+        Indice (en candidates) de la configuracion que gano en los vecinos mas
+        cercanos y la fraccion de votos que obtuvo; (None, 0.0) si no hay
+        suficientes datos. Votos ponderados por 1 / distancia.
+        """
+        keys = [config_key(c) for c in candidates]
+        try:
+            with closing(self._connect()) as conn:
+                neighbours = self._neighbours(conn, features, engine)
+                votes: Dict[Optional[str], float] = {}
+                for document_id, distance in neighbours:
+                    row = conn.execute(
+                        "SELECT config FROM outcomes WHERE document_id = ? AND engine = ? AND score IS NOT NULL "
+                        "ORDER BY score DESC LIMIT 1",
+                        (document_id, engine),
+                    ).fetchone()
+                    # Un vecino donde nada sirvio vota por "ninguno"
+                    winner = row[0] if row else None
+                    votes[winner] = votes.get(winner, 0.0) + 1.0 / (distance + 0.05)
+        except (OSError, sqlite3.Error):
+            logger.exception("No se pudo consultar el historial de compresion en %s", self.path)
+            return None, 0.0
+        total = sum(votes.values())
+        best = max((k for k in votes if k in keys), key=votes.get, default=None)
+        if best is None or total == 0:
+            return None, 0.0
+        return keys.index(best), votes[best] / total
+
+    def explore_now(self) -> bool:
+        """True cada PREDICT_EXPLORE_EVERY documentos: se prueba sin prediccion."""
+        if PREDICT_EXPLORE_EVERY <= 0:
+            return False
+        try:
+            with closing(self._connect()) as conn:
+                (count,) = conn.execute("SELECT COUNT(*) FROM documents").fetchone()
+        except (OSError, sqlite3.Error):
+            return False
+        return count % PREDICT_EXPLORE_EVERY == PREDICT_EXPLORE_EVERY - 1
+
+
+compression_history = CompressionHistory()
@@ -0,0 +1,445 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+from fastapi import HTTPException
+
+from services.result_cache import cached
+from services.pdf_quality import ReferenceRender
+from services.compress_fanout import (COMPRESS_FANOUT, COMPRESS_GOAL_QUALITY, COMPRESS_GOAL_RATIO, COMPRESS_SEARCH,
+                                      DeadlineExceeded, FAILED, LOW_QUALITY, PASSED, TOO_BIG, fan_out,
+                                      search_levels)
+from services.compress_engines import ENGINES, Candidate
+from services.compress_cost import classify_pdf, cost_model
+from services.pdf_analyzer import ANALYZER_VERSION, PREFLIGHT_ENABLED, analyze_pdf
+from services.compress_target import compress_to_size
+from services.compress_history import HISTORY_ENABLED, PREDICT_CONFIDENCE, compression_history, document_features
+
+# --- Configuración (variables de entorno) ---
+# Presupuesto de tiempo por defecto de una compresion, en segundos (vacio = sin limite)
+COMPRESS_DEADLINE = float(os.getenv("PDFTOOLS_COMPRESS_DEADLINE") or 0) or None
+# Motor por defecto: un nombre de ENGINES, "remote" (= stirling) o "auto"
+COMPRESS_ENGINE = os.getenv("PDFTOOLS_COMPRESS_ENGINE", "remote")
+# Motores que el modo auto puede elegir (el modelo de costo decide cuales se prueban)
+AUTO_ENGINES = [e.strip() for e in os.getenv("PDFTOOLS_COMPRESS_AUTO_ENGINES", "stirling,local,rasterize").split(",") if e.strip()]
+ENGINE_ALIASES = {"remote": "stirling"}
+
+
+class CompressionScoring:
+    """
+    Puntaje comun a todos los motores: quality_weight * SSIM (peor pagina
+    muestreada) + size_weight * reduccion de tamaño. Un candidato que no
+    reduce el tamaño o queda por debajo de min_quality se descarta, y para
+    ganar debe superar al original (SSIM 1, sin reduccion).
+    """
+
+    def __init__(self, quality_weight: float = 0.7, size_weight: float = 0.3, min_quality: float = 0.0):
+        self.quality_weight = quality_weight
+        self.size_weight = size_weight
+        self.min_quality = min_quality
+
+    def score(self, quality: float, size_ratio: float) -> float:
+        return (quality * self.quality_weight) + ((1 - size_ratio) * self.size_weight)
+
+    @property
+    def baseline(self) -> float:
+        return self.score(1.0, 1.0)
+
+    def params(self) -> Dict[str, float]:
+        return {'quality_weight': self.quality_weight, 'size_weight': self.size_weight,
+                'min_quality': self.min_quality}
+
+
+DEFAULT_SCORING = CompressionScoring()
+
+
+def measure_candidate(reference: Optional[ReferenceRender], original_size: int, candidate: Candidate,
+                      file_content: bytes) -> Dict[str, Any]:
+    """
+    Tamaño relativo y SSIM (peor pagina muestreada) de un PDF comprimido.
+    quality es None si no se midio: el candidato no reduce el tamaño o no se
+    pudo renderizar.
+    """
+    measurement = {'engine': candidate['engine'], 'config': candidate, 'pdf': file_content,
+                   'quality': None, 'page_scores': None, 'size_ratio': len(file_content) / original_size}
+    if measurement['size_ratio'] >= 1:
+        return measurement
+    if reference:
+        try:
+            evaluation = reference.score(file_content)
+        except Exception as e:
+            logging.warning(f"Candidato {candidate}: no se pudo renderizar: {e}")
+            return measurement
+        # La peor pagina muestreada decide: una pagina dañada no se promedia
+        measurement['quality'] = evaluation['min']
+        measurement['page_scores'] = evaluation['pages']
+    else:
+        measurement['quality'] = 1.0
+    return measurement
+
+
+def accept_candidate(measurement: Dict[str, Any],
+                     scoring: CompressionScoring = DEFAULT_SCORING) -> Optional[Dict[str, Any]]:
+    """Agrega el puntaje a una medicion, o None si el candidato se descarta."""
+    candidate = measurement['config']
+    if measurement['size_ratio'] >= 1:
+        logging.info(f"Candidato {candidate} descartado: no mejora tamaño.")
+        return None
+    quality = measurement['quality']
+    if quality is None:
+        return None
+    if quality < scoring.min_quality:
+        logging.info(f"Candidato {candidate} descartado por SSIM bajo ({round(quality, 4)}).")
+        return None
+    return {**measurement, 'score': scoring.score(quality, measurement['size_ratio'])}
+
+
+def score_candidate(reference: Optional[ReferenceRender], original_size: int, candidate: Candidate,
+                    file_content: bytes, scoring: CompressionScoring = DEFAULT_SCORING) -> Optional[Dict[str, Any]]:
+    """
+    Puntua un PDF comprimido contra la referencia. Retorna el resultado o None
+    si el candidato se descarta.
+    """
+    return accept_candidate(measure_candidate(reference, original_size, candidate, file_content), scoring)
+
+
+def resolve_engines(engine: Optional[str]) -> Optional[List[str]]:
+    """
+    Motores pedidos por nombre (None = COMPRESS_ENGINE). Retorna None para
+    "auto", que delega la eleccion en el modelo de costo.
+    """
+    name = (engine or COMPRESS_ENGINE).lower()
+    name = ENGINE_ALIASES.get(name, name)
+    if name == "auto":
+        return None
+    if name not in ENGINES:
+        options = ", ".join(list(ENGINES) + list(ENGINE_ALIASES) + ["auto"])
+        raise HTTPException(status_code=400, detail=f"Motor de compresion desconocido: {engine}. Opciones: {options}")
+    if not ENGINES[name].configured():
+        raise HTTPException(status_code=503, detail=f"El motor de compresion {name} no esta configurado en el servidor.")
+    return [name]
+
+
+def compress_search(
+    pdf_bytes: bytes,
+    engines: Optional[List[str]] = None,
+    scoring: CompressionScoring = DEFAULT_SCORING,
+    max_parallel: int = COMPRESS_FANOUT,
+    goal_quality: float = COMPRESS_GOAL_QUALITY,
+    goal_ratio: float = COMPRESS_GOAL_RATIO,
+    search: str = COMPRESS_SEARCH,
+    analysis: Optional[Dict[str, Any]] = None,
+    deadline: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Prueba los candidatos de los motores dados (None = los de AUTO_ENGINES que
+    el modelo de costo considera probables ganadores para la clase del
+    documento) y retorna el mejor resultado, o None si ninguno supera al
+    original. El primero con calidad >= goal_quality y tamaño <= goal_ratio
+    cancela el resto.
+
+    search="sweep" pide todos los candidatos en paralelo (hasta max_parallel).
+    search="adaptive" aprovecha que los candidatos de cada motor van de menos
+    a mas agresivo: busqueda binaria por motor, subiendo mientras la calidad
+    alcanza goal_quality, asi que los niveles que no pueden ganar no se piden.
+    Las observaciones de cada motor (incluidas las llamadas ahorradas)
+    alimentan el modelo de costo. analysis (services.pdf_analyzer), si se
+    tiene, evita volver a inspeccionar el PDF para clasificarlo.
+
+    Con el historial (services.compress_history) activo, cada candidato
+    probado se guarda con las features del documento y el nivel que gano en
+    los documentos mas parecidos se prueba primero; si la prediccion es
+    confiable se prueba solo ese nivel, y el resto de la cadena unicamente si
+    no alcanza goal_quality.
+
+    deadline (hora absoluta, time.time()) corta la busqueda: se queda con el
+    mejor resultado evaluado hasta entonces. Retorna {"best": resultado o
+    None, "abandoned": candidatos cancelados, "deadline_reached": bool}.
+    """
+    original_size = len(pdf_bytes)
+    if analysis is None and HISTORY_ENABLED:
+        try:
+            analysis = analyze_pdf(pdf_bytes)
+        except Exception as e:
+            logging.warning(f"No se pudo analizar el PDF para el historial: {e}")
+    doc_class = classify_pdf(pdf_bytes, analysis)
+    if engines is None:
+        offered = [e for e in AUTO_ENGINES if e in ENGINES and ENGINES[e].suitable(original_size)]
+        engines = cost_model.select(offered, doc_class)
+    logging.info(f"Compresion de documento {doc_class}: motores {engines}")
+    if deadline is not None and time.time() >= deadline:
+        # El analisis (o la espera en el pool) ya consumio el presupuesto: ni el render de referencia
+        logging.info("Deadline alcanzado antes de probar candidatos; se retorna el original.")
+        return {'best': None, 'abandoned': [], 'deadline_reached': True}
+
+    # Las paginas de referencia se renderizan una sola vez para todos los candidatos, en
+    # paralelo con los primeros pedidos: el render tambien corre contra el deadline
+    reference: Future = Future()
+
+    def render_reference() -> None:
+        try:
+            reference.set_result(ReferenceRender(pdf_bytes, deadline=deadline))
+        except DeadlineExceeded as e:
+            # Sin referencia no se puntua: los candidatos que la esperan tambien cortan
+            reference.set_exception(e)
+        except Exception:
+            reference.set_result(None)
+
+    threading.Thread(target=render_reference, name="compress-reference", daemon=True).start()
+
+    # Candidatos de cada motor, de menos a mas agresivo
+    chains = {name: ENGINES[name].candidates() for name in engines}
+    candidates = [c for chain in chains.values() for c in chain]
+    observations: Dict[str, dict] = {}
+    observations_lock = threading.Lock()
+    # Lo medido de cada candidato probado, para el historial
+    outcomes: List[Dict[str, Any]] = []
+    latencies: Dict[int, float] = {}
+
+    def observe(engine: str, latency: Optional[float] = None, result: Optional[Dict[str, Any]] = None,
+                call: bool = False) -> None:
+        # Costo del motor = suma de sus candidatos; ganancia = su mejor candidato
+        with observations_lock:
+            obs = observations.setdefault(engine, {'latency': 0.0, 'size_ratio': None, 'quality': None,
+                                                   'calls': 0, 'calls_saved': 0, 'completed': 0})
+            obs['calls'] += int(call)
+            if latency is not None:
+                obs['latency'] += latency
+                obs['completed'] += 1
+            if result and (obs['size_ratio'] is None or result['size_ratio'] < obs['size_ratio']):
+                obs['size_ratio'] = result['size_ratio']
+                obs['quality'] = result['quality']
+
+    async def fetch(candidate):
+        # Un candidato cancelado no se registra: no se sabe cuanto habria tardado
+        observe(candidate['engine'], call=True)
+        start = time.monotonic()
+        try:
+            data = await ENGINES[candidate['engine']].fetch(pdf_bytes, candidate, deadline)
+        except DeadlineExceeded:
+            raise
+        except Exception:
+            observe(candidate['engine'], time.monotonic() - start)
+            raise
+        latencies[id(candidate)] = time.monotonic() - start
+        observe(candidate['engine'], latencies[id(candidate)])
+        return data
+
+    # Medicion de cada candidato evaluado (tambien de los descartados), para verdict
+    measurements: Dict[int, Dict[str, Any]] = {}
+
+    def evaluate(candidate, file_content):
+        measurement = measure_candidate(reference.result(), original_size, candidate, file_content)
+        measurements[id(candidate)] = measurement
+        result = accept_candidate(measurement, scoring)
+        observe(candidate['engine'], result=result)
+        with observations_lock:
+            outcomes.append({'candidate': candidate, 'result_size': len(file_content),
+                             'ssim': measurement['quality'], 'score': result['score'] if result else None,
+                             'latency': latencies.get(id(candidate)), 'won': False})
+        return result
+
+    def passes(result):
+        return result is not None and result['quality'] >= goal_quality
+
+    def verdict(candidate, file_content, result):
+        # "No achica" y "SSIM bajo" mueven la busqueda en sentidos opuestos
+        measurement = measurements.get(id(candidate))
+        if file_content is None or measurement is None:
+            return FAILED
+        if measurement['size_ratio'] >= 1:
+            return TOO_BIG
+        if measurement['quality'] is None:
+            return FAILED
+        return PASSED if passes(result) else LOW_QUALITY
+
+    def goal(result):
+        return result['quality'] >= goal_quality and result['size_ratio'] <= goal_ratio
+
+    def expired() -> bool:
+        return deadline is not None and time.time() >= deadline
+
+    def run(run_chains: Dict[str, List[Candidate]], starts: Dict[str, int]):
+        if search == "adaptive":
+            found, dropped, _ = search_levels(list(run_chains.values()), fetch, evaluate, verdict, goal,
+                                              max_parallel, [starts.get(name) for name in run_chains], deadline)
+            return found, dropped
+        # En el barrido el candidato sugerido sale primero
+        ordered = []
+        for name, chain in run_chains.items():
+            first = starts.get(name)
+            ordered += chain if first is None else [chain[first]] + chain[:first] + chain[first + 1:]
+        return fan_out(ordered, fetch, evaluate, goal, max_parallel, deadline)
+
+    # Prediccion del historial: nivel con el que empezar cada motor
+    features = document_features(analysis) if HISTORY_ENABLED and analysis else None
+    predicted: Dict[str, Dict[str, Any]] = {}
+    if features and not compression_history.explore_now():
+        for name, chain in chains.items():
+            index, share = compression_history.predict(features, name, chain)
+            if index is not None:
+                predicted[name] = {'index': index, 'share': round(share, 3), 'only': share >= PREDICT_CONFIDENCE}
+    if predicted:
+        logging.info(f"Niveles sugeridos por el historial: {predicted}")
+
+    first_chains = {name: [chain[predicted[name]['index']]] if predicted.get(name, {}).get('only') else chain
+                    for name, chain in chains.items()}
+    starts = {name: p['index'] for name, p in predicted.items() if not p['only']}
+    results, abandoned = run(first_chains, starts)
+    # Si el nivel predicho no alcanza la calidad, se buscan los mas conservadores
+    fallback = {}
+    if not any(goal(r) for r in results) and not expired():
+        for name, p in predicted.items():
+            tried = chains[name][p['index']]
+            if p['only'] and not any(passes(r) for r in results if r['config'] is tried) and p['index'] > 0:
+                fallback[name] = chains[name][:p['index']]
+    if fallback:
+        logging.info(f"Prediccion sin calidad suficiente; se prueban niveles anteriores de {list(fallback)}")
+        more, more_abandoned = run(fallback, {})
+        results += more
+        abandoned += more_abandoned
+    deadline_reached = expired()
+    if abandoned:
+        logging.info(f"Candidatos cancelados: {abandoned}")
+    calls = 0
+    for name, obs in observations.items():
+        obs['calls_saved'] = len(chains[name]) - obs['calls']
+        calls += obs['calls']
+    calls_saved = len(candidates) - calls
+    logging.info(f"Busqueda {search}: {calls} de {len(candidates)} candidatos pedidos ({calls_saved} ahorrados)")
+
+    best = max(results, key=lambda r: r['score'], default=None)
+    if best is not None and best['score'] <= scoring.baseline:
+        best = None
+    # Un motor con todos sus pedidos cancelados no dice nada de su costo
+    completed = {name: obs for name, obs in observations.items() if obs['completed']}
+    cost_model.record(doc_class, completed, best['engine'] if best else None)
+    if features:
+        for outcome in outcomes:
+            outcome['won'] = best is not None and outcome['candidate'] is best['config']
+        compression_history.record(features, doc_class, outcomes)
+    if best:
+        best['calls_saved'] = calls_saved
+        best['predicted'] = predicted.get(best['engine'])
+        logging.info(f"Mejor candidato: {best['config']} (SSIM {round(best['quality'], 4)}, "
+                     f"tamaño {round(best['size_ratio'] * 100, 1)}%)")
+    if deadline_reached:
+        logging.info(f"Deadline alcanzado: se retorna el mejor de {len(results)} candidatos evaluados.")
+    return {'best': best, 'abandoned': abandoned, 'deadline_reached': deadline_reached}
+
+
+def compress_best(
+    pdf_bytes: bytes,
+    engines: Optional[List[str]] = None,
+    scoring: CompressionScoring = DEFAULT_SCORING,
+    max_parallel: int = COMPRESS_FANOUT,
+    goal_quality: float = COMPRESS_GOAL_QUALITY,
+    goal_ratio: float = COMPRESS_GOAL_RATIO,
+    search: str = COMPRESS_SEARCH,
+    analysis: Optional[Dict[str, Any]] = None,
+    deadline: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    """compress_search sin el reporte: el mejor resultado o None."""
+    return compress_search(pdf_bytes, engines, scoring, max_parallel, goal_quality, goal_ratio, search,
+                           analysis, deadline)['best']
+
+
+def deadline_from_budget(seconds: Optional[float], start: Optional[float] = None) -> Optional[float]:
+    """Hora absoluta (time.time()) a seconds de start (por defecto ahora); None si no hay presupuesto."""
+    if seconds is None:
+        seconds = COMPRESS_DEADLINE
+    if not seconds or seconds <= 0:
+        return None
+    return (time.time() if start is None else start) + seconds
+
+
+def _check_pdf(pdf_bytes: bytes) -> None:
+    # Sin esto un archivo que no es PDF "no se achica" y vuelve tal cual con 200
+    try:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            page_count = doc.page_count
+    except fitz.FileDataError:
+        page_count = 0
+    if not page_count:
+        raise HTTPException(status_code=400, detail="El archivo no es un PDF valido.")
+
+
+def compress_pdf_report(
+    pdf_bytes: bytes,
+    max_parallel: int = COMPRESS_FANOUT,
+    goal_quality: float = COMPRESS_GOAL_QUALITY,
+    goal_ratio: float = COMPRESS_GOAL_RATIO,
+    engine: Optional[str] = None,
+    scoring: CompressionScoring = DEFAULT_SCORING,
+    deadline: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Comprime el PDF con el motor pedido ("auto" = elegidos por el modelo de
+    costo) y retorna el mejor resultado, o los bytes originales si ninguna
+    configuración lo mejora o si el analisis previo indica que el PDF ya esta
+    optimizado. El resultado se guarda en la cache por contenido + parametros.
+
+    Con max_bytes se usa el modo de tamaño objetivo (services.compress_target):
+    el resultado de mayor SSIM que entra en max_bytes; engine None o "auto"
+    usa los motores de TARGET_ENGINES.
+
+    deadline (hora absoluta, time.time(); ver deadline_from_budget) retorna el
+    mejor candidato evaluado al llegar la hora. Un resultado cortado por el
+    deadline no se guarda en la cache. Retorna (pdf, reporte) con reporte =
+    {"engine", "abandoned", "deadline_reached"} y, con max_bytes, "met" y
+    "size".
+    """
+    _check_pdf(pdf_bytes)
+    if max_bytes is not None:
+        if max_bytes <= 0:
+            raise HTTPException(status_code=400, detail="max_bytes debe ser mayor que 0.")
+        engines = resolve_engines(engine) if engine else None
+        params = {'engines': engines or 'auto', 'max_bytes': max_bytes, 'analyzer': ANALYZER_VERSION}
+    else:
+        engines = resolve_engines(engine)
+        params = {'engines': engines or 'auto', 'goal_quality': goal_quality, 'goal_ratio': goal_ratio,
+                  'analyzer': ANALYZER_VERSION, **scoring.params()}
+    report: Dict[str, Any] = {'engine': None, 'abandoned': [], 'deadline_reached': False}
+
+    def analyze() -> Optional[Dict[str, Any]]:
+        if not PREFLIGHT_ENABLED:
+            return None
+        try:
+            return analyze_pdf(pdf_bytes)
+        except Exception as e:
+            logging.warning(f"No se pudo analizar el PDF antes de comprimir: {e}")
+            return None
+
+    def compute() -> bytes:
+        analysis = analyze()
+        if analysis and analysis['optimized']:
+            logging.info("El PDF ya esta optimizado; se omite la compresion.")
+            return pdf_bytes
+        outcome = compress_search(pdf_bytes, engines, scoring, max_parallel, goal_quality, goal_ratio,
+                                  analysis=analysis, deadline=deadline)
+        best = outcome['best']
+        report.update(engine=best['engine'] if best else None, abandoned=outcome['abandoned'],
+                      deadline_reached=outcome['deadline_reached'])
+        return best['pdf'] if best else pdf_bytes
+
+    def compute_to_size() -> bytes:
+        # Un PDF "optimizado" igual puede no entrar en el presupuesto: aqui no se omite
+        outcome = compress_to_size(pdf_bytes, max_bytes, engines, analyze(), deadline)
+        report.update(engine=outcome['engine'], abandoned=outcome['abandoned'],
+                      deadline_reached=outcome['deadline_reached'])
+        return outcome['pdf']
+
+    if max_bytes is not None:
+        data = cached('compress_to_size', [pdf_bytes], params, compute_to_size,
+                      store=lambda: not report['deadline_reached'])
+        # Tambien vale para un resultado de la cache
+        report.update(met=len(data) <= max_bytes, size=len(data))
+    else:
+        data = cached('compress', [pdf_bytes], params, compute, store=lambda: not report['deadline_reached'])
+    return data, report
+
@@ -1,121 +1,35 @@
-import requests
 import base64
-from pathlib import Path
-from PIL import Image
-import numpy as np
-import cv2
-from skimage.metrics import structural_similarity as ssim
 import logging
 from collections import deque
 
+from services.result_cache import sha256_bytes
+from services.compress_fanout import COMPRESS_FANOUT, COMPRESS_GOAL_RATIO
+from services.compress_orchestrator import CompressionScoring, compress_best
+# Compatibilidad: el cliente de iLoveAPI vive en services.ilove_client
+from services.ilove_client import compress_with_iloveapi, ilove_configured  # noqa: F401
+
 # --- Configuración ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-STIRLING_URL = "http://192.168.2.33:30124/api/v1/misc/compress-pdf"
-
-# Configuración de iLoveAPI
-ILOVE_PUBLIC_ID = "project_public_7cd9c1513df09dae5356d8c2ef023c98_02MuH9b7e2c9aa9575637cbf561dd58c10ab5"
-ILOVE_SECRET_KEY = "secret_key_6bb2af0a1711a7d015914de99acefae9_Bmby9635e747898f9c4b1daa92e2f4ef78ad7"
-ILOVE_API_BASE = "https://api.iloveapi.com/v1"  # Ajusta al endpoint correcto de tu cuenta
 
-# Historial de los últimos 5 Base64
-last_5_base64 = deque(maxlen=5)
+# Historial (SHA-256) de los últimos 5 PDFs recibidos
+last_5_digests = deque(maxlen=5)
 
-# --- Funciones auxiliares ya definidas previamente ---
-def extract_image_from_pdf(pdf_bytes: bytes, page_number: int = 0, dpi: int = 150) -> Image.Image | None:
-    try:
-        import pypdfium2 as pdfium
-        pdf = pdfium.PdfDocument(pdf_bytes)
-        if page_number >= len(pdf):
-            logging.warning(f"El PDF tiene menos de {page_number + 1} páginas. Usando la primera.")
-            page_number = 0
-        renderer = pdf.render(
-            pdfium.PdfBitmap.to_pil,
-            page_indices=[page_number],
-            scale=dpi/72,
-        )
-        return next(renderer)
-    except Exception as e:
-        logging.error(f"Error al extraer la imagen del PDF: {e}")
-        return None
-
-def calculate_quality_score(
-    original_image: Image.Image,
-    compressed_image: Image.Image,
-    original_size: int,
-    compressed_size: int,
-    quality_weight: float = 0.7,
-    size_weight: float = 0.3
-) -> float:
-    if original_image is None or compressed_image is None:
-        return -1.0
-    if original_image.size != compressed_image.size:
-        compressed_image = compressed_image.resize(original_image.size, Image.Resampling.LANCZOS)
-    gray_orig = cv2.cvtColor(np.array(original_image.convert("RGB")), cv2.COLOR_RGB2GRAY)
-    gray_comp = cv2.cvtColor(np.array(compressed_image.convert("RGB")), cv2.COLOR_RGB2GRAY)
-    ssim_score = ssim(gray_orig, gray_comp, data_range=255)
-    size_reduction_score = (original_size - compressed_size) / original_size if original_size > 0 else 0.0
-    if size_reduction_score < 0:
-        return -1.0
-    return (ssim_score * quality_weight) + (size_reduction_score * size_weight)
-
-# --- Función para usar iLoveAPI compress PDF ---
-
-def compress_with_iloveapi(pdf_bytes: bytes, compression_level: str = "recommended") -> bytes | None:
-    """
-    Flujo correcto: Start → Upload → Process → Download
-    compression_level: "low" | "recommended" | "extreme"
-    """
-    try:
-        # 1. START TASK
-        start_url = f"{ILOVE_API_BASE}/start/compress"
-        resp_start = requests.get(start_url, auth=(ILOVE_PUBLIC_ID, ILOVE_SECRET_KEY), timeout=30)
-        resp_start.raise_for_status()
-        task_data = resp_start.json()
-        server = task_data["server"]
-        task_id = task_data["task"]
-
-        # 2. UPLOAD FILE
-        upload_url = f"https://{server}/upload"
-        files = {
-            "file": ("input.pdf", pdf_bytes, "application/pdf")
-        }
-        data = {"task": task_id}
-        resp_upload = requests.post(upload_url, files=files, data=data, timeout=120)
-        resp_upload.raise_for_status()
-        upload_info = resp_upload.json()
-        server_filename = upload_info["server_filename"]
-
-        # 3. PROCESS
-        process_url = f"https://{server}/process"
-        process_data = {
-            "task": task_id,
-            "tool": "compress",
-            "compression_level": compression_level,
-            "files": [server_filename],
-        }
-        resp_process = requests.post(process_url, data=process_data, timeout=120)
-        resp_process.raise_for_status()
-
-        # 4. DOWNLOAD
-        download_url = f"https://{server}/download/{task_id}"
-        resp_download = requests.get(download_url, timeout=120)
-        resp_download.raise_for_status()
-
-        return resp_download.content
-
-    except Exception as e:
-        logging.error(f"Error en flujo iLoveAPI: {e}")
-        return None
-    
 # --- Función principal ajustada ---
 def find_best_pdf_compression(
     pdf_path: str | None = None,
     pdf_base64: str | None = None,
-    min_ssim_threshold: float = 0.98,
+    min_ssim_threshold: float = 0.987,
     quality_weight: float = 0.8,
-    size_weight: float = 0.2
+    size_weight: float = 0.2,
+    max_parallel: int = COMPRESS_FANOUT,
+    goal_ratio: float = COMPRESS_GOAL_RATIO,
 ) -> tuple[str, float] | None:
-
+    """
+    Comprime con el orquestador (services.compress_orchestrator) usando los
+    pesos y el umbral de SSIM de esta funcion. Un PDF repetido entre los
+    ultimos 5 se manda a iLoveAPI; el resto a Stirling.
+    Retorna (PDF en base64, tamaño en KB) o None si no se pudo leer el PDF.
+    """
     if not (pdf_base64 or pdf_path):
         logging.error("Debe proporcionar 'pdf_path' o 'pdf_base64'.")
         return None
@@ -130,81 +44,26 @@ def find_best_pdf_compression(
     except Exception as e:
         logging.error(f"Error leyendo PDF: {e}")
         return None
-        
-    # Normalizar Base64 para la comparación en el historial
-    if pdf_base64:
-        base64_to_check = pdf_base64.replace("\n", "").replace("\r", "")
-    else:
-        base64_to_check = base64.b64encode(original_pdf_bytes).decode("utf-8")
-    
-    # Verificar duplicados en los últimos 5
-    if base64_to_check in last_5_base64:
-        logging.info("⚠️ PDF repetido detectado. Usando iLoveAPI compress.")
-        compressed_pdf_bytes = compress_with_iloveapi(original_pdf_bytes, compression_level="recommended")
-        if compressed_pdf_bytes is None:
-            return None
-        final_base64 = base64.b64encode(compressed_pdf_bytes).decode("utf-8")
-        final_size_kb = round(len(compressed_pdf_bytes) / 1024, 2)
-        return final_base64, final_size_kb
-    else:
-        last_5_base64.append(base64_to_check)
-
-    # Si no es repetido, seguir con Stirling como antes
-    original_size = len(original_pdf_bytes)
-    original_image = extract_image_from_pdf(original_pdf_bytes)
-    if not original_image:
-        logging.error("No se pudo extraer una imagen del PDF original.")
-        return None
 
-    best_pdf_bytes = original_pdf_bytes
-    best_size = original_size
-    best_score = calculate_quality_score(original_image, original_image, original_size, original_size, quality_weight, size_weight)
-    logging.info(f"Original: tamaño={round(original_size/1024,2)} KB, puntaje base={round(best_score,4)}")
+    # El historial guarda hashes del contenido, no el PDF completo
+    digest_to_check = sha256_bytes(original_pdf_bytes)
 
-    compression_levels = [1, 3, 5, 7]
-    for level in compression_levels:
-        logging.info(f"--- Probando nivel Stirling: {level} ---")
-        try:
-            files = {"file": ("input.pdf", original_pdf_bytes, "application/pdf")}
-            headers = {"X-API-KEY": API_KEY_STIRLING}
-            params = {"level": level}
-            resp = requests.post(STIRLING_URL, files=files, headers=headers, params=params, timeout=60)
-            resp.raise_for_status()
-            compressed_pdf_bytes = resp.content
-            compressed_size = len(compressed_pdf_bytes)
-
-            if compressed_size >= best_size:
-                logging.warning(f"Nivel {level} descartado. No mejora tamaño.")
-                continue
-
-            compressed_image = extract_image_from_pdf(compressed_pdf_bytes)
-            if not compressed_image:
-                continue
-
-            gray_orig = cv2.cvtColor(np.array(original_image.convert("RGB")), cv2.COLOR_RGB2GRAY)
-            gray_comp = cv2.cvtColor(np.array(compressed_image.resize(original_image.size, Image.Resampling.LANCZOS)).convert("RGB"), cv2.COLOR_RGB2GRAY)
-            ssim_value = ssim(gray_orig, gray_comp, data_range=255)
-            logging.info(f"Nivel {level}: tamaño={round(compressed_size/1024,2)} KB, SSIM={round(ssim_value,4)}")
-
-            if ssim_value < min_ssim_threshold:
-                logging.warning(f"Nivel {level} descartado por SSIM bajo.")
-                continue
-
-            current_score = calculate_quality_score(original_image, compressed_image, original_size, compressed_size, quality_weight, size_weight)
-            logging.info(f"Nivel {level}: puntaje final={round(current_score,4)}")
-
-            if current_score > best_score:
-                logging.info(f"Mejor resultado encontrado en nivel {level}")
-                best_score = current_score
-                best_pdf_bytes = compressed_pdf_bytes
-                best_size = compressed_size
+    # Verificar duplicados en los últimos 5
+    engines = ["stirling"]
+    if digest_to_check in last_5_digests:
+        if ilove_configured():
+            logging.info("⚠️ PDF repetido detectado. Usando iLoveAPI compress.")
+            engines = ["ilove"]
+    else:
+        last_5_digests.append(digest_to_check)
 
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error de red Stirling en nivel {level}: {e}")
-        except Exception as e:
-            logging.error(f"Error inesperado en nivel {level}: {e}")
+    scoring = CompressionScoring(quality_weight, size_weight, min_ssim_threshold)
+    # El objetivo es solo de tamaño: el umbral de SSIM ya descarta los candidatos malos
+    best = compress_best(original_pdf_bytes, engines, scoring, max_parallel,
+                         goal_quality=min_ssim_threshold, goal_ratio=goal_ratio)
+    best_pdf_bytes = best["pdf"] if best else original_pdf_bytes
 
     final_base64 = base64.b64encode(best_pdf_bytes).decode("utf-8")
-    final_size_kb = round(best_size / 1024, 2)
-    logging.info(f"Decisión final: tamaño={final_size_kb} KB, puntaje={round(best_score,4)}")
+    final_size_kb = round(len(best_pdf_bytes) / 1024, 2)
+    logging.info(f"Decisión final: tamaño={final_size_kb} KB")
     return final_base64, final_size_kb
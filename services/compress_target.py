@@ -0,0 +1,245 @@
+import os
+import math
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from services.compress_engines import ENGINES, Candidate
+from services.compress_fanout import COMPRESS_FANOUT, DeadlineExceeded, remaining_time, run_search
+from services.local_compress import DPI_TOLERANCE, LOCAL_MIN_IMAGE_BYTES
+from services.mergencompress import RASTER_SCALE
+from services.pdf_quality import ReferenceRender
+
+# --- Configuración (variables de entorno) ---
+# Motores que prueba el modo de tamaño objetivo si no se pide uno
+TARGET_ENGINES = [e.strip() for e in os.getenv("PDFTOOLS_TARGET_ENGINES", "stirling,local").split(",") if e.strip()]
+# Pedidos como maximo por motor
+TARGET_MAX_PROBES = int(os.getenv("PDFTOOLS_TARGET_MAX_PROBES", "5"))
+# Un resultado entre TARGET_TOLERANCE * presupuesto y el presupuesto ya esta "justo debajo"
+TARGET_TOLERANCE = float(os.getenv("PDFTOOLS_TARGET_TOLERANCE", "0.9"))
+
+# Escaleras de configuraciones, de menos a mas agresiva (tamaño y calidad decrecen)
+STIRLING_TARGET_LEVELS = list(range(1, 10))
+LOCAL_TARGET_LADDER = [
+    (300, 90), (200, 85), (150, 80), (150, 70), (120, 70), (100, 65),
+    (100, 55), (85, 50), (72, 45), (72, 35), (60, 30), (50, 25),
+]
+RASTER_TARGET_SCALES = [1.0, 0.85, RASTER_SCALE, 0.6, 0.5, 0.4, 0.3]
+# Reduccion de tamaño por escalon que se supone antes de tener dos mediciones
+DEFAULT_STEP_RATIO = 0.75
+# Error del modelo (en log) a partir del cual la siguiente prueba es por biseccion
+MODEL_MAX_ERROR = math.log(2)
+
+
+def target_ladder(engine: str, pdf_size: int, max_bytes: int) -> List[Candidate]:
+    """Candidatos de engine ordenados de menos a mas agresivo para el modo de tamaño objetivo."""
+    if engine == "stirling":
+        # expectedOutputSize = el presupuesto (ver compress_engines._compress_fields)
+        ratio = min(1.0, max_bytes / pdf_size)
+        return [{'engine': engine, 'optimize_level': level, 'target_ratio': ratio} for level in STIRLING_TARGET_LEVELS]
+    if engine == "local":
+        return [{'engine': engine, 'target_dpi': dpi, 'jpeg_quality': quality} for dpi, quality in LOCAL_TARGET_LADDER]
+    if engine == "rasterize":
+        return [{'engine': engine, 'scale': scale} for scale in RASTER_TARGET_SCALES]
+    raise HTTPException(status_code=400, detail=f"El motor {engine} no admite compresion a un tamaño objetivo.")
+
+
+def _jpeg_bytes_per_pixel(quality: int) -> float:
+    # Aproximacion para escaneos y fotos en color (crece rapido sobre calidad 80)
+    return 0.03 + 0.4 * (quality / 100) ** 3
+
+
+def local_size_prior(analysis: Dict[str, Any], ladder: List[Candidate]) -> Tuple[float, List[float]]:
+    """
+    Modelo de tamaño del motor local a partir del analisis previo: parte fija
+    (lo que no se recomprime) y, por escalon, bytes estimados de las imagenes
+    reescaladas a target_dpi y recodificadas como JPEG. Si la recodificacion
+    no achica una imagen, el motor la deja como esta.
+    """
+    images = [img for img in analysis["images"] if img["bytes"] >= LOCAL_MIN_IMAGE_BYTES and img["bpc"] != 1]
+    fixed = max(0.0, analysis["size"] - sum(img["bytes"] for img in images))
+    variable = []
+    for candidate in ladder:
+        total = 0.0
+        for img in images:
+            scale = 1.0
+            if img["dpi"] > candidate["target_dpi"] * DPI_TOLERANCE:
+                scale = candidate["target_dpi"] / img["dpi"]
+            channels = 0.4 if "Gray" in (img["colorspace"] or "") else 1.0
+            estimate = img["width"] * img["height"] * scale ** 2 * _jpeg_bytes_per_pixel(candidate["jpeg_quality"]) * channels
+            total += min(img["bytes"], estimate)
+        variable.append(total)
+    return fixed, variable
+
+
+class SizeModel:
+    """
+    Tamaño estimado de cada escalon de una escalera. Con un modelo previo
+    (parte fija + variable) se calibra la parte variable con la ultima
+    medicion; sin el se interpola log(tamaño) entre las mediciones, tomando
+    el original como escalon -1.
+    """
+
+    def __init__(self, original_size: int, prior: Optional[Tuple[float, List[float]]] = None):
+        self.measured: Dict[int, int] = {-1: original_size}
+        self.prior = prior
+        self.scale = 1.0
+        # |log(medido / predicho)| de la ultima medicion
+        self.last_error = 0.0
+
+    def observe(self, index: int, size: int) -> None:
+        self.last_error = abs(math.log(max(size, 1) / max(self.predict(index), 1)))
+        self.measured[index] = size
+        if self.prior:
+            fixed, variable = self.prior
+            if variable[index] > 0 and size > fixed:
+                self.scale = (size - fixed) / variable[index]
+
+    def predict(self, index: int) -> float:
+        if index in self.measured:
+            return self.measured[index]
+        if self.prior:
+            fixed, variable = self.prior
+            return fixed + self.scale * variable[index]
+        points = sorted(self.measured)
+        below = [i for i in points if i < index]
+        above = [i for i in points if i > index]
+        if below and above:
+            a, b = below[-1], above[0]
+        elif len(below) >= 2:
+            a, b = below[-2], below[-1]
+        else:
+            # Un solo punto de referencia: pendiente por defecto
+            a = (below or above)[-1]
+            return self.measured[a] * DEFAULT_STEP_RATIO ** (index - a)
+        log_a, log_b = math.log(max(self.measured[a], 1)), math.log(max(self.measured[b], 1))
+        return math.exp(log_a + (log_b - log_a) * (index - a) / (b - a))
+
+
+def _next_probe(model: SizeModel, lo: int, hi: int, max_bytes: int) -> int:
+    # Primer escalon de (lo, hi) que el modelo pone bajo el presupuesto; si ninguno, el mas agresivo.
+    # Si el modelo acaba de errar por mas del doble, biseccion: asegura pocas pruebas igual
+    if model.last_error > MODEL_MAX_ERROR:
+        return (lo + hi) // 2
+    for index in range(lo + 1, hi):
+        if model.predict(index) <= max_bytes:
+            return index
+    return hi - 1
+
+
+async def _search_ladder(pdf_bytes: bytes, ladder: List[Candidate], max_bytes: int, model: SizeModel,
+                         semaphore: asyncio.Semaphore, state: Dict[str, Any], deadline: Optional[float] = None) -> None:
+    """
+    Busca el escalon menos agresivo con tamaño <= max_bytes. lo es el ultimo
+    escalon conocido por encima del presupuesto y hi el primero conocido por
+    debajo; el modelo de tamaño elige cada prueba dentro de (lo, hi).
+    """
+    engine = ENGINES[ladder[0]['engine']]
+    lo, hi = -1, len(ladder)
+    while hi - lo > 1 and state['probes'] < TARGET_MAX_PROBES:
+        index = _next_probe(model, lo, hi, max_bytes)
+        candidate = ladder[index]
+        state['in_flight'] = candidate
+        state['probes'] += 1
+        try:
+            async with semaphore:
+                data = await engine.fetch(pdf_bytes, candidate, deadline)
+        except DeadlineExceeded:
+            # Queda en in_flight: se reporta como abandonado
+            return
+        except Exception as e:
+            logging.warning(f"Candidato {candidate} fallido: {type(e).__name__}: {e!r}")
+            data = None
+        state['in_flight'] = None
+        if data is None:
+            # Sin resultado no se sabe el tamaño: se sigue con los mas agresivos
+            lo = index
+            continue
+        model.observe(index, len(data))
+        logging.info(f"Tamaño objetivo {max_bytes}: {candidate} -> {len(data)} bytes")
+        if state['smallest'] is None or len(data) < len(state['smallest']['pdf']):
+            state['smallest'] = {'config': candidate, 'pdf': data}
+        if len(data) > max_bytes:
+            lo = index
+            continue
+        hi = index
+        state['fit'] = {'config': candidate, 'pdf': data}
+        if len(data) >= max_bytes * TARGET_TOLERANCE:
+            break
+
+
+def compress_to_size(pdf_bytes: bytes, max_bytes: int, engines: Optional[List[str]] = None,
+                     analysis: Optional[Dict[str, Any]] = None, deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Comprime el PDF para que quede en max_bytes o menos con el mayor SSIM posible.
+
+    Cada motor (None = TARGET_ENGINES) recorre su escalera de configuraciones
+    (nivel de Stirling, DPI/calidad JPEG del motor local, escala de
+    rasterizado) buscando el escalon menos agresivo que entra en el
+    presupuesto, guiado por un modelo de tamaño en lugar de probar a ciegas.
+    Entre los motores que entran gana el de mayor SSIM. Los motores avanzan
+    en paralelo; deadline (hora absoluta, time.time()) corta la busqueda.
+
+    Retorna {"pdf", "engine", "config", "size", "quality", "met", "probes",
+    "abandoned", "deadline_reached"}. Si nada entra en el presupuesto, "met"
+    es False y "pdf" es el resultado mas chico (o el original).
+    """
+    original_size = len(pdf_bytes)
+    engines = engines or [e for e in TARGET_ENGINES if e in ENGINES]
+    ladders = {name: target_ladder(name, original_size, max_bytes) for name in engines}
+    report = {'pdf': pdf_bytes, 'engine': None, 'config': None, 'size': original_size, 'quality': 1.0,
+              'met': original_size <= max_bytes, 'probes': 0, 'abandoned': [], 'deadline_reached': False}
+    if report['met']:
+        return report
+
+    states = {name: {'probes': 0, 'in_flight': None, 'fit': None, 'smallest': None} for name in engines}
+
+    async def run() -> None:
+        semaphore = asyncio.Semaphore(max(1, COMPRESS_FANOUT))
+        tasks = []
+        for name, ladder in ladders.items():
+            prior = local_size_prior(analysis, ladder) if name == "local" and analysis else None
+            model = SizeModel(original_size, prior)
+            tasks.append(asyncio.create_task(_search_ladder(pdf_bytes, ladder, max_bytes, model, semaphore,
+                                                            states[name], deadline)))
+        _, pending = await asyncio.wait(tasks, timeout=remaining_time(deadline))
+        if pending:
+            logging.info("Deadline de compresion alcanzado; se cancelan los candidatos restantes.")
+            report['deadline_reached'] = True
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    run_search(run)
+    report['probes'] = sum(state['probes'] for state in states.values())
+    report['abandoned'] = [state['in_flight'] for state in states.values() if state['in_flight']]
+
+    fits = [state['fit'] for state in states.values() if state['fit']]
+    if len(fits) > 1 and report['deadline_reached']:
+        # Sin tiempo para renderizar: el mas grande que entra es el menos agresivo
+        fits.sort(key=lambda fit: len(fit['pdf']), reverse=True)
+    elif len(fits) > 1:
+        # El mejor de cada escalera ya es el menos agresivo que entra: entre motores decide el SSIM
+        try:
+            reference = ReferenceRender(pdf_bytes)
+            for fit in fits:
+                fit['quality'] = reference.score(fit['pdf'])['min']
+        except Exception as e:
+            logging.warning(f"No se pudo comparar la calidad de los candidatos: {e}")
+        fits.sort(key=lambda fit: (fit.get('quality') or 0.0, len(fit['pdf'])), reverse=True)
+    if fits:
+        chosen = fits[0]
+        report['met'] = True
+    else:
+        chosen = min((state['smallest'] for state in states.values() if state['smallest']),
+                     key=lambda smallest: len(smallest['pdf']), default=None)
+        if chosen is None or len(chosen['pdf']) >= original_size:
+            chosen = None
+    if chosen:
+        report.update(pdf=chosen['pdf'], engine=chosen['config']['engine'], config=chosen['config'],
+                      size=len(chosen['pdf']), quality=chosen.get('quality'))
+    logging.info(f"Tamaño objetivo {max_bytes}: {report['size']} bytes con {report['config']} "
+                 f"({report['probes']} pedidos, {'cumplido' if report['met'] else 'no cumplido'})")
+    return report
@@ -0,0 +1,87 @@
+import os
+import logging
+from typing import Optional
+
+import requests
+
+from services.compress_fanout import DeadlineExceeded, remaining_time
+
+# --- Configuración de iLoveAPI ---
+# Las credenciales solo vienen del entorno; sin ellas el motor "ilove" no esta disponible
+ILOVE_PUBLIC_ID = os.getenv("ILOVE_PUBLIC_ID")
+ILOVE_SECRET_KEY = os.getenv("ILOVE_SECRET_KEY")
+ILOVE_API_BASE = os.getenv("ILOVE_API_BASE", "https://api.iloveapi.com/v1")  # Ajusta al endpoint correcto de tu cuenta
+
+
+class ILoveNotConfiguredError(RuntimeError):
+    """Faltan ILOVE_PUBLIC_ID o ILOVE_SECRET_KEY."""
+
+
+def ilove_configured() -> bool:
+    return bool(ILOVE_PUBLIC_ID and ILOVE_SECRET_KEY)
+
+
+def _timeout(default: float, deadline: Optional[float]) -> float:
+    # Con deadline ningun paso espera mas alla de el
+    left = remaining_time(deadline)
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded("Deadline de compresion alcanzado")
+    return min(default, left)
+
+
+def compress_with_iloveapi(pdf_bytes: bytes, compression_level: str = "recommended",
+                           deadline: Optional[float] = None) -> Optional[bytes]:
+    """
+    Flujo correcto: Start → Upload → Process → Download
+    compression_level: "low" | "recommended" | "extreme"
+    deadline (hora absoluta, time.time()) acota el timeout de cada paso;
+    DeadlineExceeded si llega antes de terminar.
+    ILoveNotConfiguredError si no hay credenciales.
+    """
+    if not ilove_configured():
+        raise ILoveNotConfiguredError("iLoveAPI no esta configurada: defina ILOVE_PUBLIC_ID e ILOVE_SECRET_KEY.")
+    try:
+        # 1. START TASK
+        start_url = f"{ILOVE_API_BASE}/start/compress"
+        resp_start = requests.get(start_url, auth=(ILOVE_PUBLIC_ID, ILOVE_SECRET_KEY), timeout=_timeout(30, deadline))
+        resp_start.raise_for_status()
+        task_data = resp_start.json()
+        server = task_data["server"]
+        task_id = task_data["task"]
+
+        # 2. UPLOAD FILE
+        upload_url = f"https://{server}/upload"
+        files = {
+            "file": ("input.pdf", pdf_bytes, "application/pdf")
+        }
+        data = {"task": task_id}
+        resp_upload = requests.post(upload_url, files=files, data=data, timeout=_timeout(120, deadline))
+        resp_upload.raise_for_status()
+        upload_info = resp_upload.json()
+        server_filename = upload_info["server_filename"]
+
+        # 3. PROCESS
+        process_url = f"https://{server}/process"
+        process_data = {
+            "task": task_id,
+            "tool": "compress",
+            "compression_level": compression_level,
+            "files": [server_filename],
+        }
+        resp_process = requests.post(process_url, data=process_data, timeout=_timeout(120, deadline))
+        resp_process.raise_for_status()
+
+        # 4. DOWNLOAD
+        download_url = f"https://{server}/download/{task_id}"
+        resp_download = requests.get(download_url, timeout=_timeout(120, deadline))
+        resp_download.raise_for_status()
+
+        return resp_download.content
+
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logging.error(f"Error en flujo iLoveAPI: {e}")
+        return None
@@ -0,0 +1,107 @@
+import os
+import logging
+from io import BytesIO
+from typing import Optional
+
+import fitz  # PyMuPDF
+import pikepdf
+
+from services.compress_fanout import check_deadline
+
+# --- Configuración (variables de entorno) ---
+LOCAL_TARGET_DPI = int(os.getenv("PDFTOOLS_LOCAL_TARGET_DPI", "150"))
+LOCAL_JPEG_QUALITY = int(os.getenv("PDFTOOLS_LOCAL_JPEG_QUALITY", "75"))
+# Imagenes mas chicas que esto no vale la pena recomprimirlas
+LOCAL_MIN_IMAGE_BYTES = 16 * 1024
+# Una imagen se reescala solo si su resolucion efectiva supera el objetivo en este margen
+DPI_TOLERANCE = 1.1
+# El reemplazo debe ahorrar al menos este porcentaje para aplicarse
+MIN_IMAGE_SAVING = 0.9
+
+
+def _effective_dpi(page: fitz.Page, xref: int, width: int, height: int) -> Optional[float]:
+    """Resolucion efectiva maxima de la imagen en la pagina (None si no se dibuja)."""
+    rects = [r for r in page.get_image_rects(xref) if r.width > 0 and r.height > 0]
+    if not rects:
+        return None
+    return max(max(width / (r.width / 72), height / (r.height / 72)) for r in rects)
+
+
+def recompress_images(doc: fitz.Document, target_dpi: int = LOCAL_TARGET_DPI,
+                      jpeg_quality: int = LOCAL_JPEG_QUALITY, deadline: Optional[float] = None) -> int:
+    """
+    Reescala a target_dpi las imagenes que lo superan y las recodifica como JPEG
+    cuando eso reduce su tamaño. No toca imagenes con transparencia ni bilevel
+    (JPEG las degrada); esas quedan para la compresion de streams.
+    Retorna la cantidad de imagenes reemplazadas. DeadlineExceeded si deadline
+    (hora absoluta, time.time()) llega antes de terminar.
+    """
+    replaced = 0
+    seen = set()
+    for page in doc:
+        for img in page.get_images(full=True):
+            xref, smask, width, height, bpc = img[0], img[1], img[2], img[3], img[4]
+            if xref in seen:
+                continue
+            seen.add(xref)
+            if smask or bpc == 1:
+                continue
+            check_deadline(deadline)
+            try:
+                original_len = len(doc.xref_stream_raw(xref))
+                if original_len < LOCAL_MIN_IMAGE_BYTES:
+                    continue
+                dpi = _effective_dpi(page, xref, width, height)
+                if dpi is None:
+                    continue
+                pix = fitz.Pixmap(doc, xref)
+                if pix.alpha:
+                    pix = fitz.Pixmap(pix, 0)
+                if pix.colorspace is None or pix.colorspace.n not in (1, 3):
+                    # CMYK, indexadas, etc.: JPEG en RGB
+                    pix = fitz.Pixmap(fitz.csRGB, pix)
+                if dpi > target_dpi * DPI_TOLERANCE:
+                    scale = target_dpi / dpi
+                    pix = fitz.Pixmap(pix, max(1, int(pix.width * scale)), max(1, int(pix.height * scale)), None)
+                data = pix.tobytes("jpeg", jpg_quality=jpeg_quality)
+                if len(data) < original_len * MIN_IMAGE_SAVING:
+                    page.replace_image(xref, stream=data)
+                    replaced += 1
+            except Exception as e:
+                logging.warning(f"No se pudo recomprimir la imagen {xref}: {e}")
+    return replaced
+
+
+def optimize_structure(pdf_bytes: bytes) -> bytes:
+    """
+    Pasada estructural con qpdf: elimina recursos y objetos sin referencia,
+    recomprime los streams con Flate y agrupa objetos en object streams.
+    """
+    with pikepdf.open(BytesIO(pdf_bytes)) as pdf:
+        pdf.remove_unreferenced_resources()
+        out = BytesIO()
+        pdf.save(
+            out,
+            compress_streams=True,
+            recompress_flate=True,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+        )
+    return out.getvalue()
+
+
+def local_compress_pdf(pdf_bytes: bytes, target_dpi: int = LOCAL_TARGET_DPI,
+                       jpeg_quality: int = LOCAL_JPEG_QUALITY, deadline: Optional[float] = None) -> bytes:
+    """
+    Motor de compresion local (PyMuPDF + pikepdf), sin llamadas de red.
+    Si el resultado no es mas chico que la entrada, retorna la entrada.
+    deadline: ver recompress_images.
+    """
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        replaced = recompress_images(doc, target_dpi, jpeg_quality, deadline)
+        check_deadline(deadline)
+        rewritten = doc.tobytes(garbage=4, deflate=True, clean=True)
+    check_deadline(deadline)
+    compressed = optimize_structure(rewritten)
+    logging.info(f"Compresion local: {replaced} imagenes recomprimidas, "
+                 f"{round(len(pdf_bytes)/1024,2)} KB -> {round(len(compressed)/1024,2)} KB")
+    return compressed if len(compressed) < len(pdf_bytes) else pdf_bytes
@@ -1,36 +1,140 @@
 import os
 import base64
-from typing import List
+import binascii
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Union
 from io import BytesIO
-from PyPDF2 import PdfMerger, PdfReader
+import fitz  # PyMuPDF
+import pikepdf
+from PyPDF2 import PdfReader, PdfWriter
 from fastapi import HTTPException
 
-def validate_and_merge_pdfs(files: List[str], download_path: str) -> str:
-    pdf_paths = []
-    for idx, file_base64 in enumerate(files):
-        pdf_data = base64.b64decode(file_base64)
+from services.result_cache import cached, cached_file
+
+# Una fuente puede ser el contenido del PDF, una ruta en disco o un archivo abierto
+PDFSource = Union[bytes, str, BinaryIO]
+
+
+# Backend de merge por defecto: "pypdf2" (Python puro), "pikepdf" (qpdf) o "fitz" (MuPDF)
+MERGE_BACKEND = os.getenv("PDFTOOLS_MERGE_BACKEND", "pypdf2")
+
+
+def _invalid_pdf(idx: int) -> HTTPException:
+    return HTTPException(status_code=400, detail=f"El archivo {idx+1} no es un PDF valido.")
 
+
+def _merge_pypdf2(sources: Iterable[PDFSource], output: BinaryIO) -> None:
+    # El PdfReader que valida es el mismo que se agrega al writer (PdfMerger
+    # volveria a copiar y parsear el stream).
+    writer = PdfWriter()
+    for idx, source in enumerate(sources):
+        if isinstance(source, (bytes, bytearray)):
+            source = BytesIO(source)
         # Validar PDF
         try:
-            PdfReader(BytesIO(pdf_data))
+            reader = PdfReader(source)
         except Exception:
-            raise HTTPException(status_code=400, detail=f"El archivo {idx+1} no es un PDF valido.")
+            raise _invalid_pdf(idx)
+        writer.append(reader)
+    writer.write(output)
+
+
+def _merge_pikepdf(sources: Iterable[PDFSource], output: BinaryIO) -> None:
+    merged = pikepdf.new()
+    opened = []
+    try:
+        for idx, source in enumerate(sources):
+            if isinstance(source, (bytes, bytearray)):
+                source = BytesIO(source)
+            try:
+                pdf = pikepdf.open(source)
+            except pikepdf.PdfError:
+                raise _invalid_pdf(idx)
+            # Las paginas copiadas referencian al origen hasta save(): mantenerlo abierto
+            opened.append(pdf)
+            merged.pages.extend(pdf.pages)
+        merged.save(output)
+    finally:
+        merged.close()
+        for pdf in opened:
+            pdf.close()
+
+
+def _merge_fitz(sources: Iterable[PDFSource], output: BinaryIO) -> None:
+    merged = fitz.open()
+    try:
+        for idx, source in enumerate(sources):
+            try:
+                if isinstance(source, str):
+                    pdf = fitz.open(source, filetype="pdf")
+                else:
+                    data = source if isinstance(source, (bytes, bytearray)) else source.read()
+                    pdf = fitz.open(stream=data, filetype="pdf")
+            except Exception:
+                raise _invalid_pdf(idx)
+            try:
+                merged.insert_pdf(pdf)
+            finally:
+                pdf.close()
+        merged.save(output, garbage=1, deflate=True)
+    finally:
+        merged.close()
+
+
+MERGE_BACKENDS: Dict[str, Callable[[Iterable[PDFSource], BinaryIO], None]] = {
+    "pypdf2": _merge_pypdf2,
+    "pikepdf": _merge_pikepdf,
+    "fitz": _merge_fitz,
+}
+
+
+def merge_pdf_sources(sources: Iterable[PDFSource], output: BinaryIO,
+                      backend: Optional[str] = None) -> BinaryIO:
+    """
+    Valida y une los PDFs de sources en output, sin archivos intermedios.
+
+    backend elige la implementacion (ver MERGE_BACKENDS); por defecto MERGE_BACKEND.
+    Todo el estado es local a la llamada, asi que es seguro en paralelo.
+    """
+    backend = backend or MERGE_BACKEND
+    merge = MERGE_BACKENDS.get(backend)
+    if merge is None:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Backend de merge desconocido: {backend}. Opciones: {', '.join(MERGE_BACKENDS)}",
+        )
+    merge(sources, output)
+    return output
+
+
+def decode_base64_pdfs(files: List[str]) -> Iterable[bytes]:
+    """Decodifica los PDFs en base64 de a uno, a medida que se consumen."""
+    for idx, file_base64 in enumerate(files):
+        try:
+            yield base64.b64decode(file_base64)
+        except binascii.Error:
+            raise _invalid_pdf(idx)
+
+
+def validate_and_merge_pdfs(files: List[str], backend: Optional[str] = None) -> bytes:
+    """Une PDFs recibidos en base64 y retorna los bytes del PDF unido."""
+    pdf_datas = list(decode_base64_pdfs(files))
 
-        pdf_path = os.path.join(download_path, f"file_{idx + 1}.pdf")
-        with open(pdf_path, "wb") as pdf_file:
-            pdf_file.write(pdf_data)
-        pdf_paths.append(pdf_path)
+    def merge() -> bytes:
+        output = BytesIO()
+        merge_pdf_sources(pdf_datas, output, backend)
+        return output.getvalue()
 
-    output_path = os.path.join(download_path, "merged.pdf")
-    merger = PdfMerger()
-    for pdf_path in pdf_paths:
-        merger.append(pdf_path)
-    merger.write(output_path)
-    merger.close()
+    return cached("merge", pdf_datas, {"backend": backend or MERGE_BACKEND}, merge)
 
-    # Eliminar los archivos individuales
-    for pdf_path in pdf_paths:
-        os.remove(pdf_path)
 
-    return output_path
+def validate_and_merge_pdf_files(pdf_paths: List[str], output_path: str,
+                                 backend: Optional[str] = None) -> str:
+    """
+    Une PDFs que ya estan en disco (p. ej. subidos por multipart) en output_path.
+    Los archivos de entrada no se eliminan; los limpia quien los creo.
+    """
+    def merge() -> None:
+        with open(output_path, "wb") as output:
+            merge_pdf_sources(pdf_paths, output, backend)
 
+    return cached_file("merge", pdf_paths, {"backend": backend or MERGE_BACKEND}, output_path, merge)
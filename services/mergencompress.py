@@ -1,12 +1,27 @@
 import os
-import base64
+import zlib
+import logging
 import tempfile
-from typing import List
-from io import BytesIO
-from PyPDF2 import PdfMerger, PdfReader
+import threading
+import multiprocessing
+import multiprocessing.util
+import base64
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
 import fitz  # PyMuPDF
+import numpy as np
+import pikepdf
 from fastapi import HTTPException
 
+from services.compress_fanout import check_deadline
+from services.pdf_executor import POOL_SIZE
+from services.merge_pdf import MERGE_BACKEND, PDFSource, merge_pdf_sources, decode_base64_pdfs
+from services.raster_codecs import (MRC_RENDER_SCALE, RASTER_COLOR_MODE, encode_raster, encoded_size, grayscale,
+                                    insert_encoded, is_colorful, pixmap_array, validate_codec)
+from services.result_cache import cached_file
+
 
 def is_blank_page(page, margin_ratio=0.2, min_chars=10):
     height = page.rect.height
@@ -40,55 +55,605 @@ def is_blank_page(page, margin_ratio=0.2, min_chars=10):
     return True
 
 
-def validate_merge_and_compress_pdfs(files: List[str], download_path: str) -> str:
-    pdf_paths = []
-    for idx, file_base64 in enumerate(files):
-        try:
-            pdf_data = base64.b64decode(file_base64)
-            PdfReader(BytesIO(pdf_data))
-        except Exception:
-            raise HTTPException(status_code=400, detail=f"El archivo {idx+1} no es un PDF valido.")
+# --- Deteccion rapida de paginas vacias ---
+# "raster": render de la banda central a baja resolucion (con is_blank_page si
+# es ambiguo); "structural": solo is_blank_page
+BLANK_DETECTOR = os.getenv("PDFTOOLS_BLANK_DETECTOR", "raster").strip().lower()
+# Subir al cambiar lo que el detector considera vacio: invalida los resultados en cache
+# (2: las paginas oscuras ya no cuentan como vacias)
+BLANK_DETECTOR_VERSION = 2
+# Resolucion del render de prueba (72 = escala 1.0)
+BLANK_DPI = int(os.getenv("PDFTOOLS_BLANK_DPI", "24"))
+# Con menos tinta que esto la pagina es vacia; con BLANK_MIN_INK o mas tiene contenido
+BLANK_MAX_INK = float(os.getenv("PDFTOOLS_BLANK_MAX_INK", "0.0002"))
+BLANK_MIN_INK = float(os.getenv("PDFTOOLS_BLANK_MIN_INK", "0.001"))
+# Diferencia de gris respecto del papel (la mediana) que cuenta como tinta
+BLANK_INK_CONTRAST = 40
+# Un "papel" mas oscuro que esto (foto, fondo de color fuerte) no se decide por la tinta
+BLANK_MIN_PAPER = 160
+
+
+def ink_coverage(page, margin_ratio=0.2) -> Optional[float]:
+    """
+    Fraccion de pixeles con tinta en la banda central de la pagina (la misma
+    que mira is_blank_page), en un render en grises a BLANK_DPI. El papel es
+    la mediana del render, asi un escaneo amarillento no cuenta como tinta.
+    None si el papel es demasiado oscuro para medir asi.
+    """
+    rect = page.rect
+    clip = fitz.Rect(rect.x0, rect.y0 + rect.height * margin_ratio, rect.x1, rect.y1 - rect.height * margin_ratio)
+    scale = BLANK_DPI / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), clip=clip, colorspace=fitz.csGRAY, alpha=False)
+    if pix.width == 0 or pix.height == 0:
+        return 0.0
+    gray = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    paper = int(np.median(gray))
+    if paper < BLANK_MIN_PAPER:
+        return None
+    ink = np.count_nonzero(np.abs(gray.astype(np.int16) - paper) > BLANK_INK_CONTRAST)
+    return ink / gray.size
+
+
+def is_blank_page_fast(page) -> bool:
+    # El render evita get_text("dict") y get_drawings, que en paginas con muchos
+    # vectores cuestan mas que rasterizar; solo lo ambiguo pasa a is_blank_page
+    coverage = ink_coverage(page)
+    if coverage is None:
+        return is_blank_page(page)
+    if coverage < BLANK_MAX_INK:
+        return True
+    if coverage >= BLANK_MIN_INK:
+        return False
+    return is_blank_page(page)
+
+
+def page_is_blank(page) -> bool:
+    """Deteccion de pagina vacia con el detector configurado (PDFTOOLS_BLANK_DETECTOR)."""
+    if BLANK_DETECTOR == "structural":
+        return is_blank_page(page)
+    return is_blank_page_fast(page)
+
+
+def page_composition(page) -> dict:
+    """
+    Composicion de la pagina: caracteres de texto visible, trazados
+    vectoriales, cantidad de imagenes y fraccion del area de la pagina que
+    cubren. El texto invisible (capa OCR de un escaneo) no se cuenta.
+    """
+    area = abs(page.rect) or 1.0
+    covered = 0.0
+    images = page.get_images(full=True)
+    for img in images:
+        for r in page.get_image_rects(img[0]):
+            covered += abs(r & page.rect)
+    text_chars = sum(len(span['chars']) for span in page.get_texttrace()
+                     if span['type'] != 3 and span['opacity'] > 0)
+    return {
+        'text_chars': text_chars,
+        'drawings': len(page.get_cdrawings()),
+        'images': len(images),
+        'image_coverage': min(1.0, covered / area),
+    }
+
+
+def is_scan_like(composition: dict) -> bool:
+    # Una pagina dominada por imagenes (escaneo, foto, escaneo con capa OCR) gana
+    # con el rasterizado; si ademas trae texto o vectores (PDF nativo con imagen
+    # de fondo) se copia tal cual para no perder el texto
+    return (composition['image_coverage'] >= RASTER_SCAN_COVERAGE
+            and composition['text_chars'] <= RASTER_SCAN_MAX_TEXT
+            and composition['drawings'] <= RASTER_SCAN_MAX_DRAWINGS)
+
+
+def page_bytes(doc: fitz.Document, page) -> int:
+    """
+    Bytes de los streams de contenido e imagenes de la pagina (sin fuentes),
+    como quedarian en el PDF final: los streams sin filtro se miden
+    comprimidos con Flate.
+    """
+    xrefs = set(page.get_contents())
+    for img in page.get_images(full=True):
+        xrefs.update(x for x in img[:2] if x)
+    total = 0
+    for xref in xrefs:
+        raw = doc.xref_stream_raw(xref) or b""
+        if doc.xref_get_key(xref, "Filter")[0] == "null":
+            raw = zlib.compress(raw)
+        total += len(raw)
+    return total
+
+
+def validate_merge_and_compress_pdfs(files: List[str], download_path: str,
+                                     backend: Optional[str] = None) -> str:
+    pdf_datas = list(decode_base64_pdfs(files))
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=download_path) as tmp_out:
+        output_path = tmp_out.name
+    return _cached_merge_and_compress(pdf_datas, output_path, backend)
+
+
+def validate_merge_and_compress_pdf_files(pdf_paths: List[str], download_path: str,
+                                          output_path: Optional[str] = None,
+                                          backend: Optional[str] = None) -> str:
+    """
+    Variante de validate_merge_and_compress_pdfs para PDFs que ya estan en disco.
+    """
+    if not output_path:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=download_path) as tmp_out:
+            output_path = tmp_out.name
+    return _cached_merge_and_compress(pdf_paths, output_path, backend)
+
+
+def _merge_compress_backend(backend: Optional[str]) -> str:
+    # Con ventanas el PDF unido es solo un intermedio en disco: qpdf (pikepdf) lo escribe
+    # copiando los streams de las entradas a medida que guarda, mientras que PyPDF2
+    # arma el documento entero en memoria y el pico de merge-compress lo pondria el merge
+    if backend:
+        return backend
+    return "pikepdf" if RASTER_WINDOW > 0 else MERGE_BACKEND
+
+
+def _cached_merge_and_compress(sources: List[PDFSource], output_path: str, backend: Optional[str]) -> str:
+    # El PDF rasterizado depende de las entradas, del backend de merge y de como se rasteriza
+    backend = _merge_compress_backend(backend)
+
+    def merge_and_compress() -> None:
+        # El PDF unido va a disco: con documentos grandes no se tiene entero en memoria
+        with tempfile.NamedTemporaryFile(suffix=".pdf", dir=os.path.dirname(os.path.abspath(output_path))) as merged:
+            merge_pdf_sources(sources, merged, backend)
+            merged.flush()
+            rasterize_and_compress_pdf_file(merged.name, output_path)
+
+    params = {"backend": backend, "raster_mode": RASTER_MODE, "codec": validate_codec(None),
+              "blank_detector": BLANK_DETECTOR, "blank_version": BLANK_DETECTOR_VERSION,
+              "scan_version": SCAN_CLASSIFIER_VERSION,
+              "scale_mode": RASTER_SCALE_MODE, "color_mode": RASTER_COLOR_MODE}
+    return cached_file("merge_compress", sources, params, output_path, merge_and_compress)
+
+
+# Escala del render de cada pagina (1.0 = 72 DPI)
+RASTER_SCALE = 0.7
+# "adaptive": escala por pagina segun su contenido (ver page_raster_scale); "fixed": RASTER_SCALE
+RASTER_SCALE_MODE = os.getenv("PDFTOOLS_RASTER_SCALE_MODE", "adaptive").strip().lower()
+# Piso y techo de la escala adaptativa
+RASTER_MIN_SCALE = float(os.getenv("PDFTOOLS_RASTER_MIN_SCALE", "0.4"))
+RASTER_MAX_SCALE = float(os.getenv("PDFTOOLS_RASTER_MAX_SCALE", "2.0"))
+# Pixeles por em que debe tener la fuente mas chica de la pagina para ser legible
+RASTER_MIN_FONT_PX = float(os.getenv("PDFTOOLS_RASTER_MIN_FONT_PX", "8"))
+# Escala que pide el detalle maximo (densidad de bordes >= EDGE_DENSITY_FULL)
+RASTER_DETAIL_SCALE = 1.0
+EDGE_DENSITY_FULL = 0.15
+# Render de prueba para medir el detalle y salto de gris que cuenta como borde
+PROBE_DPI = 36
+EDGE_CONTRAST = 48
+# Tamaños menores (capas OCR mal escaladas, puntos sueltos) no cuentan como texto
+MIN_FONT_SIZE = 4.0
+
+
+def _default_raster_workers(cpu_count: Optional[int], pool_size: int) -> int:
+    """
+    Procesos de rasterizado por defecto: los nucleos repartidos entre los
+    pool_size workers de pdf_executor, y al menos 2 si hay 2 nucleos o mas
+    (con pool_size = nucleos el reparto daria 1 y nunca habria paralelismo).
+    """
+    cores = cpu_count or 1
+    return max(min(2, cores), cores // max(1, pool_size))
+
+
+# Procesos que rasterizan en paralelo las paginas de un documento grande. Cada
+# worker de pdf_executor tiene su propio pool (se crea recien con el primer
+# documento grande), asi que no se lanzan POOL_SIZE * nucleos procesos
+RASTER_WORKERS = int(os.getenv("PDFTOOLS_RASTER_WORKERS", _default_raster_workers(os.cpu_count(), POOL_SIZE)))
+# Documentos con menos paginas se rasterizan en el proceso actual
+RASTER_PARALLEL_MIN_PAGES = int(os.getenv("PDFTOOLS_RASTER_PARALLEL_MIN_PAGES", "16"))
+# Bloques por proceso: bloques mas chicos reparten mejor paginas de costo desigual
+RASTER_CHUNKS_PER_WORKER = 4
+# Paginas por ventana en documentos grandes (0 = sin ventanas); ver rasterize_pdf_file
+RASTER_WINDOW = int(os.getenv("PDFTOOLS_RASTER_WINDOW", "64"))
+# "selective": solo se rasterizan las paginas tipo escaneo; "all": todas
+RASTER_MODE = os.getenv("PDFTOOLS_RASTER_MODE", "selective").strip().lower()
+# Fraccion de la pagina cubierta por imagenes a partir de la cual es "tipo escaneo"
+RASTER_SCAN_COVERAGE = float(os.getenv("PDFTOOLS_RASTER_SCAN_COVERAGE", "0.5"))
+# Maximo de caracteres de texto visible y de trazados vectoriales de una pagina tipo escaneo
+RASTER_SCAN_MAX_TEXT = int(os.getenv("PDFTOOLS_RASTER_SCAN_MAX_TEXT", "20"))
+RASTER_SCAN_MAX_DRAWINGS = int(os.getenv("PDFTOOLS_RASTER_SCAN_MAX_DRAWINGS", "10"))
+# Subir al cambiar que paginas se consideran tipo escaneo: invalida los resultados en cache
+# (2: el texto visible y los vectores descartan la pagina)
+SCAN_CLASSIFIER_VERSION = 2
+
+_raster_pool: Optional[ProcessPoolExecutor] = None
+_raster_pool_lock = threading.Lock()
+
+
+def _get_raster_pool() -> ProcessPoolExecutor:
+    global _raster_pool
+    with _raster_pool_lock:
+        if _raster_pool is None:
+            # spawn: el pool puede crearse desde un hilo de la busqueda de compresion
+            # (RasterizeEngine corre en run_search) con otros hilos activos; un fork
+            # desde ahi puede heredar locks tomados por ellos
+            _raster_pool = ProcessPoolExecutor(max_workers=RASTER_WORKERS,
+                                               mp_context=multiprocessing.get_context("spawn"))
+            # Un proceso de multiprocessing espera a sus hijos al salir: el pool
+            # se cierra antes, y antes que sus colas (exitpriority 10), para que el
+            # worker pueda terminar
+            multiprocessing.util.Finalize(_raster_pool, _raster_pool.shutdown, exitpriority=20)
+        return _raster_pool
+
+
+def _reset_raster_pool(broken: ProcessPoolExecutor) -> None:
+    global _raster_pool
+    with _raster_pool_lock:
+        if _raster_pool is broken:
+            _raster_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def render_probe(page) -> np.ndarray:
+    """Render RGB chico (PROBE_DPI) de la pagina para decidir escala y color antes del render final."""
+    scale = PROBE_DPI / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=False)
+    # Copia: pixmap_array es una vista sobre la memoria del pixmap, que se libera al salir
+    return pixmap_array(pix).copy()
+
+
+def edge_density(probe: np.ndarray) -> float:
+    """Fraccion de pixeles de borde en el render de prueba (en grises)."""
+    if probe.shape[0] < 2 or probe.shape[1] < 2:
+        return 0.0
+    gray = grayscale(probe).astype(np.int16)
+    dx = np.abs(np.diff(gray, axis=1))[:-1]
+    dy = np.abs(np.diff(gray, axis=0))[:, :-1]
+    return float(np.count_nonzero(np.maximum(dx, dy) > EDGE_CONTRAST) / dx.size)
+
+
+def smallest_font_size(page) -> Optional[float]:
+    # flags=0: sin bloques de imagen, que en escaneos hacen muy lento a "dict"
+    sizes = [span["size"] for block in page.get_text("dict", flags=0)["blocks"] if block["type"] == 0
+             for line in block["lines"] for span in line["spans"]
+             if span["size"] >= MIN_FONT_SIZE and span["text"].strip()]
+    return min(sizes, default=None)
+
 
-        pdf_path = os.path.join(download_path, f"file_{idx + 1}.pdf")
-        with open(pdf_path, "wb") as f:
-            f.write(pdf_data)
-        pdf_paths.append(pdf_path)
+def max_image_dpi(page) -> Optional[float]:
+    """Resolucion efectiva mas alta entre las imagenes dibujadas en la pagina."""
+    dpis = []
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        if x1 > x0 and y1 > y0:
+            dpis.append(max(info["width"] / (x1 - x0), info["height"] / (y1 - y0)) * 72)
+    return max(dpis, default=None)
 
-    merged_path = os.path.join(download_path, "merged.pdf")
-    merger = PdfMerger()
-    for pdf_path in pdf_paths:
-        merger.append(pdf_path)
-    merger.write(merged_path)
-    merger.close()
 
-    for pdf_path in pdf_paths:
-        os.remove(pdf_path)
+def page_raster_scale(page, probe: Optional[np.ndarray] = None) -> float:
+    """
+    Escala de render adaptada a la pagina, entre RASTER_MIN_SCALE y
+    RASTER_MAX_SCALE:
+      - el detalle (densidad de bordes de un render chico) la lleva de
+        RASTER_MIN_SCALE hasta RASTER_DETAIL_SCALE;
+      - renderizar por encima de la resolucion de las imagenes no agrega
+        nada, asi que esa resolucion la limita;
+      - la fuente mas chica debe quedar con RASTER_MIN_FONT_PX por em, aunque
+        eso supere el limite anterior.
+    """
+    if probe is None:
+        probe = render_probe(page)
+    detail = min(1.0, edge_density(probe) / EDGE_DENSITY_FULL)
+    scale = RASTER_MIN_SCALE + (RASTER_DETAIL_SCALE - RASTER_MIN_SCALE) * detail
+    image_dpi = max_image_dpi(page)
+    if image_dpi:
+        scale = min(scale, image_dpi / 72)
+    font_size = smallest_font_size(page)
+    if font_size:
+        scale = max(scale, RASTER_MIN_FONT_PX / font_size)
+    return min(RASTER_MAX_SCALE, max(RASTER_MIN_SCALE, scale))
 
-    # Comprimir PDF resultante
+
+def _rasterize_pages(doc: fitz.Document, new_doc: fitz.Document, pages: range, scale: Optional[float],
+                     skip_blank: bool, codec: str, selective: bool, deadline: Optional[float] = None) -> None:
+    """
+    Agrega a new_doc las paginas de doc en pages, rasterizadas a scale (None
+    = page_raster_scale de cada pagina). Con PDFTOOLS_RASTER_COLOR=auto las
+    paginas sin color se renderizan directamente en grises. Con selective
+    las paginas de texto/vectores, y las que rasterizadas ocuparian mas que
+    el original, se copian sin cambios. deadline (hora absoluta,
+    time.time()) se revisa antes de cada pagina.
+    """
+    for pno in pages:
+        check_deadline(deadline)
+        page = doc.load_page(pno)
+        if skip_blank and page_is_blank(page):
+            continue
+        if selective and not is_scan_like(page_composition(page)):
+            new_doc.insert_pdf(doc, from_page=pno, to_page=pno)
+            continue
+        probe = render_probe(page) if scale is None or RASTER_COLOR_MODE == "auto" else None
+        if codec == "mrc":
+            # La mascara de texto sale de este render; el fondo se reduce despues
+            page_scale = MRC_RENDER_SCALE
+        else:
+            page_scale = scale or page_raster_scale(page, probe)
+        # Un pixmap en grises ocupa un tercio y su imagen se codifica con un solo canal
+        colorspace = fitz.csGRAY if RASTER_COLOR_MODE == "auto" and not is_colorful(probe) else fitz.csRGB
+        pix = page.get_pixmap(matrix=fitz.Matrix(page_scale, page_scale), colorspace=colorspace, alpha=False)
+        encoded = encode_raster(pix, codec)
+        pix = None
+        if selective and encoded_size(encoded) >= page_bytes(doc, page):
+            new_doc.insert_pdf(doc, from_page=pno, to_page=pno)
+            continue
+        img_page = new_doc.new_page(width=page.rect.width, height=page.rect.height)
+        insert_encoded(img_page, page.rect, encoded)
+
+
+def _rasterize_chunk(pdf_path: str, start: int, stop: int, scale: Optional[float], skip_blank: bool,
+                     codec: str, selective: bool, deadline: Optional[float] = None) -> bytes:
+    """
+    Se ejecuta en un proceso de _raster_pool: rasteriza las paginas
+    [start, stop) y retorna un PDF con ellas (b"" si todas eran vacias). Las
+    imagenes ya salen comprimidas, asi el proceso padre solo las copia.
+    """
+    with fitz.open(pdf_path) as doc, fitz.open() as new_doc:
+        _rasterize_pages(doc, new_doc, range(start, stop), scale, skip_blank, codec, selective, deadline)
+        if len(new_doc) == 0:
+            return b""
+        return new_doc.tobytes(garbage=1, deflate=True)
+
+
+def _rasterize_parallel(pdf_path: str, pages: range, new_doc: fitz.Document, scale: Optional[float],
+                        skip_blank: bool, codec: str, selective: bool, deadline: Optional[float] = None) -> None:
+    # Los procesos leen el PDF de disco: no se copia el documento entero a cada uno
+    chunks = max(1, min(len(pages), RASTER_WORKERS * RASTER_CHUNKS_PER_WORKER))
+    bounds = [pages.start + len(pages) * i // chunks for i in range(chunks + 1)]
+    pool = _get_raster_pool()
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_out:
-            compressed_path = tmp_out.name
+        parts = pool.map(_rasterize_chunk, [pdf_path] * chunks, bounds[:-1], bounds[1:],
+                         [scale] * chunks, [skip_blank] * chunks, [codec] * chunks,
+                         [selective] * chunks, [deadline] * chunks)
+        # map respeta el orden de los bloques: las paginas quedan en orden
+        for part in parts:
+            if part:
+                with fitz.open(stream=part, filetype="pdf") as chunk_doc:
+                    new_doc.insert_pdf(chunk_doc)
+    except BrokenProcessPool:
+        logging.exception("Pool de rasterizado roto; se recrea")
+        _reset_raster_pool(pool)
+        raise
 
-        doc = fitz.open(merged_path)
-        new_doc = fitz.open()
 
-        for page in doc:
-            if is_blank_page(page):
-                continue
-            pix = page.get_pixmap(matrix=fitz.Matrix(0.7, 0.7), alpha=False)
-            img_page = new_doc.new_page(width=page.rect.width, height=page.rect.height)
-            img_page.insert_image(page.rect, pixmap=pix)
+def _rasterize_range(pdf_path: str, doc: fitz.Document, new_doc: fitz.Document, pages: range,
+                     scale: Optional[float],
+                     skip_blank: bool, codec: str, selective: bool) -> None:
+    # En paralelo si hay procesos y paginas suficientes; si no, en el proceso actual
+    if RASTER_WORKERS > 1 and len(pages) >= RASTER_PARALLEL_MIN_PAGES:
+        _rasterize_parallel(pdf_path, pages, new_doc, scale, skip_blank, codec, selective)
+    else:
+        _rasterize_pages(doc, new_doc, pages, scale, skip_blank, codec, selective)
+
+
+def _empty_result() -> HTTPException:
+    return HTTPException(status_code=400, detail="El PDF resultante esta vacio despues de la compresion.")
+
+
+def _raster_options(scale: Optional[float], codec: Optional[str],
+                    selective: Optional[bool]) -> Tuple[Optional[float], str, bool]:
+    # scale None queda en None (escala por pagina) solo en modo adaptativo
+    if scale is None and RASTER_SCALE_MODE != "adaptive":
+        scale = RASTER_SCALE
+    if selective is None:
+        selective = RASTER_MODE == "selective"
+    return scale, validate_codec(codec), selective
+
+
+def rasterize_pdf_bytes(pdf_data: bytes, scale: Optional[float] = None, skip_blank: bool = True,
+                        codec: Optional[str] = None, selective: Optional[bool] = None,
+                        deadline: Optional[float] = None) -> bytes:
+    """
+    Rasteriza cada pagina del PDF a la escala dada (None = segun
+    PDFTOOLS_RASTER_SCALE_MODE: por pagina o RASTER_SCALE), omitiendo las
+    vacias si skip_blank, y retorna el PDF resultante. codec (None = PDFTOOLS_RASTER_CODEC) es
+    el de las imagenes de pagina; ver raster_codecs.encode_raster. Con
+    selective (None = PDFTOOLS_RASTER_MODE) solo se rasterizan las paginas
+    tipo escaneo que asi se achican; las demas se copian. Los
+    documentos de al menos RASTER_PARALLEL_MIN_PAGES paginas se reparten en
+    bloques consecutivos entre RASTER_WORKERS procesos y se vuelven a unir
+    en orden. Con deadline (hora absoluta, time.time()) se corta con
+    DeadlineExceeded entre paginas, tambien en los procesos.
+    """
+    scale, codec, selective = _raster_options(scale, codec, selective)
+    with fitz.open(stream=pdf_data, filetype="pdf") as doc, fitz.open() as new_doc:
+        pages = range(doc.page_count)
+        if RASTER_WORKERS > 1 and doc.page_count >= RASTER_PARALLEL_MIN_PAGES:
+            with tempfile.NamedTemporaryFile(suffix=".pdf") as source:
+                source.write(pdf_data)
+                source.flush()
+                _rasterize_parallel(source.name, pages, new_doc, scale, skip_blank, codec, selective, deadline)
+        else:
+            _rasterize_pages(doc, new_doc, pages, scale, skip_blank, codec, selective, deadline)
 
         if len(new_doc) == 0:
-            raise HTTPException(status_code=400, detail="El PDF resultante esta vacio despues de la compresion.")
+            raise _empty_result()
+
+        check_deadline(deadline)
+        return new_doc.tobytes(garbage=4, deflate=True, clean=True)
 
-        new_doc.save(compressed_path, garbage=4, deflate=True, clean=True)
-        new_doc.close()
-        doc.close()
-        os.remove(merged_path)
 
-        return compressed_path
+# Profundidad maxima al comparar recursos; mas alla (o en un ciclo) no se deduplica
+RESOURCE_KEY_DEPTH = 8
 
+
+def _resource_key(obj: Any, depth: int = 0) -> Any:
+    # Identidad por contenido: diccionario (sin /Length) + hash del stream crudo, recursivo
+    if depth > RESOURCE_KEY_DEPTH:
+        raise RecursionError
+    if isinstance(obj, pikepdf.Stream):
+        entries = tuple(sorted((k, _resource_key(v, depth + 1)) for k, v in obj.items() if k != "/Length"))
+        return "stream", hashlib.sha256(obj.read_raw_bytes()).hexdigest(), entries
+    if isinstance(obj, pikepdf.Dictionary):
+        return "dict", tuple(sorted((k, _resource_key(v, depth + 1)) for k, v in obj.items()))
+    if isinstance(obj, pikepdf.Array):
+        return "array", tuple(_resource_key(v, depth + 1) for v in obj)
+    return repr(obj)
+
+
+def _dedupe_resources(pdf: pikepdf.Pdf) -> int:
+    """
+    Cada parte se guardo por separado, asi que una fuente o imagen que usan
+    paginas de varias ventanas (p. ej. paginas de texto copiadas sin
+    rasterizar) queda una vez por parte. Cada fuente y XObject de las paginas
+    se apunta a la primera copia identica; qpdf no escribe las que quedan sin
+    referencia. Los streams se leen de a uno. Retorna los reemplazos.
+    """
+    first: Dict[Any, pikepdf.Object] = {}
+    replaced = 0
+    for page in pdf.pages:
+        resources = page.obj.get("/Resources")
+        if resources is None:
+            continue
+        for category in ("/Font", "/XObject"):
+            entries = resources.get(category)
+            if entries is None:
+                continue
+            for name in list(entries.keys()):
+                obj = entries[name]
+                if not obj.is_indirect:
+                    continue
+                try:
+                    key = _resource_key(obj)
+                except RecursionError:
+                    continue
+                original = first.setdefault(key, obj)
+                if original.objgen != obj.objgen:
+                    entries[name] = original
+                    replaced += 1
+    return replaced
+
+
+def _join_parts(part_paths: List[str], output_path: str) -> None:
+    # qpdf lee los streams de cada parte recien al escribir: la union no carga
+    # las imagenes de todo el documento en memoria
+    merged = pikepdf.new()
+    opened = []
+    try:
+        for path in part_paths:
+            part = pikepdf.open(path)
+            opened.append(part)
+            merged.pages.extend(part.pages)
+        replaced = _dedupe_resources(merged)
+        if replaced:
+            logging.info(f"Union de partes: {replaced} recursos repetidos entre ventanas")
+        merged.save(output_path)
+    finally:
+        merged.close()
+        for part in opened:
+            part.close()
+
+
+def rasterize_pdf_file(pdf_path: str, output_path: str, scale: Optional[float] = None, skip_blank: bool = True,
+                       codec: Optional[str] = None, selective: Optional[bool] = None) -> str:
+    """
+    rasterize_pdf_bytes para un PDF en disco, con el resultado en output_path.
+
+    Los documentos de mas de RASTER_WINDOW paginas se procesan por ventanas:
+    cada ventana se rasteriza (en paralelo si corresponde), se guarda como
+    una parte en disco y se liberan sus pixmaps y la cache de MuPDF antes de
+    seguir; al final las partes se unen en orden. La memoria maxima depende
+    del tamaño de la ventana, no del documento.
+    """
+    scale, codec, selective = _raster_options(scale, codec, selective)
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    if RASTER_WINDOW <= 0 or page_count <= RASTER_WINDOW:
+        with open(pdf_path, "rb") as f:
+            data = rasterize_pdf_bytes(f.read(), scale, skip_blank, codec, selective)
+        with open(output_path, "wb") as f:
+            f.write(data)
+        return output_path
+
+    with tempfile.TemporaryDirectory(prefix="raster_", dir=os.path.dirname(os.path.abspath(output_path))) as parts_dir:
+        part_paths = []
+        for start in range(0, page_count, RASTER_WINDOW):
+            pages = range(start, min(page_count, start + RASTER_WINDOW))
+            # El documento se reabre por ventana: MuPDF no acumula objetos ya leidos
+            with fitz.open(pdf_path) as doc, fitz.open() as window_doc:
+                _rasterize_range(pdf_path, doc, window_doc, pages, scale, skip_blank, codec, selective)
+                if len(window_doc):
+                    part_path = os.path.join(parts_dir, f"part_{start:07d}.pdf")
+                    window_doc.save(part_path, garbage=4, deflate=True, clean=True)
+                    part_paths.append(part_path)
+            # Imagenes decodificadas, fuentes, etc. que MuPDF guarda en su cache
+            fitz.TOOLS.store_shrink(100)
+            logging.info(f"Rasterizado por ventanas: paginas {pages.start + 1}-{pages.stop} de {page_count}")
+        if not part_paths:
+            raise _empty_result()
+        _join_parts(part_paths, output_path)
+    return output_path
+
+
+def _blank_chunk(pdf_path: str, start: int, stop: int) -> List[int]:
+    # Se ejecuta en un proceso de _raster_pool
+    with fitz.open(pdf_path) as doc:
+        return [pno for pno in range(start, stop) if page_is_blank(doc.load_page(pno))]
+
+
+def find_blank_pages(pdf_path: str) -> List[int]:
+    """
+    Indices (desde 0) de las paginas vacias del PDF en disco. Los documentos
+    de al menos RASTER_PARALLEL_MIN_PAGES paginas se revisan en paralelo en
+    los procesos de rasterizado, por bloques de paginas consecutivas.
+    """
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+        if RASTER_WORKERS <= 1 or page_count < RASTER_PARALLEL_MIN_PAGES:
+            return [pno for pno in range(page_count) if page_is_blank(doc.load_page(pno))]
+    chunks = max(1, min(page_count, RASTER_WORKERS * RASTER_CHUNKS_PER_WORKER))
+    bounds = [page_count * i // chunks for i in range(chunks + 1)]
+    pool = _get_raster_pool()
+    try:
+        return [pno for part in pool.map(_blank_chunk, [pdf_path] * chunks, bounds[:-1], bounds[1:]) for pno in part]
+    except BrokenProcessPool:
+        logging.exception("Pool de rasterizado roto; se recrea")
+        _reset_raster_pool(pool)
+        raise
+
+
+def remove_blank_pages_file(pdf_path: str, output_path: str) -> Tuple[str, List[int]]:
+    """
+    Guarda en output_path el PDF sin sus paginas vacias. Retorna la ruta y los
+    numeros (desde 1) de las paginas eliminadas. Si todas son vacias, 400.
+    """
+    try:
+        blank = find_blank_pages(pdf_path)
+    except fitz.FileDataError:
+        raise HTTPException(status_code=400, detail="El archivo no es un PDF valido.")
+    with fitz.open(pdf_path) as doc:
+        if len(blank) == doc.page_count:
+            raise HTTPException(status_code=400, detail="Todas las paginas del PDF estan vacias.")
+        if blank:
+            doc.delete_pages(blank)
+            doc.save(output_path, garbage=3, deflate=True)
+        else:
+            doc.save(output_path)
+    return output_path, [pno + 1 for pno in blank]
+
+
+def remove_blank_pages_base64(pdf_base64: str) -> Tuple[str, List[int]]:
+    """remove_blank_pages_file para un PDF en base64."""
+    with tempfile.TemporaryDirectory(prefix="pdftools_") as work_dir:
+        input_path = os.path.join(work_dir, "input.pdf")
+        with open(input_path, "wb") as f:
+            f.write(base64.b64decode(pdf_base64))
+        output_path, removed = remove_blank_pages_file(input_path, os.path.join(work_dir, "output.pdf"))
+        with open(output_path, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8"), removed
+
+
+def rasterize_and_compress_pdf_file(pdf_path: str, output_path: str) -> str:
+    """
+    Rasteriza las paginas no vacias del PDF unido en disco (ver
+    rasterize_pdf_file) y guarda el resultado en output_path. Retorna la ruta.
+    """
+    try:
+        return rasterize_pdf_file(pdf_path, output_path)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al comprimir el PDF: {str(e)}")
-
@@ -1,7 +1,32 @@
 import base64
-import subprocess
+import logging
+import shutil
 import tempfile
 import os
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException
+
+from services import stirling_client
+from services.stirling_client import PDF_CHECK_BYTES
+from services.result_cache import cached_file
+from services.compress_orchestrator import compress_pdf_report
+from services.pdf_analyzer import PREFLIGHT_ENABLED, analyze_pdf
+
+# Maximo que se lee de una respuesta de error para armar el mensaje
+ERROR_BODY_LIMIT = 64 * 1024
+
+OCR_FIELDS = {
+    'removeImagesAfter': 'false',
+    'clean': 'true',
+    'deskew': 'true',
+    'cleanFinal': 'true',
+    'ocrRenderType': 'hocr',
+    'ocrType': 'Normal',
+    'languages': 'eng',
+    'sidecar': 'false',
+}
 
 def ocr_pdf_and_return_base64(pdf_path: str) -> str:
     """
@@ -22,199 +47,148 @@ def ocr_pdf_and_return_base64(pdf_path: str) -> str:
         # Crear archivo temporal para la respuesta
         with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_output:
             output_file = temp_output.name
-        
-        # Construir comando curl con timeout
-        curl_command = [
-            'curl',
-            '-X', 'POST',
-            '--connect-timeout', '10',  # Timeout de conexión: 10 segundos
-            '--max-time', '300',        # Timeout total: 5 minutos
-            'http://192.168.2.33:30124/api/v1/misc/ocr-pdf',
-            '-F', 'removeImagesAfter=false',
-            '-F', 'clean=true',
-            '-F', 'deskew=true',
-            '-F', 'cleanFinal=true',
-            '-F', 'ocrRenderType=hocr',
-            '-F', f'fileInput=@{pdf_path};type=application/pdf',
-            '-F', 'ocrType=Normal',
-            '-F', 'languages=eng',
-            '-F', 'sidecar=false',
-            '-o', output_file
-        ]
-        
-        # Ejecutar curl
-        result = subprocess.run(
-            curl_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-        
-        # Verificar que el archivo de salida existe y tiene contenido
-        if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
-            raise Exception("OCR service returned empty response")
-        
-        # Verificar si la respuesta es un PDF válido o un mensaje de error
+
+        ocr_pdf_file(pdf_path, output_file)
+
         with open(output_file, 'rb') as f:
-            file_content = f.read()
-            
-            # Verificar si es un PDF válido
-            if len(file_content) >= 4 and file_content.startswith(b'%PDF'):
-                # Es un PDF válido, verificar que también termine correctamente
-                if b'%%EOF' in file_content:
-                    # PDF válido y completo, codificar en base64
-                    base64_result = base64.b64encode(file_content).decode('utf-8')
-                    return base64_result
-                else:
-                    # PDF incompleto o corrupto
-                    raise Exception("OCR service returned incomplete PDF")
-            else:
-                # No es un PDF válido, probablemente es un mensaje de error
-                try:
-                    # Intentar decodificar como texto para obtener el mensaje de error
-                    error_message = file_content.decode('utf-8').strip()
-                    # Si es un mensaje de error común, manejarlo específicamente
-                    if "already has OCR" in error_message.lower():
-                        raise Exception("PDF already contains OCR text")
-                    elif "unsupported" in error_message.lower():
-                        raise Exception("Unsupported PDF format")
-                    else:
-                        raise Exception(f"OCR service error: {error_message}")
-                except UnicodeDecodeError:
-                    # Si no se puede decodificar como texto, verificar si es HTML (respuesta de error web)
-                    if b'<html' in file_content[:100].lower() or b'<!doctype' in file_content[:100].lower():
-                        raise Exception("OCR service returned HTML error page (service may be down)")
-                    else:
-                        raise Exception("OCR service returned invalid response (not a PDF or readable error)")
-        
-    except subprocess.CalledProcessError as e:
-        error_msg = e.stderr.decode('utf-8') if e.stderr else "Unknown curl error"
-        raise Exception(f"OCR service request failed: {error_msg}")
-    except Exception as e:
-        raise Exception(f"OCR processing error: {str(e)}")
+            return base64.b64encode(f.read()).decode('utf-8')
     finally:
         # Limpiar archivo temporal de salida
         if output_file and os.path.exists(output_file):
             os.unlink(output_file)
-        
-        # Verificar que el archivo de salida existe y tiene contenido
-        if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
-            raise Exception("OCR service returned empty response")
-        
-        # Leer el archivo procesado y codificarlo en base64
-        with open(output_file, 'rb') as f:
-            pdf_data = f.read()
-            base64_result = base64.b64encode(pdf_data).decode('utf-8')
-        
-        return base64_result
-    
-def compress_pdf_base64(pdf_base64: str) -> str:
+
+
+def ocr_pdf_file(pdf_path: str, output_path: str) -> str:
     """
-    Comprime un PDF recibido en base64 usando el servicio externo y elige el mejor resultado según calidad visual y tamaño.
+    Aplica OCR a pdf_path usando el servicio externo y escribe el PDF resultante
+    en output_path, sin pasar por base64. Los resultados se guardan en la cache
+    por contenido, asi que reenviar el mismo PDF no vuelve a llamar al servicio.
+
+    Returns:
+        str: output_path
+
+    Un PDF donde todas las paginas ya tienen texto se devuelve sin cambios; si
+    solo algunas lo tienen, el servicio se salta esas paginas (skip-text).
+
+    Raises:
+        Exception: Si el proceso de OCR falla
     """
-    import tempfile
-    import subprocess
-    import os
-    import base64
-    from PIL import Image
+    fields = ocr_fields_for(pdf_path)
+    if fields is None:
+        logging.info("Todas las paginas tienen texto; se omite el OCR.")
+        shutil.copyfile(pdf_path, output_path)
+        return output_path
+    return cached_file("ocr", [pdf_path], fields, output_path,
+                       lambda: _ocr_pdf_file(pdf_path, output_path, fields))
 
-    def extract_first_page_image(pdf_bytes):
-        try:
-            import fitz  # PyMuPDF
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_pdf:
-                temp_pdf.write(pdf_bytes)
-                temp_pdf_path = temp_pdf.name
-            doc = fitz.open(temp_pdf_path)
-            page = doc.load_page(0)
-            pix = page.get_pixmap()
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            doc.close()
-            os.unlink(temp_pdf_path)
-            return img
-        except Exception:
-            return None
-
-    def ssim_score(img1, img2):
+
+def ocr_fields_for(pdf_path: str) -> Optional[dict]:
+    """
+    Campos de OCR segun el analisis previo del PDF: None si es digital (todas
+    las paginas con texto), skip-text si es mixto, OCR_FIELDS si no hay texto.
+    """
+    if not PREFLIGHT_ENABLED:
+        return OCR_FIELDS
+    try:
+        analysis = analyze_pdf(pdf_path)
+    except Exception as e:
+        logging.warning(f"No se pudo analizar el PDF antes del OCR: {e}")
+        return OCR_FIELDS
+    if analysis['born_digital']:
+        return None
+    if analysis['text_pages']:
+        return {**OCR_FIELDS, 'ocrType': 'skip-text'}
+    return OCR_FIELDS
+
+
+def _ocr_service_error(error_message: str) -> Exception:
+    # Si es un mensaje de error común, manejarlo específicamente
+    if "already has ocr" in error_message.lower():
+        return Exception("PDF already contains OCR text")
+    elif "unsupported" in error_message.lower():
+        return Exception("Unsupported PDF format")
+    return Exception(f"OCR service error: {error_message}")
+
+
+def _ocr_pdf_file(pdf_path: str, output_path: str, fields: dict = OCR_FIELDS) -> str:
+    try:
+        # Subida y descarga por streaming con el cliente compartido (keep-alive)
+        with open(pdf_path, 'rb') as src, open(output_path, 'wb') as out:
+            stirling_client.post_pdf(stirling_client.OCR_ENDPOINT, src, fields, out)
+
+        # Verificar que el archivo de salida tiene contenido
+        size = os.path.getsize(output_path)
+        if size == 0:
+            raise Exception("OCR service returned empty response")
+
+        # Verificar si la respuesta es un PDF válido o un mensaje de error
+        with open(output_path, 'rb') as f:
+            head = f.read(PDF_CHECK_BYTES)
+            if head.startswith(b'%PDF'):
+                # Es un PDF válido, verificar que también termine correctamente
+                f.seek(max(0, size - PDF_CHECK_BYTES))
+                if b'%%EOF' in f.read():
+                    return output_path
+                # PDF incompleto o corrupto
+                raise Exception("OCR service returned incomplete PDF")
+            file_content = head + f.read(ERROR_BODY_LIMIT)
+
+        # No es un PDF válido, probablemente es un mensaje de error
         try:
-            from skimage.metrics import structural_similarity as ssim
-            import numpy as np
-            img1 = img1.convert('L').resize((400, 400))
-            img2 = img2.convert('L').resize((400, 400))
-            arr1 = np.array(img1)
-            arr2 = np.array(img2)
-            return ssim(arr1, arr2, data_range=255)
-        except Exception:
-            return 0.5
+            # Intentar decodificar como texto para obtener el mensaje de error
+            error_message = file_content.decode('utf-8').strip()
+        except UnicodeDecodeError:
+            # Si no se puede decodificar como texto, verificar si es HTML (respuesta de error web)
+            if b'<html' in file_content[:100].lower() or b'<!doctype' in file_content[:100].lower():
+                raise Exception("OCR service returned HTML error page (service may be down)")
+            raise Exception("OCR service returned invalid response (not a PDF or readable error)")
+        raise _ocr_service_error(error_message)
 
+    except HTTPException as e:
+        # Stirling respondio 4xx/5xx (ver stirling_client.post_pdf)
+        raise _ocr_service_error(str(e.detail))
+    except httpx.HTTPError as e:
+        raise Exception(f"OCR service request failed: {type(e).__name__}: {e}")
+    except Exception as e:
+        raise Exception(f"OCR processing error: {str(e)}")
+
+
+def compress_pdf_base64(pdf_base64: str, engine: Optional[str] = None, deadline: Optional[float] = None,
+                        max_bytes: Optional[int] = None) -> str:
+    """
+    Comprime un PDF recibido en base64 y elige el mejor resultado según calidad visual y tamaño.
+    engine: un motor de compress_engines.ENGINES, "remote" (Stirling) o "auto".
+    max_bytes: tamaño maximo del resultado (modo de tamaño objetivo).
+    """
+    return compress_pdf_base64_report(pdf_base64, engine, deadline, max_bytes)[0]
+
+
+def compress_pdf_base64_report(pdf_base64: str, engine: Optional[str] = None, deadline: Optional[float] = None,
+                               max_bytes: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    compress_pdf_base64 con el reporte de la busqueda (candidatos abandonados,
+    si llego el deadline). deadline es una hora absoluta (time.time()).
+    """
     pdf_bytes = base64.b64decode(pdf_base64)
-    original_size = len(pdf_bytes)
-    ref_img = extract_first_page_image(pdf_bytes)
+    compressed, report = compress_pdf_report(pdf_bytes, engine=engine, deadline=deadline, max_bytes=max_bytes)
+    return base64.b64encode(compressed).decode('utf-8'), report
 
-    # Configuraciones de compresión a probar
-    configs = [
-        {'optimize_level': 1, 'target_ratio': 0.825},
-        {'optimize_level': 3, 'target_ratio': 0.85},
-        {'optimize_level': 5, 'target_ratio': 0.825},
-    ]
 
-    best_score = 0
-    best_pdf_b64 = pdf_base64
+def compress_pdf_file(pdf_path: str, output_path: str, engine: Optional[str] = None,
+                      deadline: Optional[float] = None, max_bytes: Optional[int] = None) -> str:
+    """
+    Comprime pdf_path y escribe el mejor resultado en output_path.
+    """
+    return compress_pdf_file_report(pdf_path, output_path, engine, deadline, max_bytes)[0]
 
-    for cfg in configs:
-        try:
-            target_size = int(original_size * cfg['target_ratio'])
-            if target_size >= 1024*1024:
-                expected_output_size = f"{round(target_size/1024/1024)}MB"
-            else:
-                expected_output_size = f"{round(target_size/1024)}KB"
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_input:
-                temp_input.write(pdf_bytes)
-                input_file = temp_input.name
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_output:
-                output_file = temp_output.name
-            curl_command = [
-                'curl',
-                '-X', 'POST',
-                '--connect-timeout', '10',
-                '--max-time', '300',
-                'http://192.168.2.33:30124/api/v1/misc/compress-pdf',
-                '-F', f'fileInput=@{input_file};type=application/pdf',
-                '-F', f'optimizeLevel={cfg["optimize_level"]}',
-                '-F', f'expectedOutputSize={expected_output_size}',
-                '-F', 'linearize=true',
-                '-F', 'normalize=true',
-                '-F', 'grayscale=false',
-                '-o', output_file
-            ]
-            subprocess.run(curl_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-            if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
-                continue
-            with open(output_file, 'rb') as f:
-                file_content = f.read()
-            if len(file_content) < 4 or not file_content.startswith(b'%PDF') or b'%%EOF' not in file_content:
-                continue
-            comp_b64 = base64.b64encode(file_content).decode('utf-8')
-            comp_img = extract_first_page_image(file_content) if ref_img else None
-            if ref_img and comp_img:
-                quality = ssim_score(ref_img, comp_img)
-            else:
-                quality = 1.0
-            size_ratio = len(file_content) / original_size
-            # Score: prioriza calidad, pero premia reducción si calidad > 0.95
-            score = (quality * 0.7) + ((1-size_ratio) * 0.3)
-            if score > best_score:
-                best_score = score
-                best_pdf_b64 = comp_b64
-            os.unlink(input_file)
-            os.unlink(output_file)
-        except Exception:
-            try:
-                os.unlink(input_file)
-            except:
-                pass
-            try:
-                os.unlink(output_file)
-            except:
-                pass
-            continue
-    return best_pdf_b64
+
+def compress_pdf_file_report(pdf_path: str, output_path: str, engine: Optional[str] = None,
+                             deadline: Optional[float] = None,
+                             max_bytes: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """compress_pdf_file con el reporte de la busqueda."""
+    with open(pdf_path, 'rb') as f:
+        pdf_bytes = f.read()
+    compressed, report = compress_pdf_report(pdf_bytes, engine=engine, deadline=deadline, max_bytes=max_bytes)
+    with open(output_path, 'wb') as f:
+        f.write(compressed)
+    return output_path, report
@@ -0,0 +1,207 @@
+import os
+import base64
+import logging
+from io import BytesIO
+from typing import Any, Dict, Tuple, Union
+
+import fitz  # PyMuPDF
+import pikepdf
+from fastapi import HTTPException
+
+from services.local_compress import DPI_TOLERANCE, LOCAL_MIN_IMAGE_BYTES, LOCAL_TARGET_DPI
+
+# Compresion y OCR consultan el analisis para evitar trabajo inutil
+PREFLIGHT_ENABLED = os.getenv("PDFTOOLS_PREFLIGHT", "1") not in ("0", "false", "no")
+# Una pagina sin texto con imagenes que cubren al menos esta fraccion parece escaneada
+SCANNED_COVERAGE = 0.6
+# Caracteres visibles minimos para considerar que una pagina tiene texto
+MIN_TEXT_CHARS = 8
+# Un PDF se considera optimizado si lo que se podria recomprimir es menos que esto
+OPTIMIZED_MAX_RECOMPRESSIBLE = float(os.getenv("PDFTOOLS_OPTIMIZED_MAX_RECOMPRESSIBLE", "0.05"))
+
+# Entra en la clave de cache de la compresion: un cambio que altera "optimized"
+# invalida los resultados guardados con el analisis anterior
+ANALYZER_VERSION = 2
+
+# Filtros de imagen que ya son compresion con perdida o especifica de bilevel
+LOSSY_CODECS = {"DCTDecode", "JPXDecode", "CCITTFaxDecode", "JBIG2Decode"}
+FONT_FILE_KEYS = ("/FontFile", "/FontFile2", "/FontFile3")
+
+PDFInput = Union[bytes, str]
+
+
+def _codec(filter_value: str) -> str:
+    # "DCTDecode", "/FlateDecode" o "[/FlateDecode /DCTDecode]": el ultimo filtro es el de la imagen
+    names = filter_value.replace("[", " ").replace("]", " ").replace("/", " ").split()
+    return names[-1] if names else "none"
+
+
+def _stream_bytes(doc: fitz.Document, xref: int) -> int:
+    # El stream crudo y no /Length: los escaneres suelen escribirlo como referencia indirecta
+    return len(doc.xref_stream_raw(xref) or b"")
+
+
+def _image_source(doc: fitz.Document, item: tuple, sources: Dict[int, dict]) -> Dict[str, Any]:
+    # Codec y bytes de una imagen, una vez por xref aunque aparezca en varias paginas
+    xref, filter_value = item[0], item[8]
+    if xref not in sources:
+        sources[xref] = {"codec": _codec(filter_value) if filter_value else "none",
+                         "bytes": _stream_bytes(doc, xref)}
+    return sources[xref]
+
+
+def _page_info(doc: fitz.Document, page: fitz.Page, sources: Dict[int, dict]) -> Dict[str, Any]:
+    text_chars = len("".join(page.get_text("text").split()))
+    page_area = abs(page.rect) or 1.0
+    # get_image_info sin xrefs no decodifica las imagenes: la cobertura sale de
+    # ahi (todas las apariciones, tambien imagenes inline)
+    covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+    images = []
+    # Cada imagen por su xref (get_image_bbox tampoco decodifica)
+    for item in page.get_images(full=True):
+        xref, width, height, bpc = item[0], item[2], item[3], item[4]
+        try:
+            bbox = page.get_image_bbox(item) & page.rect
+        except Exception:
+            continue
+        if bbox.is_empty or bbox.is_infinite:
+            continue
+        source = _image_source(doc, item, sources)
+        images.append({
+            "xref": xref,
+            "width": width,
+            "height": height,
+            "bpc": bpc,
+            "colorspace": item[5],
+            "dpi": round(max(width / (bbox.width / 72), height / (bbox.height / 72))),
+            "codec": source["codec"],
+            "bytes": source["bytes"],
+        })
+    has_text = text_chars >= MIN_TEXT_CHARS
+    return {
+        "index": page.number,
+        "has_text": has_text,
+        "text_chars": text_chars,
+        "image_count": len(images),
+        "image_coverage": round(min(1.0, covered / page_area), 3),
+        "scanned": not has_text and covered / page_area >= SCANNED_COVERAGE,
+        "images": images,
+    }
+
+
+def _byte_breakdown(pdf_bytes: bytes) -> Tuple[Dict[str, int], int]:
+    """
+    Bytes (comprimidos) de los streams por tipo de objeto, con pikepdf, y
+    bytes de streams que no son imagenes y estan sin comprimir.
+    """
+    breakdown: Dict[str, int] = {}
+    uncompressed = 0
+    with pikepdf.open(BytesIO(pdf_bytes)) as pdf:
+        fonts = set()
+        contents = set()
+        for obj in pdf.objects:
+            if isinstance(obj, pikepdf.Dictionary) and obj.get("/Type") == "/FontDescriptor":
+                fonts.update(obj[key].objgen for key in FONT_FILE_KEYS if key in obj)
+        for page in pdf.pages:
+            page_contents = page.obj.get("/Contents")
+            if isinstance(page_contents, pikepdf.Array):
+                contents.update(c.objgen for c in page_contents)
+            elif page_contents is not None:
+                contents.add(page_contents.objgen)
+        streams = 0
+        for obj in pdf.objects:
+            if not isinstance(obj, pikepdf.Stream):
+                continue
+            # Como en _stream_bytes: el stream crudo, no el /Length declarado
+            length = len(obj.read_raw_bytes())
+            subtype = obj.stream_dict.get("/Subtype")
+            if obj.objgen in fonts:
+                kind = "font"
+            elif obj.objgen in contents:
+                kind = "content"
+            elif subtype == "/Image":
+                kind = "image"
+            elif subtype == "/Form":
+                kind = "form"
+            elif obj.stream_dict.get("/Type") == "/Metadata":
+                kind = "metadata"
+            elif "/N" in obj.stream_dict and "/Alternate" in obj.stream_dict:
+                kind = "icc"
+            else:
+                kind = "other_stream"
+            breakdown[kind] = breakdown.get(kind, 0) + length
+            streams += length
+            if kind != "image" and "/Filter" not in obj.stream_dict:
+                uncompressed += length
+    # Diccionarios, xref, trailer y el propio formato
+    breakdown["structure"] = max(0, len(pdf_bytes) - streams)
+    return breakdown, uncompressed
+
+
+def analyze_pdf(source: PDFInput) -> Dict[str, Any]:
+    """
+    Analisis previo de un PDF (bytes o ruta) sin renderizar: paginas y si
+    tienen texto, imagenes (DPI efectivo, codec, bytes del stream), bytes de
+    fuentes, bytes por tipo de objeto y paginas que parecen escaneadas.
+    "images" tiene cada imagen una vez aunque se use en varias paginas.
+
+    "born_digital" es True si todas las paginas tienen texto (OCR no aporta) y
+    "optimized" si lo recomprimible (imagenes por encima del DPI objetivo o sin
+    codec con perdida, y streams sin comprimir) es menos de
+    OPTIMIZED_MAX_RECOMPRESSIBLE del archivo y la estructura ya usa object
+    streams o es despreciable.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        pdf_bytes = source
+    try:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            sources: Dict[int, dict] = {}
+            pages = [_page_info(doc, page, sources) for page in doc]
+            page_count = doc.page_count
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"No se pudo analizar el PDF: {e}")
+    try:
+        breakdown, uncompressed = _byte_breakdown(pdf_bytes)
+    except Exception as e:
+        logging.warning(f"No se pudo calcular el desglose de bytes: {e}")
+        breakdown, uncompressed = {}, 0
+
+    # Una imagen compartida entre paginas se cuenta una vez, con su mayor DPI
+    images_by_xref: Dict[int, dict] = {}
+    for img in (img for page in pages for img in page["images"]):
+        if img["xref"] not in images_by_xref or img["dpi"] > images_by_xref[img["xref"]]["dpi"]:
+            images_by_xref[img["xref"]] = img
+    images = list(images_by_xref.values())
+    recompressible = sum(
+        img["bytes"] for img in images
+        if img["bytes"] >= LOCAL_MIN_IMAGE_BYTES and img["bpc"] != 1
+        and (img["dpi"] > LOCAL_TARGET_DPI * DPI_TOLERANCE or img["codec"] not in LOSSY_CODECS)
+    ) + uncompressed
+    text_pages = sum(1 for page in pages if page["has_text"])
+    object_streams = b"/ObjStm" in pdf_bytes
+    structure = breakdown.get("structure", 0)
+    threshold = len(pdf_bytes) * OPTIMIZED_MAX_RECOMPRESSIBLE
+    return {
+        "size": len(pdf_bytes),
+        "page_count": page_count,
+        "text_pages": text_pages,
+        "scanned_pages": sum(1 for page in pages if page["scanned"]),
+        "image_count": len(images),
+        "max_image_dpi": max((img["dpi"] for img in images), default=0),
+        "images": images,
+        "font_bytes": breakdown.get("font", 0),
+        "bytes_by_type": breakdown,
+        "recompressible_bytes": recompressible,
+        "object_streams": object_streams,
+        "born_digital": page_count > 0 and text_pages == page_count,
+        "optimized": recompressible < threshold and (object_streams or structure < threshold),
+        "pages": pages,
+    }
+
+
+def analyze_pdf_base64(pdf_base64: str) -> Dict[str, Any]:
+    """analyze_pdf para un PDF recibido en base64."""
+    return analyze_pdf(base64.b64decode(pdf_base64))
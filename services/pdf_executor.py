@@ -0,0 +1,153 @@
+import os
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+# PDFTOOLS_POOL_SIZE: procesos worker para trabajo de CPU (por defecto, nucleos)
+# PDFTOOLS_QUEUE_SIZE: trabajos admitidos a la vez (corriendo + en espera)
+# PDFTOOLS_LIMIT_<TOOL>: maximo de trabajos simultaneos de una herramienta
+POOL_SIZE = int(os.getenv("PDFTOOLS_POOL_SIZE", os.cpu_count() or 2))
+QUEUE_SIZE = int(os.getenv("PDFTOOLS_QUEUE_SIZE", "32"))
+TOOLS = ["merge", "merge_compress", "compress", "ocr", "analyze", "remove_blank"]
+
+
+def _tool_limits() -> Dict[str, int]:
+    return {tool: int(os.getenv(f"PDFTOOLS_LIMIT_{tool.upper()}", POOL_SIZE)) for tool in TOOLS}
+
+
+class PoolBusyError(Exception):
+    """La cola del executor esta llena."""
+
+
+class WorkerHTTPError(Exception):
+    """HTTPException serializable para cruzar la frontera del proceso worker."""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _invoke(fn: Callable, args: tuple, kwargs: dict) -> Any:
+    # Se ejecuta en el proceso worker. HTTPException no se puede des-serializar
+    # (sus argumentos son keyword-only en la practica), asi que se traduce.
+    try:
+        return fn(*args, **kwargs)
+    except HTTPException as e:
+        raise WorkerHTTPError(e.status_code, e.detail) from None
+
+
+class PDFExecutor:
+    """
+    Ejecuta funciones de services/ en un pool de procesos acotado.
+
+    Cada trabajo ocupa un lugar en la cola (QUEUE_SIZE) desde que se envia hasta
+    que termina; si no hay lugar se rechaza con PoolBusyError. Un hilo despachador
+    espera el semaforo de la herramienta y luego el resultado del proceso, de modo
+    que el event loop solo espera un Future.
+    """
+
+    def __init__(self, max_workers: int = POOL_SIZE, queue_size: int = QUEUE_SIZE,
+                 tool_limits: Optional[Dict[str, int]] = None):
+        self.max_workers = max(1, max_workers)
+        self.queue_size = max(self.max_workers, queue_size)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running: Dict[str, int] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._dispatcher = ThreadPoolExecutor(max_workers=self.queue_size, thread_name_prefix="pdf-dispatch")
+        limits = tool_limits if tool_limits is not None else _tool_limits()
+        self._limits = {tool: threading.BoundedSemaphore(max(1, n)) for tool, n in limits.items()}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn: fork desde un proceso con hilos (uvicorn, despachadores) puede
+                # heredar locks tomados; igual que el pool de rasterizado
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _reset_pool(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._pool is broken:
+                self._pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _limit(self, tool: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if tool not in self._limits:
+                self._limits[tool] = threading.BoundedSemaphore(self.max_workers)
+            return self._limits[tool]
+
+    def submit(self, tool: str, fn: Callable, *args, **kwargs) -> Future:
+        """Encola fn(*args, **kwargs) para la herramienta tool. Retorna un Future."""
+        with self._lock:
+            if self._pending >= self.queue_size:
+                raise PoolBusyError(f"La cola de trabajos PDF esta llena ({self.queue_size}).")
+            self._pending += 1
+        try:
+            return self._dispatcher.submit(self._dispatch, tool, fn, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    def _dispatch(self, tool: str, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        try:
+            with self._limit(tool):
+                with self._lock:
+                    self._running[tool] = self._running.get(tool, 0) + 1
+                try:
+                    pool = self._get_pool()
+                    try:
+                        return pool.submit(_invoke, fn, args, kwargs).result()
+                    except WorkerHTTPError as e:
+                        raise HTTPException(status_code=e.status_code, detail=e.detail) from None
+                    except BrokenProcessPool:
+                        logger.exception("Pool de procesos roto ejecutando %s; se recrea", tool)
+                        self._reset_pool(pool)
+                        raise
+                finally:
+                    with self._lock:
+                        self._running[tool] -= 1
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def run(self, tool: str, fn: Callable, *args, **kwargs) -> Any:
+        """Version async de submit para los endpoints. Cola llena -> HTTP 503."""
+        try:
+            future = self.submit(tool, fn, *args, **kwargs)
+        except PoolBusyError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pool_size": self.max_workers,
+                "queue_size": self.queue_size,
+                "pending": self._pending,
+                "running": {tool: n for tool, n in self._running.items() if n},
+            }
+
+    def shutdown(self) -> None:
+        self._dispatcher.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Executor compartido por todas las apps montadas en main.py
+pdf_executor = PDFExecutor()
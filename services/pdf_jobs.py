@@ -0,0 +1,149 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+from fastapi import HTTPException
+
+from services.pdf_executor import PDFExecutor, pdf_executor
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se conserva un trabajo terminado antes de limpiarlo automaticamente
+JOB_TTL = int(os.getenv("PDFTOOLS_JOB_TTL", "3600"))
+
+
+class JobNotReadyError(Exception):
+    """El trabajo existe pero no tiene resultado (en curso o con error)."""
+
+
+class PDFJobManager:
+    """
+    Trabajos PDF asincronos con el mismo flujo que FTPTaskManager:
+    submit -> status -> result -> delete.
+
+    Cada trabajo tiene un directorio propio donde se dejan las entradas y el
+    PDF resultante (result.pdf). El trabajo en si corre en el PDFExecutor
+    compartido, asi que respeta el tamaño del pool y los limites por herramienta.
+    """
+
+    RESULT_NAME = "result.pdf"
+
+    def __init__(self, executor: PDFExecutor, base_tmp: str = "tmp/pdf_jobs", ttl: int = JOB_TTL):
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self.executor = executor
+        self.base_tmp = base_tmp
+        self.ttl = ttl
+        os.makedirs(self.base_tmp, exist_ok=True)
+
+    def create_job(self, tool: str) -> Dict[str, Any]:
+        """Reserva un id y un directorio para que el llamador deje las entradas."""
+        self._purge_expired()
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.base_tmp, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        job = {
+            "id": job_id,
+            "tool": tool,
+            "status": "pending",
+            "error": None,
+            "dir": job_dir,
+            "created": time.time(),
+            "finished": None,
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    def start(self, job_id: str, fn: Callable[..., str], *args, **kwargs) -> None:
+        """
+        Ejecuta fn(*args, output_path, **kwargs) en el executor. fn debe escribir
+        el PDF en output_path (o retornar la ruta donde lo dejo, que se mueve al
+        directorio del trabajo).
+        """
+        job = self._get(job_id)
+        output_path = os.path.join(job["dir"], self.RESULT_NAME)
+        job["status"] = "in_progress"
+        try:
+            future = self.executor.submit(job["tool"], fn, *args, output_path, **kwargs)
+        except Exception:
+            self.delete(job_id)
+            raise
+        future.add_done_callback(lambda f: self._finish(job_id, output_path, f))
+
+    def _finish(self, job_id: str, output_path: str, future: Future) -> None:
+        job = self._jobs.get(job_id)
+        if not job:
+            # Eliminado mientras corria: limpiar lo que haya dejado
+            self._discard_result(future)
+            return
+        try:
+            result_path = future.result()
+            if result_path and os.path.abspath(result_path) != os.path.abspath(output_path):
+                shutil.move(result_path, output_path)
+            job["status"] = "completed"
+        except HTTPException as e:
+            job["error"] = str(e.detail)
+            job["status"] = "error"
+        except Exception as e:
+            logger.exception("Error in PDF job %s", job_id)
+            job["error"] = str(e)
+            job["status"] = "error"
+        job["finished"] = time.time()
+
+    @staticmethod
+    def _discard_result(future: Future) -> None:
+        try:
+            result_path = future.result()
+            if result_path and os.path.isfile(result_path):
+                os.remove(result_path)
+        except Exception:
+            pass
+
+    def _get(self, job_id: str) -> Dict[str, Any]:
+        job = self._jobs.get(job_id)
+        if not job:
+            raise KeyError("Job id not found")
+        return job
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        job = self._get(job_id)
+        return {"job_id": job_id, "tool": job["tool"], "status": job["status"], "error": job["error"]}
+
+    def result_path(self, job_id: str) -> str:
+        """Ruta del PDF resultante. JobNotReadyError si el trabajo aun no termino bien."""
+        job = self._get(job_id)
+        if job["status"] != "completed":
+            raise JobNotReadyError(f"Job is {job['status']}")
+        return os.path.join(job["dir"], self.RESULT_NAME)
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if not job:
+            raise KeyError("Job id not found")
+        shutil.rmtree(job["dir"], ignore_errors=True)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [self.status(job_id) for job_id in list(self._jobs)]
+
+    def _purge_expired(self) -> None:
+        if self.ttl <= 0:
+            return
+        now = time.time()
+        expired = [job_id for job_id, job in list(self._jobs.items())
+                   if job["finished"] is not None and now - job["finished"] > self.ttl]
+        for job_id in expired:
+            try:
+                self.delete(job_id)
+            except KeyError:
+                pass
+
+
+# Shared singleton manager that can be imported by REST apps
+manager = PDFJobManager(pdf_executor)
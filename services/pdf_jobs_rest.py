@@ -0,0 +1,121 @@
+import os
+import base64
+import binascii
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel
+
+from services.pdf_executor import PoolBusyError
+from services.pdf_jobs import JobNotReadyError, manager
+from services.ocrtext import ocr_pdf_file, compress_pdf_file
+from services.mergencompress import validate_merge_and_compress_pdf_files
+from services.compress_orchestrator import deadline_from_budget
+
+# Router that can be included in other apps
+router = APIRouter()
+
+
+class JobFileRequest(BaseModel):
+    filebase64: str
+
+
+class JobCompressRequest(JobFileRequest):
+    # Mismas opciones que /compresspdf
+    engine: Optional[str] = None
+    deadline_seconds: Optional[float] = None
+    max_bytes: Optional[int] = None
+
+
+class JobFilesRequest(BaseModel):
+    filesbase64: List[str]
+    backend: Optional[str] = None  # motor de merge, como en /merge-compress
+
+
+def _write_inputs(job_dir: str, files: List[str]) -> List[str]:
+    paths = []
+    for idx, file_base64 in enumerate(files):
+        path = os.path.join(job_dir, f"file_{idx + 1}.pdf")
+        with open(path, "wb") as f:
+            f.write(base64.b64decode(file_base64))
+        paths.append(path)
+    return paths
+
+
+def _submit(tool: str, files: List[str], fn, single: bool, **options) -> dict:
+    job = manager.create_job(tool)
+    try:
+        paths = _write_inputs(job["dir"], files)
+    except binascii.Error:
+        manager.delete(job["id"])
+        raise HTTPException(status_code=400, detail="Invalid base64 format")
+    try:
+        if single:
+            manager.start(job["id"], fn, paths[0], **options)
+        else:
+            manager.start(job["id"], fn, paths, job["dir"], **options)
+    except PoolBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job["id"], "status": "in_progress"}
+
+
+@router.post("/ocrpdf")
+def submit_ocr(req: JobFileRequest):
+    return _submit("ocr", [req.filebase64], ocr_pdf_file, single=True)
+
+
+@router.post("/compresspdf")
+def submit_compress(req: JobCompressRequest):
+    # El presupuesto corre desde que se recibe el trabajo, incluida la espera en el pool
+    deadline = deadline_from_budget(req.deadline_seconds)
+    return _submit("compress", [req.filebase64], compress_pdf_file, single=True,
+                   engine=req.engine, deadline=deadline, max_bytes=req.max_bytes)
+
+
+@router.post("/merge-compress")
+def submit_merge_compress(req: JobFilesRequest):
+    return _submit("merge_compress", req.filesbase64, validate_merge_and_compress_pdf_files, single=False,
+                   backend=req.backend)
+
+
+@router.get("/")
+def list_jobs():
+    return {"jobs": manager.list_jobs()}
+
+
+@router.get("/{job_id}")
+def job_status(job_id: str):
+    try:
+        return manager.status(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job id not found")
+
+
+def _result_path(job_id: str) -> str:
+    try:
+        return manager.result_path(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job id not found")
+    except JobNotReadyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.get("/{job_id}/result")
+def job_result(job_id: str):
+    with open(_result_path(job_id), "rb") as f:
+        return {"success": True, "filebase64": base64.b64encode(f.read()).decode("utf-8")}
+
+
+@router.get("/{job_id}/file")
+def job_file(job_id: str):
+    return FileResponse(_result_path(job_id), media_type="application/pdf", filename=f"{job_id}.pdf")
+
+
+@router.delete("/{job_id}")
+def delete_job(job_id: str):
+    try:
+        manager.delete(job_id)
+        return {"deleted": True}
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Job id not found")
@@ -0,0 +1,241 @@
+import os
+from typing import Dict, List, Optional, Sequence
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+from services.compress_fanout import check_deadline
+
+# Paginas muestreadas por documento y resolucion del render de comparacion. A
+# 72 DPI no se ven los artefactos de un rasterizado a 72 DPI (SSIM ~1); los
+# umbrales de calidad estan calibrados a 150 (benchmarks/quality_thresholds.py)
+QUALITY_SAMPLE_PAGES = int(os.getenv("PDFTOOLS_QUALITY_SAMPLE_PAGES", "5"))
+QUALITY_DPI = int(os.getenv("PDFTOOLS_QUALITY_DPI", "150"))
+# Metrica del puntaje: "ssim" o "ms-ssim"
+QUALITY_METRIC = os.getenv("PDFTOOLS_QUALITY_METRIC", "ssim")
+# Paginas con mas pixeles que esto se comparan en una muestra de mosaicos
+QUALITY_TILE_PIXELS = int(os.getenv("PDFTOOLS_QUALITY_TILE_PIXELS", str(2_000_000)))
+QUALITY_TILE_SIZE = 256
+QUALITY_MAX_TILES = int(os.getenv("PDFTOOLS_QUALITY_MAX_TILES", "16"))
+
+# Constantes de SSIM (Wang et al. 2004) para imagenes de 8 bits
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+_GAUSSIAN_SIGMA = 1.5
+_GAUSSIAN_KSIZE = (11, 11)
+# cv2 filtra hasta 512 canales de una vez; se apilan paginas como canales
+_MAX_CHANNELS = 512
+# Pesos de MS-SSIM por escala (Wang et al. 2003), de la mas fina a la mas gruesa
+_MS_WEIGHTS = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
+# Lado minimo de la escala mas gruesa: por debajo la ventana de 11 px no tiene sentido
+_MS_MIN_SIDE = 32
+
+
+def sample_page_indices(page_count: int, max_pages: int = QUALITY_SAMPLE_PAGES) -> List[int]:
+    """Primera, ultima y paginas equiespaciadas entre ambas (todas si son pocas)."""
+    if page_count <= 0:
+        return []
+    if max_pages <= 0 or page_count <= max_pages:
+        return list(range(page_count))
+    if max_pages == 1:
+        return [0]
+    step = (page_count - 1) / (max_pages - 1)
+    return sorted({round(i * step) for i in range(max_pages)})
+
+
+def render_gray_pages(doc: fitz.Document, page_indices: Sequence[int], dpi: int = QUALITY_DPI,
+                      deadline: Optional[float] = None) -> Dict[int, np.ndarray]:
+    """
+    Renderiza las paginas pedidas directamente en escala de grises (uint8).
+    Con deadline (hora absoluta, time.time()) corta entre paginas con DeadlineExceeded.
+    """
+    pages = {}
+    for idx in page_indices:
+        if idx >= doc.page_count:
+            continue
+        check_deadline(deadline)
+        pix = doc.load_page(idx).get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+        pages[idx] = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width].copy()
+    return pages
+
+
+def _blur(stack: np.ndarray) -> np.ndarray:
+    out = cv2.GaussianBlur(stack, _GAUSSIAN_KSIZE, _GAUSSIAN_SIGMA, borderType=cv2.BORDER_REFLECT)
+    return out.reshape(stack.shape)
+
+
+def _ssim_maps(x: np.ndarray, y: np.ndarray):
+    """Mapas de luminancia y contraste-estructura de SSIM para pilas (H, W, N) float32."""
+    mu_x = _blur(x)
+    mu_y = _blur(y)
+    sigma_xx = _blur(x * x)
+    sigma_yy = _blur(y * y)
+    sigma_xy = _blur(x * y)
+    mu_xx = mu_x * mu_x
+    mu_yy = mu_y * mu_y
+    # Operaciones en el lugar: en paginas grandes los temporales dominan el tiempo
+    mu_xy = mu_x
+    mu_xy *= mu_y
+    sigma_xx -= mu_xx
+    sigma_yy -= mu_yy
+    sigma_xy -= mu_xy
+    luminance = mu_xy
+    luminance *= 2
+    luminance += _C1
+    mu_xx += mu_yy
+    mu_xx += _C1
+    luminance /= mu_xx
+    contrast_structure = sigma_xy
+    contrast_structure *= 2
+    contrast_structure += _C2
+    sigma_xx += sigma_yy
+    sigma_xx += _C2
+    contrast_structure /= sigma_xx
+    return luminance, contrast_structure
+
+
+def _channel_mean(values: np.ndarray) -> np.ndarray:
+    return values.reshape(-1, values.shape[-1]).mean(axis=0)
+
+
+def ssim_batch(refs: np.ndarray, cands: np.ndarray) -> np.ndarray:
+    """
+    SSIM gaussiano de pares de imagenes del mismo tamaño, apiladas como (H, W, N).
+    Cada filtro procesa todas las paginas a la vez. Retorna un array de N valores.
+    """
+    luminance, contrast_structure = _ssim_maps(refs.astype(np.float32), cands.astype(np.float32))
+    luminance *= contrast_structure
+    return _channel_mean(luminance)
+
+
+def _downsample(stack: np.ndarray) -> np.ndarray:
+    height, width = stack.shape[:2]
+    out = cv2.resize(stack, (width // 2, height // 2), interpolation=cv2.INTER_AREA)
+    return out.reshape(height // 2, width // 2, stack.shape[-1])
+
+
+def ms_ssim_batch(refs: np.ndarray, cands: np.ndarray, scales: int = len(_MS_WEIGHTS)) -> np.ndarray:
+    """
+    MS-SSIM de pares apilados como (H, W, N): contraste-estructura en cada
+    escala (reduciendo a la mitad) y luminancia en la mas gruesa. Se usan
+    menos escalas si la imagen es chica; los pesos se renormalizan.
+    """
+    x = refs.astype(np.float32)
+    y = cands.astype(np.float32)
+    scales = max(1, min(scales, len(_MS_WEIGHTS)))
+    while scales > 1 and min(x.shape[:2]) >> (scales - 1) < _MS_MIN_SIDE:
+        scales -= 1
+    weights = np.array(_MS_WEIGHTS[:scales], dtype=np.float64)
+    weights /= weights.sum()
+    result = np.ones(x.shape[-1], dtype=np.float64)
+    for level in range(scales):
+        luminance, contrast_structure = _ssim_maps(x, y)
+        if level == scales - 1:
+            value = _channel_mean(luminance * contrast_structure)
+        else:
+            value = _channel_mean(contrast_structure)
+            x, y = _downsample(x), _downsample(y)
+        # Un valor negativo (estructura invertida) no puede elevarse a un peso fraccionario
+        result *= np.maximum(value, 0.0) ** weights[level]
+    return result
+
+
+def tile_origins(shape: tuple, tile: int = QUALITY_TILE_SIZE, max_tiles: int = QUALITY_MAX_TILES) -> List[tuple]:
+    """
+    Esquinas de una grilla regular de a lo sumo max_tiles mosaicos de tile x tile
+    que cubre la imagen de forma pareja (deterministico: igual para todos los candidatos).
+    """
+    height, width = shape[:2]
+    if height <= tile or width <= tile:
+        return [(0, 0)]
+    rows = max(1, min(int(np.sqrt(max_tiles * height / width)), height // tile))
+    cols = max(1, min(max_tiles // rows, width // tile))
+    ys = np.linspace(0, height - tile, rows).astype(int)
+    xs = np.linspace(0, width - tile, cols).astype(int)
+    return [(int(y0), int(x0)) for y0 in ys for x0 in xs]
+
+
+def _tiles(image: np.ndarray, origins: Sequence[tuple], tile: int) -> np.ndarray:
+    return np.stack([image[y0:y0 + tile, x0:x0 + tile] for y0, x0 in origins], axis=-1)
+
+
+def ssim(ref: np.ndarray, cand: np.ndarray, metric: str = "ssim", tiles: Optional[bool] = None) -> float:
+    """
+    SSIM (o MS-SSIM) de un par de imagenes en gris del mismo tamaño. tiles
+    fuerza (True) o evita (False) la muestra de mosaicos; None decide por tamaño.
+    """
+    tile_pixels = None if tiles is None else (0 if tiles else ref.size)
+    return _grouped_ssim({0: (ref, cand)}, metric, tile_pixels)[0]
+
+
+def _tiled_ssim(ref: np.ndarray, cand: np.ndarray, metric: str) -> float:
+    # Pagina grande: promedio sobre una muestra de mosaicos, filtrados en lote
+    tile = min(QUALITY_TILE_SIZE, *ref.shape[:2])
+    origins = tile_origins(ref.shape, tile)
+    batch = ms_ssim_batch if metric == "ms-ssim" else ssim_batch
+    return float(batch(_tiles(ref, origins, tile), _tiles(cand, origins, tile)).mean())
+
+
+def _grouped_ssim(pairs: Dict[int, tuple], metric: str = QUALITY_METRIC,
+                  tile_pixels: Optional[int] = None) -> Dict[int, float]:
+    batch = ms_ssim_batch if metric == "ms-ssim" else ssim_batch
+    tile_pixels = QUALITY_TILE_PIXELS if tile_pixels is None else tile_pixels
+    # Agrupar por tamaño para apilar y filtrar en lote
+    groups: Dict[tuple, List[int]] = {}
+    scores = {}
+    for idx, (ref, cand) in pairs.items():
+        if ref.size > tile_pixels:
+            scores[idx] = _tiled_ssim(ref, cand, metric)
+        else:
+            groups.setdefault(ref.shape, []).append(idx)
+    for indices in groups.values():
+        for start in range(0, len(indices), _MAX_CHANNELS):
+            chunk = indices[start:start + _MAX_CHANNELS]
+            refs = np.stack([pairs[i][0] for i in chunk], axis=-1)
+            cands = np.stack([pairs[i][1] for i in chunk], axis=-1)
+            for idx, value in zip(chunk, batch(refs, cands)):
+                scores[idx] = float(value)
+    return scores
+
+
+class ReferenceRender:
+    """
+    Render de referencia de un PDF: las paginas muestreadas se renderizan una vez
+    y se guardan en gris, para puntuar cualquier cantidad de candidatos.
+    """
+
+    def __init__(self, pdf_bytes: bytes, max_pages: int = QUALITY_SAMPLE_PAGES, dpi: int = QUALITY_DPI,
+                 page_indices: Optional[Sequence[int]] = None, metric: str = QUALITY_METRIC,
+                 deadline: Optional[float] = None):
+        self.dpi = dpi
+        self.metric = metric
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            self.page_count = doc.page_count
+            indices = page_indices if page_indices is not None else sample_page_indices(doc.page_count, max_pages)
+            self.pages = render_gray_pages(doc, indices, dpi, deadline)
+
+    def score(self, candidate_bytes: bytes) -> Dict[str, object]:
+        """
+        Compara el candidato con la referencia en las paginas muestreadas.
+        Retorna {"pages": {indice: ssim}, "mean": ..., "min": ...}; una pagina
+        que falta en el candidato puntua 0.
+        """
+        with fitz.open(stream=candidate_bytes, filetype="pdf") as doc:
+            rendered = render_gray_pages(doc, list(self.pages), self.dpi)
+        pairs = {}
+        for idx, ref in self.pages.items():
+            cand = rendered.get(idx)
+            if cand is None:
+                continue
+            if cand.shape != ref.shape:
+                cand = cv2.resize(cand, (ref.shape[1], ref.shape[0]), interpolation=cv2.INTER_AREA)
+            pairs[idx] = (ref, cand)
+        per_page = _grouped_ssim(pairs, self.metric)
+        pages = {idx: per_page.get(idx, 0.0) for idx in self.pages}
+        values = list(pages.values())
+        return {
+            "pages": pages,
+            "mean": float(np.mean(values)) if values else 0.0,
+            "min": float(min(values)) if values else 0.0,
+        }
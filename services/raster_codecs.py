@@ -0,0 +1,285 @@
+import os
+import io
+import shutil
+import logging
+import subprocess
+import tempfile
+import zlib
+from typing import Any, Dict, Optional
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+from fastapi import HTTPException
+from PIL import Image
+
+# --- Configuración (variables de entorno) ---
+# Codec de las paginas rasterizadas: "auto" elige uno por pagina
+RASTER_CODEC = os.getenv("PDFTOOLS_RASTER_CODEC", "auto").strip().lower()
+RASTER_JPEG_QUALITY = int(os.getenv("PDFTOOLS_RASTER_JPEG_QUALITY", "75"))
+# Relacion de compresion de JPEG2000 (40 = 1/40 del tamaño sin comprimir)
+RASTER_JPX_RATE = float(os.getenv("PDFTOOLS_RASTER_JPX_RATE", "40"))
+# Proporcion minima de pixeles casi negros o casi blancos para tratar la pagina como bilevel
+RASTER_BILEVEL_SHARE = float(os.getenv("PDFTOOLS_RASTER_BILEVEL_SHARE", "0.98"))
+# Codificador JBIG2 externo (jbig2enc); sin el, las paginas bilevel van en CCITT G4
+JBIG2_COMMAND = os.getenv("PDFTOOLS_JBIG2_COMMAND") or shutil.which("jbig2")
+# "auto": las paginas sin color se renderizan en grises; "rgb": siempre en color
+RASTER_COLOR_MODE = os.getenv("PDFTOOLS_RASTER_COLOR", "auto").strip().lower()
+# Proporcion de pixeles con color a partir de la cual la pagina se guarda en color
+RASTER_COLOR_SHARE = float(os.getenv("PDFTOOLS_RASTER_COLOR_SHARE", "0.001"))
+# MRC: mascara de texto bilevel en alta resolucion sobre un fondo JPEG en baja
+MRC_MASK_DPI = int(os.getenv("PDFTOOLS_MRC_MASK_DPI", "300"))
+MRC_BACKGROUND_DPI = int(os.getenv("PDFTOOLS_MRC_BACKGROUND_DPI", "75"))
+MRC_BACKGROUND_QUALITY = int(os.getenv("PDFTOOLS_MRC_BACKGROUND_QUALITY", "50"))
+
+CODECS = ("auto", "flate", "jpeg", "jpx", "g4", "jbig2", "mrc")
+# Escala a la que se renderiza una pagina para el codec "mrc" (la de la mascara)
+MRC_RENDER_SCALE = MRC_MASK_DPI / 72
+# Segmentacion MRC: ventana (pulgadas) y contraste del umbral adaptativo, y
+# tamaño maximo (pulgadas) de un componente para ser texto y no foto/dibujo
+MRC_WINDOW_INCHES = 0.1
+MRC_CONTRAST = 25
+MRC_MAX_GLYPH_INCHES = 0.5
+MRC_MIN_GLYPH_PIXELS = 3
+# Croma (respecto del tono del papel) desde la que un pixel cuenta como "con color"
+COLOR_CHROMA = 30
+# Umbrales de gris para "casi negro" / "casi blanco"
+BILEVEL_DARK = 48
+BILEVEL_LIGHT = 208
+FLATE_LEVEL = 6
+
+
+def validate_codec(codec: str) -> str:
+    codec = (codec or RASTER_CODEC).strip().lower()
+    if codec not in CODECS:
+        raise HTTPException(status_code=400, detail=f"Codec de rasterizado desconocido: {codec}. Opciones: {', '.join(CODECS)}")
+    return codec
+
+
+def pixmap_array(pix: fitz.Pixmap) -> np.ndarray:
+    """
+    Muestras del pixmap como arreglo (alto, ancho, canales), sin copiar: solo
+    es valido mientras pix siga vivo.
+    """
+    samples = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    return samples[:, :pix.width * pix.n].reshape(pix.height, pix.width, pix.n)
+
+
+def grayscale(pixels: np.ndarray) -> np.ndarray:
+    if pixels.shape[2] == 1:
+        return pixels[:, :, 0]
+    # Luma entera (ITU-R 601) para no pasar por float en paginas grandes
+    rgb = pixels[:, :, :3].astype(np.uint16)
+    return ((rgb[:, :, 0] * 77 + rgb[:, :, 1] * 150 + rgb[:, :, 2] * 29) >> 8).astype(np.uint8)
+
+
+def color_share(pixels: np.ndarray) -> float:
+    """
+    Fraccion de pixeles con color. El croma se mide en los ejes oponentes
+    rojo-verde y amarillo-azul descontando la mediana de cada eje, asi el
+    tono del papel (amarillento, reciclado) no cuenta como color y un sello
+    o una firma en color sobre una pagina en blanco y negro si.
+    """
+    if pixels.shape[2] < 3:
+        return 0.0
+    rgb = pixels[:, :, :3].astype(np.int16)
+    rg = rgb[:, :, 0] - rgb[:, :, 1]
+    yb = ((rgb[:, :, 0] + rgb[:, :, 1]) >> 1) - rgb[:, :, 2]
+    rg -= np.int16(np.median(rg))
+    yb -= np.int16(np.median(yb))
+    colored = rg.astype(np.int32) ** 2 + yb.astype(np.int32) ** 2 > COLOR_CHROMA ** 2
+    return float(np.count_nonzero(colored) / colored.size)
+
+
+def is_colorful(pixels: np.ndarray) -> bool:
+    return color_share(pixels) >= RASTER_COLOR_SHARE
+
+
+def is_bilevel(gray: np.ndarray) -> bool:
+    """Casi todos los pixeles son negros o blancos (texto escaneado, formularios)."""
+    sample = gray[::2, ::2]
+    extreme = np.count_nonzero((sample <= BILEVEL_DARK) | (sample >= BILEVEL_LIGHT))
+    return extreme >= sample.size * RASTER_BILEVEL_SHARE
+
+
+def encode_jpx(pixels: np.ndarray, rate: float = RASTER_JPX_RATE) -> bytes:
+    mode = "L" if pixels.shape[2] == 1 else "RGB"
+    image = Image.fromarray(pixels[:, :, 0] if mode == "L" else pixels[:, :, :3], mode)
+    out = io.BytesIO()
+    image.save(out, format="JPEG2000", quality_mode="rates", quality_layers=[rate])
+    return out.getvalue()
+
+
+def encode_g4(mask: np.ndarray) -> tuple:
+    """
+    Codifica la mascara (True = tinta) en CCITT Group 4. Retorna los datos
+    crudos y BlackIs1 segun la interpretacion fotometrica que uso libtiff.
+    """
+    image = Image.fromarray(~mask)  # bool -> modo "1", blanco = 1
+    out = io.BytesIO()
+    # Una sola tira: los datos de la tira son el stream G4 completo
+    image.save(out, format="TIFF", compression="group4", strip_size=2 ** 31 - 1)
+    with Image.open(io.BytesIO(out.getvalue())) as tiff:
+        offset, count = tiff.tag_v2[273][0], tiff.tag_v2[279][0]
+        photometric = tiff.tag_v2.get(262, 0)
+    return out.getvalue()[offset:offset + count], photometric == 1
+
+
+def encode_jbig2(mask: np.ndarray) -> Optional[bytes]:
+    """Region generica JBIG2 via jbig2enc (None si no esta instalado o falla)."""
+    if not JBIG2_COMMAND:
+        return None
+    with tempfile.NamedTemporaryFile(suffix=".png") as source:
+        Image.fromarray(~mask).save(source, format="PNG")
+        source.flush()
+        try:
+            result = subprocess.run([JBIG2_COMMAND, "-p", source.name], capture_output=True, timeout=60, check=True)
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.warning(f"jbig2 fallo, se usa CCITT G4: {e}")
+            return None
+    return result.stdout or None
+
+
+def _insert_xobject(page: fitz.Page, rect: fitz.Rect, encoded: Dict[str, Any]) -> None:
+    # PyMuPDF no arma imagenes G4/JBIG2 (ni Flate ya comprimido, ni mascaras)
+    # desde un stream: el XObject se crea a mano
+    doc = page.parent
+    xref = doc.get_new_xref()
+    doc.update_object(xref, "<<>>")
+    # update_stream reescribe /Filter: las claves van despues
+    doc.update_stream(xref, encoded['data'], compress=False)
+    doc.xref_set_key(xref, "Type", "/XObject")
+    doc.xref_set_key(xref, "Subtype", "/Image")
+    doc.xref_set_key(xref, "Width", str(encoded['width']))
+    doc.xref_set_key(xref, "Height", str(encoded['height']))
+    if encoded.get('imagemask'):
+        # Mascara de imagen: pinta los pixeles 0 con el color de relleno actual
+        doc.xref_set_key(xref, "ImageMask", "true")
+    else:
+        doc.xref_set_key(xref, "ColorSpace", encoded['colorspace'])
+    doc.xref_set_key(xref, "BitsPerComponent", str(encoded['bpc']))
+    doc.xref_set_key(xref, "Filter", encoded['filter'])
+    if encoded.get('parms'):
+        doc.xref_set_key(xref, "DecodeParms", encoded['parms'])
+    page.insert_image(rect, xref=xref)
+
+
+def _bilevel(codec: str, data: bytes, width: int, height: int, filter_name: str,
+             parms: Optional[str] = None) -> Dict[str, Any]:
+    return {'codec': codec, 'data': data, 'width': width, 'height': height, 'colorspace': "/DeviceGray",
+            'bpc': 1, 'filter': filter_name, 'parms': parms}
+
+
+def encode_mask(mask: np.ndarray, allow_jbig2: bool = True) -> Dict[str, Any]:
+    """Mascara bilevel (True = tinta) en JBIG2 si hay codificador, si no en CCITT G4."""
+    height, width = mask.shape
+    if allow_jbig2:
+        data = encode_jbig2(mask)
+        if data:
+            return _bilevel("jbig2", data, width, height, "/JBIG2Decode")
+    data, black_is_1 = encode_g4(mask)
+    parms = f"<</K -1/Columns {width}/Rows {height}/BlackIs1 {'true' if black_is_1 else 'false'}>>"
+    return _bilevel("g4", data, width, height, "/CCITTFaxDecode", parms)
+
+
+def segment_text(gray: np.ndarray, dpi: float) -> np.ndarray:
+    """
+    Mascara de texto (True = tinta) de una pagina escaneada: pixeles mas
+    oscuros que su entorno (umbral adaptativo) que forman componentes del
+    tamaño de un caracter. Los componentes grandes (fotos, sellos, graficos)
+    quedan en el fondo.
+    """
+    window = max(3, int(dpi * MRC_WINDOW_INCHES) | 1)
+    ink = cv2.adaptiveThreshold(gray, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, window, MRC_CONTRAST)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    max_glyph = dpi * MRC_MAX_GLYPH_INCHES
+    keep = ((stats[:, cv2.CC_STAT_WIDTH] <= max_glyph) & (stats[:, cv2.CC_STAT_HEIGHT] <= max_glyph)
+            & (stats[:, cv2.CC_STAT_AREA] >= MRC_MIN_GLYPH_PIXELS))
+    keep[0] = False  # etiqueta 0 = fondo
+    return keep[labels]
+
+
+def encode_mrc(pixels: np.ndarray, dpi: float = MRC_MASK_DPI,
+               background_dpi: float = MRC_BACKGROUND_DPI) -> Dict[str, Any]:
+    """
+    Mixed Raster Content: separa el render (a dpi) en una mascara de texto
+    bilevel a resolucion completa y un fondo JPEG a background_dpi, donde los
+    pixeles de texto se rellenan con su entorno para que no queden manchas ni
+    el JPEG gaste bytes en bordes. El texto se pinta con su color mediano.
+    """
+    height, width, channels = pixels.shape
+    gray = grayscale(pixels)
+    mask = segment_text(gray, dpi)
+    ratio = min(1.0, background_dpi / dpi)
+    size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    source = pixels[:, :, 0] if channels == 1 else pixels[:, :, :3]
+    background = cv2.resize(source, size, interpolation=cv2.INTER_AREA)
+    layers = []
+    color = (0.0, 0.0, 0.0)
+    if mask.any():
+        small_mask = cv2.resize(mask.view(np.uint8) * 255, size, interpolation=cv2.INTER_AREA) > 0
+        small_mask = cv2.dilate(small_mask.view(np.uint8), np.ones((3, 3), np.uint8))
+        background = cv2.inpaint(background, small_mask, 3, cv2.INPAINT_TELEA)
+        ink = np.median(source[mask], axis=0)
+        color = tuple(float(c) / 255 for c in np.broadcast_to(ink, (3,)))
+    out = io.BytesIO()
+    Image.fromarray(background).save(out, format="JPEG", quality=MRC_BACKGROUND_QUALITY)
+    layers.append({'codec': "jpeg", 'data': out.getvalue()})
+    if mask.any():
+        layers.append(dict(encode_mask(mask), imagemask=True))
+    return {'codec': "mrc", 'layers': layers, 'color': color}
+
+
+def encoded_size(encoded: Dict[str, Any]) -> int:
+    """Bytes de las imagenes de un resultado de encode_raster."""
+    return sum(len(layer['data']) for layer in encoded.get('layers', [encoded]))
+
+
+def encode_flate(pixels: np.ndarray) -> Dict[str, Any]:
+    height, width, channels = pixels.shape
+    return {'codec': "flate", 'data': zlib.compress(pixels.tobytes(), FLATE_LEVEL), 'width': width,
+            'height': height, 'colorspace': "/DeviceGray" if channels == 1 else "/DeviceRGB",
+            'bpc': 8, 'filter': "/FlateDecode"}
+
+
+def encode_raster(pix: fitz.Pixmap, codec: str = RASTER_CODEC) -> Dict[str, Any]:
+    """
+    Codifica el render de una pagina (pixmap sin alfa) con el codec pedido.
+    En "auto" las paginas bilevel van en JBIG2 o CCITT G4 y las demas en
+    JPEG o Flate, el que resulte mas chico. "mrc" espera un render a
+    MRC_RENDER_SCALE (ver encode_mrc). Retorna {"codec", "data", ...}: con
+    "filter" es un XObject armado a mano, sin el un JPEG/JPEG2000 que
+    PyMuPDF inserta tal cual; con "layers", varias de esas capas en orden.
+    """
+    pixels = pixmap_array(pix)
+    if codec == "mrc":
+        return encode_mrc(pixels)
+    if codec in ("auto", "g4", "jbig2"):
+        gray = grayscale(pixels)
+        if codec != "auto" or is_bilevel(gray):
+            return encode_mask(gray < 128, allow_jbig2=codec != "g4")
+    if codec == "jpx":
+        return {'codec': "jpx", 'data': encode_jpx(pixels)}
+    if codec == "jpeg":
+        return {'codec': "jpeg", 'data': pix.tobytes("jpeg", jpg_quality=RASTER_JPEG_QUALITY)}
+    flate = encode_flate(pixels)
+    if codec == "auto":
+        jpeg = pix.tobytes("jpeg", jpg_quality=RASTER_JPEG_QUALITY)
+        if len(jpeg) < len(flate['data']):
+            return {'codec': "jpeg", 'data': jpeg}
+    return flate
+
+
+def insert_encoded(page: fitz.Page, rect: fitz.Rect, encoded: Dict[str, Any]) -> None:
+    if 'layers' in encoded:
+        for layer in encoded['layers']:
+            insert_encoded(page, rect, layer)
+            if layer.get('imagemask'):
+                # insert_image agrega un stream de contenido al final: se fija ahi el color de la mascara
+                doc, contents = page.parent, page.get_contents()[-1]
+                color = "%.3f %.3f %.3f rg\n" % encoded['color']
+                doc.update_stream(contents, color.encode() + doc.xref_stream(contents))
+    elif 'filter' in encoded:
+        _insert_xobject(page, rect, encoded)
+    else:
+        page.insert_image(rect, stream=encoded['data'])
@@ -0,0 +1,276 @@
+import os
+import json
+import hashlib
+import shutil
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración (variables de entorno) ---
+CACHE_ENABLED = os.getenv("PDFTOOLS_CACHE", "1") not in ("0", "false", "no")
+CACHE_DIR = os.getenv("PDFTOOLS_CACHE_DIR", "tmp/result_cache")
+CACHE_MEMORY_BYTES = int(os.getenv("PDFTOOLS_CACHE_MEMORY_MB", "64")) * 1024 * 1024
+CACHE_DISK_BYTES = int(os.getenv("PDFTOOLS_CACHE_DISK_MB", "1024")) * 1024 * 1024
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(operation: str, input_digests: Iterable[str], params: Optional[Dict[str, Any]] = None) -> str:
+    """Clave = SHA-256 de la operacion, los hashes de las entradas (en orden) y los parametros."""
+    digest = hashlib.sha256(operation.encode("utf-8"))
+    for input_digest in input_digests:
+        digest.update(b"\0" + input_digest.encode("ascii"))
+    digest.update(b"\0" + json.dumps(params or {}, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Cache de resultados (bytes) direccionado por contenido, en dos niveles:
+
+    - memoria: LRU por proceso limitado a memory_bytes.
+    - disco: un archivo por clave bajo directory, limitado a disk_bytes. Lo
+      comparten todos los workers; las escrituras son atomicas (os.replace) y
+      cada acierto actualiza el mtime, que es el orden LRU de la eviccion.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, memory_bytes: int = CACHE_MEMORY_BYTES,
+                 disk_bytes: int = CACHE_DISK_BYTES):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_used = 0
+        self._disk_used: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    # --- nivel memoria ---
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            return data
+
+    def _memory_put(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_used -= len(old)
+            self._memory[key] = data
+            self._memory_used += len(data)
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted)
+
+    # --- nivel disco ---
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def _disk_entries(self) -> List[os.DirEntry]:
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for bucket in os.scandir(self.directory):
+            if bucket.is_dir():
+                entries.extend(e for e in os.scandir(bucket.path) if e.is_file() and not e.name.startswith("."))
+        return entries
+
+    def _disk_put(self, key: str, data: bytes) -> None:
+        self._disk_store(key, len(data), lambda f: f.write(data))
+
+    def _disk_store(self, key: str, size: int, write: Callable[[BinaryIO], Any]) -> None:
+        # write(f) escribe los size bytes del resultado en el archivo temporal f
+        if size > self.disk_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            # Al reemplazar una entrada su tamaño deja de contar
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.exception("No se pudo escribir la cache %s", path)
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            return
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = sum(e.stat().st_size for e in self._disk_entries())
+            else:
+                self._disk_used += size - replaced
+            over_budget = self._disk_used > self.disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        # El directorio es la fuente de verdad: otros workers tambien escriben
+        entries = []
+        for entry in self._disk_entries():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        used = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if used <= self.disk_bytes:
+                break
+            try:
+                os.unlink(path)
+                used -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_used = used
+
+    # --- API ---
+    def get(self, key: str) -> Optional[bytes]:
+        data = self._memory_get(key)
+        if data is None:
+            data = self._disk_get(key)
+            if data is not None:
+                self._memory_put(key, data)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        self._memory_put(key, data)
+        self._disk_put(key, data)
+
+    def get_file(self, key: str, output_path: str) -> bool:
+        """
+        get() que escribe el resultado en output_path. Desde el nivel disco se
+        copia por bloques, sin cargarlo entero. Retorna si hubo acierto.
+        """
+        data = self._memory_get(key)
+        found = True
+        if data is not None:
+            with open(output_path, "wb") as f:
+                f.write(data)
+        else:
+            path = self._path(key)
+            try:
+                shutil.copyfile(path, output_path)
+                os.utime(path)
+            except OSError:
+                found = False
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def put_file(self, key: str, path: str) -> None:
+        """
+        put() para un resultado que ya esta en disco: se copia por bloques al
+        nivel disco. No pasa por el nivel memoria (seria leerlo entero).
+        """
+        def copy(f: BinaryIO) -> None:
+            with open(path, "rb") as src:
+                shutil.copyfileobj(src, f, HASH_CHUNK_SIZE)
+
+        self._disk_store(key, os.path.getsize(path), copy)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+            self._disk_used = 0
+        for entry in self._disk_entries():
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+
+result_cache = ResultCache()
+
+
+def _key_for(operation: str, inputs: Iterable[Union[bytes, str]], params: Optional[Dict[str, Any]]) -> str:
+    digests = [sha256_bytes(i) if isinstance(i, (bytes, bytearray)) else sha256_file(i) for i in inputs]
+    return cache_key(operation, digests, params)
+
+
+def cached(operation: str, inputs: Iterable[Union[bytes, str]], params: Optional[Dict[str, Any]],
+           compute: Callable[[], bytes], store: Optional[Callable[[], bool]] = None) -> bytes:
+    """
+    Retorna el resultado en cache para (operation, inputs, params) o lo calcula
+    con compute() y lo guarda. inputs son bytes o rutas de archivo. store(),
+    si se da, decide despues de compute() si el resultado se guarda (p. ej.
+    no se guarda un resultado parcial).
+    """
+    if not CACHE_ENABLED:
+        return compute()
+    key = _key_for(operation, inputs, params)
+    data = result_cache.get(key)
+    if data is not None:
+        logger.info("Cache hit %s (%s)", operation, key[:12])
+        return data
+    data = compute()
+    if store is None or store():
+        result_cache.put(key, data)
+    return data
+
+
+def cached_file(operation: str, inputs: Iterable[Union[bytes, str]], params: Optional[Dict[str, Any]],
+                output_path: str, compute: Callable[[], Any], store: Optional[Callable[[], bool]] = None) -> str:
+    """
+    Igual que cached() para funciones que escriben su resultado en output_path.
+    En un acierto se escribe el resultado guardado y compute() no se llama.
+    Las entradas se hashean y el resultado se copia por bloques: un resultado
+    grande no se carga entero en memoria. store() como en cached().
+    """
+    if not CACHE_ENABLED:
+        compute()
+        return output_path
+    key = _key_for(operation, inputs, params)
+    if result_cache.get_file(key, output_path):
+        logger.info("Cache hit %s (%s)", operation, key[:12])
+        return output_path
+    compute()
+    if store is None or store():
+        result_cache.put_file(key, output_path)
+    return output_path
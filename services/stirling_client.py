@@ -0,0 +1,121 @@
+import os
+import asyncio
+import threading
+from typing import BinaryIO, Dict, Optional, Union
+
+import httpx
+from fastapi import HTTPException
+
+# --- Configuración (variables de entorno) ---
+STIRLING_BASE_URL = os.getenv("STIRLING_BASE_URL", "http://192.168.2.33:30124")
+STIRLING_CONNECT_TIMEOUT = float(os.getenv("STIRLING_CONNECT_TIMEOUT", "10"))
+STIRLING_READ_TIMEOUT = float(os.getenv("STIRLING_READ_TIMEOUT", "300"))
+STIRLING_MAX_CONNECTIONS = int(os.getenv("STIRLING_MAX_CONNECTIONS", "10"))
+STIRLING_API_KEY = os.getenv("STIRLING_API_KEY", "")
+
+OCR_ENDPOINT = "/api/v1/misc/ocr-pdf"
+COMPRESS_ENDPOINT = "/api/v1/misc/compress-pdf"
+
+CHUNK_SIZE = 64 * 1024
+# Bytes del inicio/fin de la respuesta que se inspeccionan para validar el PDF
+PDF_CHECK_BYTES = 1024
+# Maximo que se lee de una respuesta de error para el mensaje
+ERROR_DETAIL_BYTES = 4096
+
+PDFPayload = Union[bytes, BinaryIO]
+
+
+def _client_options() -> dict:
+    return {
+        "base_url": STIRLING_BASE_URL,
+        "headers": {"X-API-KEY": STIRLING_API_KEY} if STIRLING_API_KEY else None,
+        "timeout": httpx.Timeout(
+            connect=STIRLING_CONNECT_TIMEOUT,
+            read=STIRLING_READ_TIMEOUT,
+            write=STIRLING_READ_TIMEOUT,
+            pool=STIRLING_CONNECT_TIMEOUT,
+        ),
+        "limits": httpx.Limits(
+            max_connections=STIRLING_MAX_CONNECTIONS,
+            max_keepalive_connections=STIRLING_MAX_CONNECTIONS,
+        ),
+    }
+
+
+# Un cliente por proceso: los workers del pool no deben heredar conexiones del padre
+_lock = threading.Lock()
+_client: Optional[httpx.Client] = None
+_client_pid: Optional[int] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_client() -> httpx.Client:
+    """Cliente sync compartido (keep-alive) hacia Stirling."""
+    global _client, _client_pid
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = httpx.Client(**_client_options())
+            _client_pid = os.getpid()
+        return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Cliente async compartido, ligado al event loop que lo usa por primera vez."""
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_loop is not loop or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(**_client_options())
+        _async_loop = loop
+    return _async_client
+
+
+def is_complete_pdf(data: bytes) -> bool:
+    """True si data empieza como PDF y tiene %%EOF al final."""
+    return data.startswith(b'%PDF') and b'%%EOF' in data[-PDF_CHECK_BYTES:]
+
+
+def _multipart(pdf: PDFPayload, fields: Dict[str, str]) -> dict:
+    # httpx envia un archivo abierto por bloques; bytes se envian sin copiarlos
+    return {
+        "data": fields,
+        "files": {"fileInput": ("input.pdf", pdf, "application/pdf")},
+    }
+
+
+def _error_response(status_code: int, body: bytes) -> HTTPException:
+    message = body[:ERROR_DETAIL_BYTES].decode("utf-8", errors="replace").strip()
+    return HTTPException(status_code=502, detail=f"Stirling respondio {status_code}: {message}")
+
+
+def post_pdf(endpoint: str, pdf: PDFPayload, fields: Dict[str, str], dest: BinaryIO) -> int:
+    """
+    Envia pdf a un endpoint de Stirling y copia la respuesta en dest por bloques.
+    Retorna el status HTTP. Una respuesta 4xx/5xx no se escribe en dest: se
+    levanta HTTPException 502 con el mensaje de Stirling. El contenido de
+    una respuesta exitosa queda en dest para que el llamador lo valide.
+    """
+    with get_client().stream("POST", endpoint, **_multipart(pdf, fields)) as response:
+        if response.is_error:
+            raise _error_response(response.status_code, response.read())
+        for chunk in response.iter_bytes(CHUNK_SIZE):
+            dest.write(chunk)
+        return response.status_code
+
+
+async def apost_pdf(endpoint: str, pdf: PDFPayload, fields: Dict[str, str], dest: BinaryIO) -> int:
+    """Version async de post_pdf."""
+    async with get_async_client().stream("POST", endpoint, **_multipart(pdf, fields)) as response:
+        if response.is_error:
+            raise _error_response(response.status_code, await response.aread())
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            dest.write(chunk)
+        return response.status_code
+
+
+async def aclose_async_client() -> None:
+    """Cierra el cliente async si pertenece al loop actual (p. ej. antes de que termine asyncio.run)."""
+    global _async_client, _async_loop
+    if _async_client is not None and _async_loop is asyncio.get_running_loop():
+        client, _async_client, _async_loop = _async_client, None, None
+        await client.aclose()
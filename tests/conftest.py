@@ -0,0 +1,28 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# Estado en disco (cache, historial, modelo de costo) fuera del arbol del repo;
+# se fija antes de importar services, que lee la configuracion al importarse
+_STATE_DIR = tempfile.mkdtemp(prefix="pdftools_tests_")
+os.environ.setdefault("PDFTOOLS_CACHE_DIR", os.path.join(_STATE_DIR, "result_cache"))
+os.environ.setdefault("PDFTOOLS_HISTORY_DB", os.path.join(_STATE_DIR, "compress_history.sqlite3"))
+os.environ.setdefault("PDFTOOLS_COST_MODEL_PATH", os.path.join(_STATE_DIR, "compress_cost.json"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import result_cache  # noqa: E402
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_STATE_DIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def empty_result_cache(tmp_path, monkeypatch):
+    """Cada test con su propia cache: un acierto de otro test no cuenta."""
+    cache = result_cache.ResultCache(str(tmp_path / "result_cache"))
+    monkeypatch.setattr(result_cache, "result_cache", cache)
+    return cache
@@ -0,0 +1,57 @@
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+from services import mergencompress
+
+
+def _dark_photo() -> fitz.Pixmap:
+    # Foto oscura y suave: su mediana es oscura y casi ningun pixel se aparta de ella
+    ramp = np.linspace(20, 70, 600, dtype=np.uint8)
+    gray = np.tile(ramp, (800, 1))
+    return fitz.Pixmap(fitz.csGRAY, 600, 800, gray.tobytes(), False)
+
+
+@pytest.fixture
+def pages_pdf(tmp_path):
+    doc = fitz.open()
+    doc.new_page()  # vacia
+    photo = doc.new_page()
+    photo.insert_image(photo.rect, pixmap=_dark_photo())
+    text = doc.new_page()
+    text.insert_textbox(fitz.Rect(72, 250, 520, 600), "Lorem ipsum dolor sit amet. " * 20, fontsize=10)
+    path = tmp_path / "pages.pdf"
+    doc.save(path)
+    doc.close()
+    return str(path)
+
+
+def test_fast_detector_keeps_dark_photo(pages_pdf):
+    with fitz.open(pages_pdf) as doc:
+        assert mergencompress.ink_coverage(doc[1]) is None
+        assert [mergencompress.is_blank_page_fast(page) for page in doc] == [True, False, False]
+
+
+def test_remove_blank_pages_keeps_dark_photo(pages_pdf, tmp_path):
+    output_path, removed = mergencompress.remove_blank_pages_file(pages_pdf, str(tmp_path / "out.pdf"))
+    assert removed == [1]
+    with fitz.open(output_path) as doc:
+        assert doc.page_count == 2
+        assert doc[0].get_images()
+
+
+def test_detector_version_invalidates_cached_merge(pages_pdf, tmp_path, monkeypatch):
+    calls = []
+
+    def rasterize(pdf_path, output_path):
+        calls.append(pdf_path)
+        with open(pdf_path, "rb") as src, open(output_path, "wb") as dst:
+            dst.write(src.read())
+        return output_path
+
+    monkeypatch.setattr(mergencompress, "rasterize_and_compress_pdf_file", rasterize)
+    for version in (1, 1, 2):
+        monkeypatch.setattr(mergencompress, "BLANK_DETECTOR_VERSION", version)
+        mergencompress.validate_merge_and_compress_pdf_files([pages_pdf], str(tmp_path))
+    # El segundo pedido sale de la cache; el cambio de version vuelve a calcular
+    assert len(calls) == 2
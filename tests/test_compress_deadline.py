@@ -0,0 +1,55 @@
+import time
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+from services.compress_fanout import DeadlineExceeded
+from services.compress_orchestrator import compress_pdf_report
+from services.local_compress import local_compress_pdf
+from services.mergencompress import rasterize_pdf_bytes
+
+# Margen sobre el presupuesto: un paso de PyMuPDF en curso no se puede interrumpir
+SLACK = 0.5
+
+
+@pytest.fixture(scope="module")
+def scan_pdf() -> bytes:
+    # Seis "escaneos" a 300 DPI: el motor local tarda bastante mas que el presupuesto
+    doc = fitz.open()
+    for seed in range(6):
+        rng = np.random.default_rng(seed)
+        ramp = np.linspace(90 + seed * 10, 230, 2550, dtype=np.float32)
+        gray = np.clip(ramp[None, :] + rng.normal(0, 4, (3300, 2550)), 0, 255).astype(np.uint8)
+        _, jpeg = cv2.imencode(".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        doc.new_page().insert_image(fitz.Rect(0, 0, 612, 792), stream=jpeg.tobytes())
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_engines_stop_at_deadline(scan_pdf):
+    with pytest.raises(DeadlineExceeded):
+        local_compress_pdf(scan_pdf, 100, 60, deadline=time.time())
+    with pytest.raises(DeadlineExceeded):
+        rasterize_pdf_bytes(scan_pdf, 0.5, skip_blank=False, deadline=time.time())
+
+
+def test_expired_deadline_skips_search(scan_pdf):
+    start = time.time()
+    data, report = compress_pdf_report(scan_pdf, engine="local", deadline=start - 1)
+    assert report["deadline_reached"]
+    assert data == scan_pdf
+    assert time.time() - start < SLACK
+
+
+def test_budget_bounds_each_request(scan_pdf):
+    # El candidato abandonado del primer pedido no debe frenar al segundo
+    budget = 0.5
+    for _ in range(2):
+        start = time.time()
+        data, report = compress_pdf_report(scan_pdf, engine="local", deadline=start + budget)
+        assert report["deadline_reached"]
+        assert report["abandoned"]
+        assert time.time() - start < budget + SLACK
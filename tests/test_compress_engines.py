@@ -0,0 +1,23 @@
+import pytest
+from fastapi import HTTPException
+
+from services import compress_engines, compress_orchestrator, ilove_client
+
+
+def test_ilove_requires_credentials(monkeypatch):
+    monkeypatch.setattr(ilove_client, "ILOVE_PUBLIC_ID", None)
+    monkeypatch.setattr(ilove_client, "ILOVE_SECRET_KEY", None)
+    with pytest.raises(ilove_client.ILoveNotConfiguredError):
+        ilove_client.compress_with_iloveapi(b"%PDF-1.4")
+    assert not compress_engines.ENGINES["ilove"].suitable(1024)
+    with pytest.raises(HTTPException) as error:
+        compress_orchestrator.resolve_engines("ilove")
+    assert error.value.status_code == 503
+
+
+def test_expected_output_size_rounds_down():
+    mb = 1024 * 1024
+    fields = compress_engines._compress_fields({'optimize_level': 3, 'target_ratio': 1.0}, int(2.7 * mb))
+    assert fields['expectedOutputSize'] == "2MB"
+    fields = compress_engines._compress_fields({'optimize_level': 3, 'target_ratio': 1.0}, int(0.9 * mb))
+    assert fields['expectedOutputSize'] == "921KB"
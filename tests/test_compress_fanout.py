@@ -0,0 +1,53 @@
+from services.compress_fanout import FAILED, LOW_QUALITY, PASSED, TOO_BIG, search_levels
+
+
+def _chain(levels):
+    return [{"engine": "fake", "level": level} for level in levels]
+
+
+def _verdict(candidate, data, result):
+    if data is None or result is None:
+        return FAILED
+    if result["size_ratio"] >= 1:
+        return TOO_BIG
+    return PASSED if result["quality"] >= 0.98 else LOW_QUALITY
+
+
+def _search(chain, outcomes):
+    # outcomes[level] = (size_ratio, quality), o None si el pedido falla
+    requested = []
+
+    async def fetch(candidate):
+        requested.append(candidate["level"])
+        if outcomes[candidate["level"]] is None:
+            raise RuntimeError("fallo del motor")
+        return b"%PDF"
+
+    def evaluate(candidate, data):
+        size_ratio, quality = outcomes[candidate["level"]]
+        return {"candidate": candidate, "size_ratio": size_ratio, "quality": quality}
+
+    def goal(result):
+        return result["size_ratio"] <= 0.7 and result["quality"] >= 0.98
+
+    found, dropped, _ = search_levels([chain], fetch, evaluate, _verdict, goal, max_parallel=1)
+    return found, dropped, requested
+
+
+def test_levels_that_do_not_shrink_move_search_forward():
+    # Los niveles 1 y 3 no achican el PDF; el 5 lo deja a la mitad con buena calidad
+    found, dropped, requested = _search(_chain([1, 3, 5]), {1: (1.1, 1.0), 3: (1.0, 0.999), 5: (0.5, 0.99)})
+    assert requested == [3, 5]
+    assert [r["candidate"]["level"] for r in found if _verdict(None, b"", r) == PASSED] == [5]
+    assert not dropped
+
+
+def test_failed_level_is_skipped_not_treated_as_low_quality():
+    found, _, requested = _search(_chain([1, 3, 5]), {1: (0.9, 0.999), 3: None, 5: (0.5, 0.99)})
+    assert 5 in requested
+    assert [r["candidate"]["level"] for r in found if _verdict(None, b"", r) == PASSED][-1] == 5
+
+
+def test_low_quality_rules_out_more_aggressive_levels():
+    _, _, requested = _search(_chain([1, 3, 5]), {1: (0.9, 0.999), 3: (0.6, 0.9), 5: (0.5, 0.8)})
+    assert requested == [3, 1]
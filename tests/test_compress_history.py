@@ -0,0 +1,91 @@
+from contextlib import closing
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+from services import compress_history, compress_orchestrator
+from services.compress_engines import ENGINES
+from services.compress_history import CompressionHistory, config_key, document_features
+from services.pdf_analyzer import analyze_pdf
+
+
+@pytest.fixture(scope="module")
+def scan_pdf() -> bytes:
+    rng = np.random.default_rng(0)
+    ramp = np.linspace(90, 230, 1700, dtype=np.float32)
+    gray = np.clip(ramp[None, :] + rng.normal(0, 4, (2200, 1700)), 0, 255).astype(np.uint8)
+    _, jpeg = cv2.imencode(".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    doc = fitz.open()
+    doc.new_page().insert_image(fitz.Rect(0, 0, 612, 792), stream=jpeg.tobytes())
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def history(tmp_path, monkeypatch):
+    history = CompressionHistory(str(tmp_path / "history.sqlite3"))
+    monkeypatch.setattr(compress_orchestrator, "compression_history", history)
+    monkeypatch.setattr(compress_history, "PREDICT_EXPLORE_EVERY", 0)
+    return history
+
+
+def _features(size=1_000_000, pages=10, image_ratio=0.9, dpi=300.0, scanned_ratio=1.0):
+    return {"size": size, "pages": pages, "image_ratio": image_ratio, "dpi": dpi, "scanned_ratio": scanned_ratio}
+
+
+def _outcome(candidate, won, score=0.5):
+    return {"candidate": candidate, "result_size": 1000, "ssim": 0.99, "score": score, "latency": 1.0, "won": won}
+
+
+def test_record_then_predict_nearest_winner(history):
+    chain = ENGINES["local"].candidates()
+    assert history.predict(_features(), "local", chain) == (None, 0.0)
+
+    history.record(_features(), "scan", [_outcome(chain[0], False, 0.2), _outcome(chain[1], True, 0.6)])
+    # Un documento muy distinto no es vecino
+    history.record(_features(size=5_000, pages=1, image_ratio=0.0, dpi=0.0, scanned_ratio=0.0), "text",
+                   [_outcome(chain[0], True)])
+    index, share = history.predict(_features(size=1_100_000), "local", chain)
+    assert (index, share) == (1, 1.0)
+    # Otro motor no tiene historial
+    assert history.predict(_features(), "rasterize", ENGINES["rasterize"].candidates()) == (None, 0.0)
+
+
+@pytest.mark.parametrize("path", ["blocked/history.sqlite3", "."])
+def test_unavailable_history_predicts_nothing(tmp_path, path):
+    # Un archivo donde va el directorio, o un directorio donde va la base
+    (tmp_path / "blocked").write_text("")
+    history = CompressionHistory(str(tmp_path / path))
+    chain = ENGINES["local"].candidates()
+    history.record(_features(), "scan", [_outcome(chain[0], True)])
+    assert history.predict(_features(), "local", chain) == (None, 0.0)
+    assert not history.explore_now()
+
+
+def test_failed_prediction_falls_back_to_earlier_levels(scan_pdf, history, monkeypatch):
+    chain = ENGINES["local"].candidates()
+    features = document_features(analyze_pdf(scan_pdf))
+    # En documentos como este gano el nivel mas agresivo, con todos los votos
+    history.record(features, "scan", [_outcome(chain[-1], True)])
+
+    requested = []
+    compress = ENGINES["local"].compress
+
+    def spy(pdf_bytes, candidate, deadline=None):
+        requested.append(config_key(candidate))
+        return compress(pdf_bytes, candidate, deadline)
+
+    monkeypatch.setattr(ENGINES["local"], "compress", spy)
+    # Una calidad que el nivel predicho no alcanza
+    outcome = compress_orchestrator.compress_search(scan_pdf, ["local"], goal_quality=0.9999)
+    assert requested == [config_key(chain[-1])] + [config_key(c) for c in chain[:-1]]
+    assert outcome['best']['predicted'] == {'index': len(chain) - 1, 'share': 1.0, 'only': True}
+
+    # El documento y sus candidatos quedaron en el historial
+    assert history.predict(features, "local", chain)[0] is not None
+    with closing(history._connect()) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM documents").fetchone() == (2,)
+        assert conn.execute("SELECT COUNT(*) FROM outcomes").fetchone() == (1 + len(chain),)
@@ -0,0 +1,46 @@
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+from services.compress_orchestrator import compress_pdf_report
+from services.compress_target import compress_to_size
+
+
+@pytest.fixture(scope="module")
+def scan_pdf() -> bytes:
+    # Dos "escaneos" a 200 DPI: el motor local los achica mucho bajando DPI y calidad
+    doc = fitz.open()
+    for seed in range(2):
+        rng = np.random.default_rng(seed)
+        ramp = np.linspace(90 + seed * 20, 230, 1700, dtype=np.float32)
+        gray = np.clip(ramp[None, :] + rng.normal(0, 4, (2200, 1700)), 0, 255).astype(np.uint8)
+        _, jpeg = cv2.imencode(".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, 95])
+        doc.new_page().insert_image(fitz.Rect(0, 0, 612, 792), stream=jpeg.tobytes())
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_target_met(scan_pdf):
+    max_bytes = len(scan_pdf) // 4
+    outcome = compress_to_size(scan_pdf, max_bytes, ["local"])
+    assert outcome['met']
+    assert outcome['engine'] == "local"
+    assert outcome['size'] == len(outcome['pdf']) <= max_bytes
+
+    data, report = compress_pdf_report(scan_pdf, engine="local", max_bytes=max_bytes)
+    assert report['met']
+    assert report['size'] == len(data) <= max_bytes
+
+
+def test_target_not_met_returns_smallest(scan_pdf):
+    max_bytes = 1024
+    outcome = compress_to_size(scan_pdf, max_bytes, ["local"])
+    assert not outcome['met']
+    # El resultado mas chico que se consiguio, aunque no entre
+    assert max_bytes < outcome['size'] == len(outcome['pdf']) < len(scan_pdf)
+
+    data, report = compress_pdf_report(scan_pdf, engine="local", max_bytes=max_bytes)
+    assert not report['met']
+    assert report['size'] == len(data) > max_bytes
@@ -0,0 +1,137 @@
+import fitz  # PyMuPDF
+import pytest
+
+from services import mergencompress
+
+
+@pytest.fixture
+def input_pdfs(tmp_path):
+    # Cada pagina con un ancho distinto: el orden se verifica despues del rasterizado
+    paths = []
+    width = 300
+    for n, pages in enumerate((3, 4)):
+        doc = fitz.open()
+        for _ in range(pages):
+            page = doc.new_page(width=width, height=400)
+            page.insert_textbox(fitz.Rect(20, 120, width - 20, 300), f"Pagina de {width} puntos. " * 10, fontsize=9)
+            width += 10
+        path = tmp_path / f"input{n}.pdf"
+        doc.save(path)
+        doc.close()
+        paths.append(str(path))
+    return paths
+
+
+def test_windowed_merge_compress_keeps_page_order(input_pdfs, tmp_path, monkeypatch):
+    backends = []
+    merge = mergencompress.merge_pdf_sources
+
+    def spy(sources, output, backend=None):
+        backends.append(backend)
+        return merge(sources, output, backend)
+
+    monkeypatch.setattr(mergencompress, "merge_pdf_sources", spy)
+    monkeypatch.setattr(mergencompress, "RASTER_WINDOW", 2)
+    monkeypatch.setattr(mergencompress, "RASTER_MODE", "all")
+    output_path = mergencompress.validate_merge_and_compress_pdf_files(input_pdfs, str(tmp_path),
+                                                                       str(tmp_path / "out.pdf"))
+    # Con ventanas el merge intermedio es con qpdf, que no carga las entradas en memoria
+    assert backends == ["pikepdf"]
+    with fitz.open(output_path) as doc:
+        assert [int(page.rect.width) for page in doc] == list(range(300, 370, 10))
+        assert all(page.get_images() for page in doc)
+
+
+def test_window_parts_share_repeated_resources(tmp_path, monkeypatch):
+    # Un logo en cada pagina de texto: las paginas se copian y cada ventana trae su copia
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 200, 200), False)
+    pixmap.set_rect(pixmap.irect, (200, 40, 40))
+    doc = fitz.open()
+    for n in range(6):
+        page = doc.new_page()
+        page.insert_image(fitz.Rect(40, 40, 140, 140), pixmap=pixmap)
+        page.insert_textbox(fitz.Rect(60, 200, 540, 700), f"Pagina {n}. " * 80, fontsize=9)
+    source = str(tmp_path / "logo.pdf")
+    doc.save(source, garbage=4)
+    doc.close()
+
+    monkeypatch.setattr(mergencompress, "RASTER_WINDOW", 2)
+    output_path = mergencompress.rasterize_pdf_file(source, str(tmp_path / "out.pdf"), selective=True)
+    with fitz.open(output_path) as out:
+        assert [page.get_text().split()[1] for page in out] == [f"{n}." for n in range(6)]
+        assert len({image[0] for page in out for image in page.get_images()}) == 1
+
+
+def _background_pixmap():
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 300, 400), False)
+    pixmap.set_rect(pixmap.irect, (235, 225, 200))
+    return pixmap
+
+
+def test_text_over_background_image_is_not_rasterized(tmp_path):
+    # PDF nativo con una imagen de fondo a pagina completa: el texto debe sobrevivir
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(page.rect, pixmap=_background_pixmap(), keep_proportion=False)
+    page.insert_textbox(fitz.Rect(60, 80, 540, 700), "Texto nativo sobre un fondo. " * 40, fontsize=10)
+    source = str(tmp_path / "fondo.pdf")
+    doc.save(source)
+    doc.close()
+
+    with fitz.open(source) as doc:
+        composition = mergencompress.page_composition(doc[0])
+    assert composition['image_coverage'] == 1.0
+    assert not mergencompress.is_scan_like(composition)
+
+    output_path = mergencompress.rasterize_pdf_file(source, str(tmp_path / "out.pdf"), selective=True)
+    with fitz.open(output_path) as out:
+        assert "Texto nativo sobre un fondo." in out[0].get_text()
+
+
+def test_invisible_ocr_layer_keeps_page_scan_like():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(page.rect, pixmap=_background_pixmap(), keep_proportion=False)
+    page.insert_textbox(fitz.Rect(60, 80, 540, 700), "Capa OCR. " * 40, fontsize=10, render_mode=3)
+    composition = mergencompress.page_composition(page)
+    assert composition['text_chars'] == 0
+    assert mergencompress.is_scan_like(composition)
+    doc.close()
+
+
+def test_default_raster_workers_parallelizes_on_multicore():
+    assert mergencompress._default_raster_workers(8, 8) == 2
+    assert mergencompress._default_raster_workers(16, 4) == 4
+    assert mergencompress._default_raster_workers(1, 1) == 1
+    assert mergencompress._default_raster_workers(None, 4) == 1
+
+
+def test_two_raster_workers_keep_page_order(monkeypatch):
+    doc = fitz.open()
+    for n in range(6):
+        page = doc.new_page(width=300 + 10 * n, height=400)
+        page.insert_textbox(fitz.Rect(20, 120, 260, 300), f"Pagina {n}. " * 10, fontsize=9)
+    pdf_data = doc.tobytes()
+    doc.close()
+
+    parallel = []
+    rasterize_parallel = mergencompress._rasterize_parallel
+
+    def spy(*args, **kwargs):
+        parallel.append(1)
+        return rasterize_parallel(*args, **kwargs)
+
+    monkeypatch.setattr(mergencompress, "_rasterize_parallel", spy)
+    monkeypatch.setattr(mergencompress, "RASTER_WORKERS", 2)
+    monkeypatch.setattr(mergencompress, "RASTER_PARALLEL_MIN_PAGES", 4)
+    monkeypatch.setattr(mergencompress, "_raster_pool", None)
+    try:
+        output = mergencompress.rasterize_pdf_bytes(pdf_data, skip_blank=False, selective=False)
+        assert mergencompress._raster_pool._max_workers == 2
+    finally:
+        if mergencompress._raster_pool is not None:
+            mergencompress._raster_pool.shutdown()
+    assert parallel == [1]
+    with fitz.open(stream=output, filetype="pdf") as out:
+        assert [int(page.rect.width) for page in out] == list(range(300, 360, 10))
+        assert all(page.get_images() for page in out)
@@ -0,0 +1,78 @@
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+from services.compress_orchestrator import compress_pdf_report
+from services.pdf_analyzer import analyze_pdf
+
+
+def _scan_jpeg(seed: int, width: int = 2550, height: int = 3300) -> bytes:
+    # "Escaneo" a 300 DPI en carta: gradiente suave con algo de ruido
+    rng = np.random.default_rng(seed)
+    ramp = np.linspace(90 + seed * 20, 230, width, dtype=np.float32)
+    gray = np.clip(ramp[None, :] + rng.normal(0, 4, (height, width)), 0, 255).astype(np.uint8)
+    _, jpeg = cv2.imencode(".jpg", gray, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    return jpeg.tobytes()
+
+
+def indirect_length_pdf(jpegs) -> bytes:
+    """PDF escrito a mano cuyas imagenes declaran /Length como referencia indirecta."""
+    objects = {}
+    kids = []
+    number = 3
+    for jpeg in jpegs:
+        page, image, length, content = number, number + 1, number + 2, number + 3
+        number += 4
+        kids.append(page)
+        draw = b"q 612 0 0 792 0 0 cm /Im0 Do Q"
+        objects[page] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                         b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>" % (image, content))
+        objects[image] = (b"<< /Type /XObject /Subtype /Image /Width 2550 /Height 3300 /ColorSpace /DeviceGray "
+                          b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d 0 R >>\nstream\n" % length
+                          + jpeg + b"\nendstream")
+        objects[length] = b"%d" % len(jpeg)
+        objects[content] = b"<< /Length %d >>\nstream\n" % len(draw) + draw + b"\nendstream"
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for num in sorted(objects):
+        offsets[num] = len(out)
+        out += b"%d 0 obj\n" % num + objects[num] + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % number
+    out += b"".join(b"%010d 00000 n \n" % offsets[num] for num in range(1, number))
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (number, xref)
+    return bytes(out)
+
+
+@pytest.fixture(scope="module")
+def scans():
+    return [_scan_jpeg(seed) for seed in range(3)]
+
+
+def test_indirect_length_counts_real_stream_bytes(scans):
+    analysis = analyze_pdf(indirect_length_pdf(scans))
+    assert [img["bytes"] for img in analysis["images"]] == [len(jpeg) for jpeg in scans]
+    assert analysis["recompressible_bytes"] >= sum(len(jpeg) for jpeg in scans)
+    assert analysis["bytes_by_type"]["image"] == sum(len(jpeg) for jpeg in scans)
+    assert not analysis["optimized"]
+
+
+def test_indirect_length_is_still_compressed(scans):
+    pdf = indirect_length_pdf(scans[:1])
+    compressed, report = compress_pdf_report(pdf, engine="local")
+    assert report["engine"] == "local"
+    assert len(compressed) < len(pdf) / 2
+
+
+def test_shared_and_same_size_images_counted_per_xref(scans):
+    doc = fitz.open()
+    shared = doc.new_page().insert_image(fitz.Rect(0, 0, 612, 792), stream=scans[0])
+    doc.new_page().insert_image(fitz.Rect(0, 0, 612, 792), xref=shared)
+    doc.new_page().insert_image(fitz.Rect(0, 0, 612, 792), stream=scans[1])
+    analysis = analyze_pdf(doc.tobytes())
+    assert [len(page["images"]) for page in analysis["pages"]] == [1, 1, 1]
+    assert sorted(img["bytes"] for img in analysis["images"]) == sorted([len(scans[0]), len(scans[1])])
+    assert analysis["pages"][2]["images"][0]["bytes"] == len(scans[1])
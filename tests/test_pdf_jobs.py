@@ -0,0 +1,38 @@
+from concurrent.futures import Future
+
+from services.pdf_jobs import PDFJobManager
+
+
+class InlineExecutor:
+    """Executor que corre la tarea en el momento, para probar el ciclo de un trabajo."""
+
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, tool, fn, *args, **kwargs):
+        self.calls.append((tool, args, kwargs))
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def _write(pdf_path, output_path, engine=None, deadline=None, max_bytes=None):
+    with open(output_path, "wb") as f:
+        f.write(b"%PDF-1.4 " + str((engine, deadline, max_bytes)).encode())
+    return output_path
+
+
+def test_job_options_reach_the_tool(tmp_path):
+    executor = InlineExecutor()
+    manager = PDFJobManager(executor, base_tmp=str(tmp_path), ttl=0)
+    job = manager.create_job("compress")
+    manager.start(job["id"], _write, "input.pdf", engine="local", deadline=None, max_bytes=2048)
+    assert manager.status(job["id"])["status"] == "completed"
+    with open(manager.result_path(job["id"]), "rb") as f:
+        assert f.read() == b"%PDF-1.4 ('local', None, 2048)"
+    assert executor.calls[0][2] == {"engine": "local", "deadline": None, "max_bytes": 2048}
+    manager.delete(job["id"])
+    assert not (tmp_path / job["id"]).exists()
@@ -0,0 +1,27 @@
+import fitz  # PyMuPDF
+
+from services.compress_fanout import COMPRESS_GOAL_QUALITY
+from services.mergencompress import rasterize_pdf_bytes
+from services.pdf_quality import ReferenceRender
+
+
+def _text_pdf() -> bytes:
+    doc = fitz.open()
+    for n in range(2):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(72, 100, 520, 700), f"Pagina {n}. Lorem ipsum dolor sit amet. " * 40, fontsize=9)
+    return doc.tobytes(garbage=3, deflate=True)
+
+
+def test_identical_pdf_scores_one():
+    pdf = _text_pdf()
+    score = ReferenceRender(pdf).score(pdf)
+    assert score["min"] > 0.999
+
+
+def test_low_resolution_raster_misses_goal():
+    # A 72 DPI una pagina rasterizada a 72 DPI puntuaba ~1; a la resolucion de
+    # referencia el texto borroso tiene que quedar por debajo del objetivo
+    pdf = _text_pdf()
+    raster = rasterize_pdf_bytes(pdf, 1.0, skip_blank=False, codec="jpeg", selective=False)
+    assert ReferenceRender(pdf).score(raster)["min"] < COMPRESS_GOAL_QUALITY
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import tempfile
+
+import fitz  # PyMuPDF
+import pytest
+from fastapi.testclient import TestClient
+
+
+class ThreadRunner:
+    """Reemplazo de pdf_executor que corre la herramienta en un hilo, sin pool de procesos."""
+
+    async def run(self, tool, fn, *args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+@pytest.fixture
+def app_client(tmp_path, monkeypatch):
+    # Importar la app crea sus directorios de trabajo relativos: que queden en tmp_path
+    monkeypatch.chdir(tmp_path)
+    import pdftools_app
+
+    work_dirs = []
+    mkdtemp = tempfile.mkdtemp
+
+    def tracked_mkdtemp(*args, **kwargs):
+        kwargs.setdefault("dir", str(tmp_path))
+        work_dirs.append(mkdtemp(*args, **kwargs))
+        return work_dirs[-1]
+
+    monkeypatch.setattr(pdftools_app, "pdf_executor", ThreadRunner())
+    monkeypatch.setattr(pdftools_app.tempfile, "mkdtemp", tracked_mkdtemp)
+    return TestClient(pdftools_app.app), work_dirs
+
+
+def _pdf(pages: int = 1) -> bytes:
+    doc = fitz.open()
+    for n in range(pages):
+        doc.new_page().insert_textbox(fitz.Rect(50, 50, 550, 750), f"Pagina {n}. " * 200, fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _upload(name: str, data: bytes):
+    return (name, data, "application/pdf")
+
+
+def test_merge_file_upload(app_client):
+    client, work_dirs = app_client
+    response = client.post("/mergepdf/file", files=[("files", _upload("a.pdf", _pdf(2))),
+                                                     ("files", _upload("b.pdf", _pdf(1)))])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    with fitz.open(stream=response.content, filetype="pdf") as doc:
+        assert doc.page_count == 3
+    # El directorio de trabajo se borra una vez enviada la respuesta
+    assert len(work_dirs) == 1 and not os.path.exists(work_dirs[0])
+
+
+def test_compress_file_upload(app_client):
+    client, work_dirs = app_client
+    response = client.post("/compresspdf/file", files={"file": _upload("a.pdf", _pdf())}, data={"engine": "local"})
+    assert response.status_code == 200
+    assert response.headers["x-compress-deadline-reached"] == "false"
+    with fitz.open(stream=response.content, filetype="pdf") as doc:
+        assert doc.page_count == 1
+    assert len(work_dirs) == 1 and not os.path.exists(work_dirs[0])
+
+
+@pytest.mark.parametrize("endpoint", ["/compresspdf/file", "/remove-blank-pages/file", "/analyze/file"])
+def test_invalid_pdf_upload_is_rejected(app_client, endpoint):
+    client, work_dirs = app_client
+    response = client.post(endpoint, files={"file": _upload("a.pdf", b"esto no es un PDF")})
+    assert response.status_code == 400
+    assert len(work_dirs) == 1 and not os.path.exists(work_dirs[0])
+
+
+def test_invalid_pdf_in_merge_upload_is_rejected(app_client):
+    client, work_dirs = app_client
+    response = client.post("/mergepdf/file", files=[("files", _upload("a.pdf", _pdf())),
+                                                     ("files", _upload("b.pdf", b"esto no es un PDF"))])
+    assert response.status_code == 400
+    assert response.json()["detail"] == "El archivo 2 no es un PDF valido."
+    assert len(work_dirs) == 1 and not os.path.exists(work_dirs[0])
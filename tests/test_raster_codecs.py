@@ -0,0 +1,101 @@
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+from services import raster_codecs
+from services.raster_codecs import encode_raster, grayscale, insert_encoded, pixmap_array
+
+SCALE = 2.0
+
+
+def _text_page(doc: fitz.Document, with_photo: bool = False) -> fitz.Page:
+    page = doc.new_page(width=300, height=400)
+    if with_photo:
+        # Degradado en color: la parte "foto" de la pagina
+        ramp = np.linspace(40, 220, 200, dtype=np.uint8)
+        photo = np.dstack([np.tile(ramp, (120, 1)), np.tile(ramp[::-1], (120, 1)), np.full((120, 200), 128, np.uint8)])
+        page.insert_image(fitz.Rect(50, 260, 250, 380), pixmap=fitz.Pixmap(fitz.csRGB, 200, 120, photo.tobytes(), False))
+    page.insert_textbox(fitz.Rect(20, 20, 280, 250), "Prueba de codec. " * 12, fontsize=14)
+    return page
+
+
+def _gray(page: fitz.Page) -> np.ndarray:
+    pix = page.get_pixmap(matrix=fitz.Matrix(SCALE, SCALE), colorspace=fitz.csGRAY)
+    return grayscale(pixmap_array(pix)).astype(np.int16)
+
+
+def _round_trip(codec: str, with_photo: bool = False):
+    """Codifica el render de una pagina, lo inserta en otra y retorna (original, resultado, encoded)."""
+    with fitz.open() as doc, fitz.open() as out:
+        page = _text_page(doc, with_photo)
+        colorspace = fitz.csRGB if with_photo else fitz.csGRAY
+        encoded = encode_raster(page.get_pixmap(matrix=fitz.Matrix(SCALE, SCALE), colorspace=colorspace), codec)
+        new_page = out.new_page(width=page.rect.width, height=page.rect.height)
+        insert_encoded(new_page, new_page.rect, encoded)
+        out = fitz.open(stream=out.tobytes(), filetype="pdf")
+        return _gray(page), _gray(out[0]), encoded
+
+
+@pytest.mark.parametrize("codec", ["jpeg", "jpx", "flate"])
+def test_continuous_tone_codecs_round_trip(codec):
+    original, result, encoded = _round_trip(codec, with_photo=True)
+    assert encoded['codec'] == codec
+    assert np.abs(original - result).mean() < 6
+
+
+def test_flate_round_trip_is_lossless():
+    original, result, _ = _round_trip("flate")
+    assert np.abs(original - result).max() <= 1
+
+
+def test_g4_keeps_polarity():
+    original, result, encoded = _round_trip("g4")
+    assert encoded['codec'] == "g4"
+    # Tinta negra sobre blanco: invertir BlackIs1 daria una pagina casi toda negra
+    assert (result < 128).mean() < 0.2
+    assert ((original < 128) != (result < 128)).mean() < 0.005
+
+
+@pytest.mark.skipif(not raster_codecs.JBIG2_COMMAND, reason="jbig2enc no esta instalado")
+def test_jbig2_round_trip():
+    original, result, encoded = _round_trip("jbig2")
+    assert encoded['codec'] == "jbig2"
+    assert ((original < 128) != (result < 128)).mean() < 0.005
+
+
+@pytest.mark.parametrize("command", [None, "false"])
+def test_jbig2_falls_back_to_g4(monkeypatch, command):
+    # Sin jbig2enc, o si falla, la pagina bilevel va en CCITT G4
+    monkeypatch.setattr(raster_codecs, "JBIG2_COMMAND", command)
+    original, result, encoded = _round_trip("jbig2")
+    assert encoded['codec'] == "g4"
+    assert ((original < 128) != (result < 128)).mean() < 0.005
+
+
+def test_mrc_paints_text_color_over_background():
+    ink, paper = (0.1, 0.2, 0.7), (0.95, 0.9, 0.75)
+    with fitz.open() as doc, fitz.open() as out:
+        page = doc.new_page(width=300, height=400)
+        page.draw_rect(page.rect, color=None, fill=paper)
+        page.insert_textbox(fitz.Rect(20, 20, 280, 380), "Texto en color. " * 30, fontsize=12, color=ink)
+        matrix = fitz.Matrix(raster_codecs.MRC_RENDER_SCALE, raster_codecs.MRC_RENDER_SCALE)
+        encoded = encode_raster(page.get_pixmap(matrix=matrix), "mrc")
+        assert [layer['codec'] for layer in encoded['layers']] == ["jpeg", "g4"]
+        assert np.allclose(encoded['color'], ink, atol=0.1)
+
+        new_page = out.new_page(width=300, height=400)
+        insert_encoded(new_page, new_page.rect, encoded)
+        out = fitz.open(stream=out.tobytes(), filetype="pdf")
+        # Fondo JPEG y mascara de imagen, en ese orden
+        images = out[0].get_images(full=True)
+        assert len(images) == 2
+        assert out.xref_get_key(images[1][0], "ImageMask") == ("bool", "true")
+
+        original = pixmap_array(page.get_pixmap(matrix=fitz.Matrix(SCALE, SCALE))).astype(np.int16)
+        result = pixmap_array(out[0].get_pixmap(matrix=fitz.Matrix(SCALE, SCALE))).astype(np.int16)
+    text = grayscale(original.astype(np.uint8)) < 128
+    expected_ink, expected_paper = np.array(ink) * 255, np.array(paper) * 255
+    # El texto sale con su color y el papel del fondo sin manchas de texto
+    assert np.abs(np.median(result[text], axis=0) - expected_ink).max() < 30
+    assert np.abs(np.median(result[~text], axis=0) - expected_paper).max() < 15
+    assert (grayscale(result.astype(np.uint8)) < 128).mean() < text.mean() * 1.5
@@ -0,0 +1,63 @@
+import os
+
+from services import result_cache
+
+
+def test_cached_file_streams_through_disk_tier(empty_result_cache, tmp_path):
+    data = os.urandom(3 * result_cache.HASH_CHUNK_SIZE + 17)
+    source = tmp_path / "input.pdf"
+    source.write_bytes(b"%PDF-1.4 entrada")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        (tmp_path / "out.pdf").write_bytes(data)
+
+    result_cache.cached_file("op", [str(source)], {"a": 1}, str(tmp_path / "out.pdf"), compute)
+    output_path = result_cache.cached_file("op", [str(source)], {"a": 1}, str(tmp_path / "again.pdf"), compute)
+    assert calls == [1]
+    assert open(output_path, "rb").read() == data
+    # El resultado fue al disco sin pasar por el nivel memoria
+    assert not empty_result_cache._memory
+    assert empty_result_cache.hits == 1
+
+
+def test_put_file_respects_disk_budget(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path / "cache"), memory_bytes=0, disk_bytes=1024)
+    small, large = tmp_path / "small", tmp_path / "large"
+    small.write_bytes(b"x" * 600)
+    large.write_bytes(b"y" * 2048)
+    cache.put_file("a" * 64, str(small))
+    cache.put_file("b" * 64, str(large))
+    assert cache.get_file("a" * 64, str(tmp_path / "a.out"))
+    assert not cache.get_file("b" * 64, str(tmp_path / "b.out"))
+    assert not (tmp_path / "b.out").exists()
+    # Un segundo resultado que pasa el limite desaloja al menos usado
+    cache.put_file("c" * 64, str(small))
+    assert len(cache._disk_entries()) == 1
+
+
+def test_overwrite_does_not_double_count_disk_usage(tmp_path):
+    cache = result_cache.ResultCache(str(tmp_path / "cache"), memory_bytes=0, disk_bytes=1024)
+    cache.put("a" * 64, b"x" * 100)  # la primera escritura mide el directorio
+    for _ in range(20):
+        cache.put("b" * 64, b"y" * 400)
+    assert cache._disk_used == 500
+    # Reescribir la misma clave no cuenta como espacio nuevo: nada se desaloja
+    assert cache.get("a" * 64) == b"x" * 100
+
+
+def test_cached_file_skips_partial_results(empty_result_cache, tmp_path):
+    source = tmp_path / "input.pdf"
+    source.write_bytes(b"%PDF-1.4 entrada")
+    output = tmp_path / "out.pdf"
+    calls = []
+
+    def compute():
+        calls.append(1)
+        output.write_bytes(b"%PDF-1.4 parcial")
+
+    for _ in range(2):
+        result_cache.cached_file("op", [str(source)], None, str(output), compute, store=lambda: False)
+    assert calls == [1, 1]
+    assert not empty_result_cache._disk_entries()
@@ -0,0 +1,72 @@
+import asyncio
+from io import BytesIO
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from services import stirling_client
+from services.ocrtext import _ocr_pdf_file
+
+PDF = b"%PDF-1.4\n1 0 obj\n<<>>\nendobj\ntrailer\n<<>>\n%%EOF\n"
+
+
+def _handler(status_code: int, content: bytes):
+    def handle(request: httpx.Request) -> httpx.Response:
+        assert request.url.path == stirling_client.OCR_ENDPOINT
+        return httpx.Response(status_code, content=content)
+    return handle
+
+
+@pytest.fixture
+def stirling(monkeypatch):
+    """Instala un transporte simulado en los clientes de Stirling."""
+    def install(status_code: int, content: bytes) -> None:
+        handler = _handler(status_code, content)
+        monkeypatch.setattr(stirling_client, "_client", httpx.Client(
+            base_url="http://stirling", transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(stirling_client, "_client_pid", stirling_client.os.getpid())
+        monkeypatch.setattr(stirling_client, "_client_options", lambda: {
+            "base_url": "http://stirling", "transport": httpx.MockTransport(handler)})
+    return install
+
+
+def test_post_pdf_streams_successful_response(stirling):
+    stirling(200, PDF)
+    out = BytesIO()
+    assert stirling_client.post_pdf(stirling_client.OCR_ENDPOINT, b"%PDF-1.4", {}, out) == 200
+    assert out.getvalue() == PDF
+
+
+@pytest.mark.parametrize("status_code", [400, 500])
+def test_post_pdf_error_is_not_written_as_pdf(stirling, status_code):
+    stirling(status_code, b"Error procesando el archivo")
+    out = BytesIO()
+    with pytest.raises(HTTPException) as error:
+        stirling_client.post_pdf(stirling_client.OCR_ENDPOINT, b"%PDF-1.4", {}, out)
+    assert error.value.status_code == 502
+    assert f"Stirling respondio {status_code}: Error procesando el archivo" == error.value.detail
+    assert out.getvalue() == b""
+
+
+def test_apost_pdf_error_raises(stirling):
+    stirling(503, b"Servicio no disponible")
+
+    async def post():
+        out = BytesIO()
+        try:
+            return await stirling_client.apost_pdf(stirling_client.OCR_ENDPOINT, b"%PDF-1.4", {}, out)
+        finally:
+            await stirling_client.aclose_async_client()
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(post())
+    assert "503" in error.value.detail
+
+
+def test_ocr_error_response_keeps_service_message(stirling, tmp_path):
+    stirling(400, b"The document already has OCR text")
+    source = tmp_path / "input.pdf"
+    source.write_bytes(b"%PDF-1.4")
+    with pytest.raises(Exception, match="PDF already contains OCR text"):
+        _ocr_pdf_file(str(source), str(tmp_path / "ocr.pdf"))